@@ -0,0 +1,19 @@
+"""
+性能基准套件（在 Appointment 目录下运行）：
+
+    python -m benchmarks --rows 100000 --out results/v1.json
+    python -m benchmarks --rows 100000 --compare results/v1.json
+
+导入本包时把 APPDATA 指向一个新的临时目录，并把 src 加进 sys.path，
+所以基准只会在临时库上跑，不会碰真实的 termins.db
+bench_conn.py / bench_schedule.py 是单独的小脚本，直接用 python 运行
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+os.environ["APPDATA"] = tempfile.mkdtemp(prefix="termin_bench_")
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
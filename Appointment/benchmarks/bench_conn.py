@@ -0,0 +1,68 @@
+"""
+连接复用前后的单次调用延迟对比
+
+用法（在 Appointment 目录下）：
+    python benchmarks/bench_conn.py [行数] [调用次数]
+
+会在临时目录中建库，不会碰真实的 termins.db
+"""
+import os
+import sys
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+os.environ["APPDATA"] = tempfile.mkdtemp(prefix="termin_bench_")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import db  # noqa: E402
+from termin import add_termin, get_termins, clear_cache  # noqa: E402
+
+
+def _old_get_conn():
+    # 旧实现：每次调用都新开连接，无任何 PRAGMA
+    conn = sqlite3.connect(db.DB_FILE)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _time_calls(n, fn):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    calls = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    for i in range(rows):
+        add_termin(f"Patient {i}", f"{1 + i % 28:02d}-{1 + i % 12:02d}-2025", "09:00")
+
+    def query():
+        clear_cache()   # 只比较连接开销，不让查询缓存命中
+        get_termins(date_from="2025-03-01", date_to="2025-03-07")
+
+    new_us = _time_calls(calls, query)
+
+    db.close_all()
+    original = db.get_conn
+    db.get_conn = _old_get_conn
+    import termin
+    termin.get_conn = _old_get_conn
+    try:
+        old_us = _time_calls(calls, query)
+    finally:
+        db.get_conn = original
+        termin.get_conn = original
+
+    print(f"rows={rows} calls={calls}")
+    print(f"connect-per-call : {old_us:9.1f} µs/call")
+    print(f"reused connection: {new_us:9.1f} µs/call")
+    print(f"speedup          : {old_us / new_us:9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
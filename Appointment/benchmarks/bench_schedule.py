@@ -0,0 +1,84 @@
+"""
+排班引擎在一整年排满的日历上的查询延迟
+
+用法（在 Appointment 目录下）：
+    python benchmarks/bench_schedule.py [空档比例] [调用次数]
+
+每个营业日 08:00–20:00 按 90 分钟排满，再随机空出一部分时段
+会在临时目录中建库，不会碰真实的 termins.db
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, timedelta
+from pathlib import Path
+
+os.environ["APPDATA"] = tempfile.mkdtemp(prefix="termin_bench_")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import schedule  # noqa: E402
+from db import get_conn, write_conn  # noqa: E402
+
+YEAR = 2025
+
+
+def _fill_year(gap_ratio, rng):
+    rows = []
+    d = date(YEAR, 1, 1)
+    while d.year == YEAR:
+        if d.weekday() in schedule.OPEN_WEEKDAYS:
+            m = schedule.DAY_START_MIN
+            while m + schedule.DEFAULT_DURATION_MIN <= schedule.DAY_END_MIN:
+                if rng.random() >= gap_ratio:
+                    rows.append((uuid.uuid4().hex, d.isoformat(), schedule.min_to_hm(m), f"Patient {len(rows)}"))
+                m += schedule.DEFAULT_DURATION_MIN
+        d += timedelta(days=1)
+    with write_conn() as conn:
+        conn.executemany("""
+            INSERT INTO termins (id, date, planned_time, patient, status, arrival_time, leave_time, services, invoice_sent)
+            VALUES (?, ?, ?, ?, 'scheduled', '', '', '', 'no')
+        """, rows)
+    return len(rows)
+
+
+def _time_calls(n, fn):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    gap_ratio = float(sys.argv[1]) if len(sys.argv) > 1 else 0.01
+    calls = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    rng = random.Random(42)
+
+    n = _fill_year(gap_ratio, rng)
+    days = [(date(YEAR, 1, 1) + timedelta(days=i)).isoformat() for i in range(365)]
+
+    start = time.perf_counter()
+    schedule.clear_cache()
+    schedule._load(days[0], days[-1])
+    cold_ms = (time.perf_counter() - start) * 1e3
+
+    is_free_us = _time_calls(calls, lambda: schedule.is_free(
+        rng.choice(days), rng.randrange(8 * 60, 18 * 60), 45))
+    conflicts_us = _time_calls(calls, lambda: schedule.get_day(rng.choice(days)).conflicts(600, 690))
+    slots_us = _time_calls(calls // 10 or 1, lambda: schedule.next_free_slots(
+        rng.choice(days[:300]), length=60, n=5))
+    conn = get_conn()
+    db_check_us = _time_calls(calls, lambda: schedule.find_conflicts(conn, rng.choice(days), 600, 690))
+
+    print(f"appointments={n} gap_ratio={gap_ratio} calls={calls}")
+    print(f"cold load (1 year)       : {cold_ms:9.1f} ms")
+    print(f"is_free                  : {is_free_us:9.1f} µs/call")
+    print(f"conflicts (cached day)   : {conflicts_us:9.1f} µs/call")
+    print(f"next_free_slots(n=5)     : {slots_us:9.1f} µs/call")
+    print(f"find_conflicts (db, write path): {db_check_us:9.1f} µs/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+server.py 的负载测试：模拟几台前台电脑同时通过 HTTP 读写
+
+用法（在 Appointment 目录下）：
+    python benchmarks/bench_server.py [行数] [客户端数] [秒数]
+
+在临时目录中建库、在随机端口上启动服务；每个客户端一条 keep-alive 连接，
+按约 8:2 的比例做读（按周列表 / 计数 / 单条）和写（新建 / 改时间），
+最后打印每种请求的吞吐和 p50 / p95 延迟
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+os.environ["APPDATA"] = tempfile.mkdtemp(prefix="termin_bench_")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import asyncio  # noqa: E402
+
+from client import RemoteTermin  # noqa: E402
+from db import get_conn, init_db  # noqa: E402
+from importer import import_csv  # noqa: E402
+from server import TerminServer  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from datagen import write_csv  # noqa: E402
+
+
+def _seed(rows):
+    init_db()
+    csv_path = Path(os.environ["APPDATA"]) / "seed.csv"
+    write_csv(csv_path, rows)
+    import_csv(csv_path)
+    with get_conn() as conn:
+        return [r[0] for r in conn.execute("SELECT id FROM termins")]
+
+
+def _start_server(readers=4):
+    server = TerminServer(readers)
+    ready = threading.Event()
+    state = {}
+
+    async def run():
+        srv = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        state["port"] = srv.sockets[0].getsockname()[1]
+        state["loop"] = asyncio.get_running_loop()
+        state["srv"] = srv
+        ready.set()
+        async with srv:
+            try:
+                await srv.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    threading.Thread(target=asyncio.run, args=(run(),), daemon=True).start()
+    ready.wait()
+    return server, state
+
+
+def _client(url, ids, deadline, seed, out):
+    rnd = random.Random(seed)
+    api = RemoteTermin(url)
+    while time.perf_counter() < deadline:
+        r = rnd.random()
+        day = f"{rnd.randint(2020, 2024)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 22):02d}"
+        start = time.perf_counter()
+        if r < 0.5:
+            op = "list_week"
+            api.get_termins(date_from=day, date_to=day[:8] + f"{int(day[8:]) + 6:02d}", limit=200)
+        elif r < 0.65:
+            op = "count"
+            api.count_termins(status="scheduled")
+        elif r < 0.8:
+            op = "get_one"
+            api.get_termin(rnd.choice(ids))
+        elif r < 0.9:
+            op = "add"
+            d, m = rnd.randint(1, 28), rnd.randint(1, 12)
+            api.add_termin(f"Load {seed}", f"{d:02d}-{m:02d}-2026", f"{rnd.randint(8, 18):02d}:00",
+                           allow_conflict=True)
+        else:
+            op = "update"
+            api.update_termin(rnd.choice(ids), planned_time=f"{rnd.randint(8, 18):02d}:30", allow_conflict=True)
+        out.append((op, (time.perf_counter() - start) * 1e3))
+
+
+def _pct(sorted_ms, p):
+    return sorted_ms[min(len(sorted_ms) - 1, int(p / 100 * len(sorted_ms)))]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="server.py 的负载测试")
+    ap.add_argument("rows", nargs="?", type=int, default=20000)
+    ap.add_argument("clients", nargs="?", type=int, default=4)
+    ap.add_argument("seconds", nargs="?", type=float, default=5)
+    args = ap.parse_args()
+    rows, clients, seconds = args.rows, args.clients, args.seconds
+
+    ids = _seed(rows)
+    server, state = _start_server()
+    url = f"http://127.0.0.1:{state['port']}"
+
+    results = [[] for _ in range(clients)]
+    deadline = time.perf_counter() + seconds
+    threads = [
+        threading.Thread(target=_client, args=(url, ids, deadline, i, results[i]))
+        for i in range(clients)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    state["loop"].call_soon_threadsafe(state["srv"].close)
+    server.db.shutdown()
+
+    samples = [s for r in results for s in r]
+    print(f"rows={rows} clients={clients} seconds={seconds}")
+    print(f"{'op':10} {'count':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    by_op = {}
+    for op, ms in samples:
+        by_op.setdefault(op, []).append(ms)
+    for op, ms in sorted(by_op.items()) + [("total", [ms for _, ms in samples])]:
+        ms.sort()
+        print(f"{op:10} {len(ms):7} {len(ms) / seconds:8.1f} {_pct(ms, 50):8.2f} {_pct(ms, 95):8.2f}")
+
+
+if __name__ == "__main__":
+    main()
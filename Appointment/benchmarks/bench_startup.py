@@ -0,0 +1,84 @@
+"""
+启动耗时的回归检查：time-to-first-paint 不能超过预算
+
+用法（在 Appointment 目录下，需要能打开窗口的桌面环境）：
+    python benchmarks/bench_startup.py [行数] [次数] [--budget-ms 1500]
+
+在临时目录中建库，然后反复以 main_gui.py --profile-startup 启动程序，
+记录从创建进程到第一页数据画出来的时间（含解释器启动）和程序内部各阶段的时间；
+中位数超过预算时退出码为 1
+没有显示器时只能跑 tests/test_startup.py（检查启动路径上加载了哪些模块）
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ["APPDATA"] = tempfile.mkdtemp(prefix="termin_bench_")
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+from db import close_all, init_db  # noqa: E402
+from importer import import_csv  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from datagen import write_csv  # noqa: E402
+
+BUDGET_MS = 1500
+
+
+def _seed(rows):
+    init_db()
+    csv_path = Path(os.environ["APPDATA"]) / "seed.csv"
+    write_csv(csv_path, rows)
+    import_csv(csv_path)
+    close_all()
+
+
+def _launch():
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, str(SRC_DIR / "main_gui.py"), "--profile-startup"],
+        capture_output=True, text=True, cwd=SRC_DIR
+    )
+    wall = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        sys.exit(f"启动失败（退出码 {proc.returncode}）:\n{proc.stderr}")
+    marks = json.loads(proc.stdout.strip().splitlines()[-1])
+    marks["process_ms"] = round(wall, 1)
+    return marks
+
+
+def main():
+    ap = argparse.ArgumentParser(description="启动耗时的回归检查")
+    ap.add_argument("rows", nargs="?", type=int, default=100_000)
+    ap.add_argument("runs", nargs="?", type=int, default=5)
+    ap.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    args = ap.parse_args()
+    rows, runs, budget = args.rows, args.runs, args.budget_ms
+
+    print(f"seeding {rows} rows ...")
+    _seed(rows)
+
+    _launch()   # 第一次启动要编译 .pyc、冷读数据库文件，不计入
+    results = [_launch() for _ in range(runs)]
+
+    print(f"rows={rows} runs={runs} budget={budget:.0f} ms")
+    for name in ("import_ms", "window_ms", "first_paint_ms", "process_ms"):
+        values = [r[name] for r in results]
+        print(f"{name:<15} median {statistics.median(values):7.1f} ms   max {max(values):7.1f} ms")
+
+    median = statistics.median(r["process_ms"] for r in results)
+    if median > budget:
+        print(f"❌ time-to-first-paint {median:.0f} ms 超过预算 {budget:.0f} ms")
+        sys.exit(1)
+    print(f"✅ time-to-first-paint {median:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+可复现的模拟诊所数据：同一个 seed 永远生成同样的行
+
+- 周一到周六营业，08:00–19:30 每 15 分钟一个可约时间
+- 病人从固定的姓名池里抽（约每 20 次预约一个病人，含变音符号），同一个病人反复来
+- 项目按常见程度加权，每次 0–3 项
+- 以 today 为界：之前的大多已到达、多数已发账单；之后的都是 scheduled
+"""
+import csv
+import random
+from datetime import date, timedelta
+
+from importer import FIELDS
+
+FIRST_NAMES = [
+    "Anna", "Lukas", "Jürgen", "Sophie", "Mia", "Felix", "Zoë", "Jonas", "Lea", "Paul",
+    "Émile", "Hannah", "Ben", "Laura", "Noah", "Marie", "Elias", "Lina", "Finn", "Chloé",
+    "伟", "芳", "娜", "敏", "静",
+]
+LAST_NAMES = [
+    "Müller", "Schmidt", "Schneider", "Fischer", "Weber", "Meyer", "Wagner", "Becker",
+    "Schulz", "Hoffmann", "Koch", "Bauer", "Richter", "Klein", "Wolf", "Schröder",
+    "Neumann", "Schwarz", "Zimmermann", "Braun", "Krüger", "Hofmann", "Hartmann", "Lange",
+    "王", "李", "张", "刘", "陈",
+]
+# (项目, 权重)
+SERVICES = [
+    ("Massage", 30), ("Krankengymnastik", 25), ("Manuelle Therapie", 15),
+    ("Lymphdrainage", 10), ("Fango", 8), ("Elektrotherapie", 6), ("Ultraschall", 4),
+    ("针灸", 6), ("拔罐", 3), ("推拿", 5),
+]
+
+
+def _hm(m):
+    return f"{m // 60:02d}:{m % 60:02d}"
+
+
+def _min(t):
+    h, m = t.split(":")
+    return int(h) * 60 + int(m)
+
+
+SLOTS = [_hm(m) for m in range(8 * 60, 19 * 60 + 31, 15)]
+
+
+def _patients(rng, n):
+    names = set()
+    while len(names) < n:
+        names.add(f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {len(names)}")
+    return sorted(names)
+
+
+def generate_rows(n, seed=42, start=date(2020, 1, 1), years=5, today=None):
+    """按 FIELDS 顺序生成 n 行元组（按日期递增）"""
+    rng = random.Random(seed)
+    days = [start + timedelta(days=i) for i in range(365 * years)]
+    days = [d for d in days if d.weekday() < 6]
+    today = today or days[int(len(days) * 0.9)]
+    patients = _patients(rng, max(1, n // 20))
+    names, weights = zip(*SERVICES)
+
+    per_day, extra = divmod(n, len(days))
+    for i, d in enumerate(days):
+        iso = d.isoformat()
+        for _ in range(per_day + (1 if i < extra else 0)):
+            planned = rng.choice(SLOTS)
+            services = ";".join(dict.fromkeys(rng.choices(names, weights, k=rng.choice((0, 1, 1, 2, 2, 3)))))
+            if d <= today and rng.random() < 0.92:
+                arrive = _min(planned) + rng.randint(-10, 15)
+                leave = min(arrive + rng.choice((30, 45, 60, 90)), 23 * 60 + 59)
+                status, arrival, leave_t = "arrived", _hm(arrive), _hm(leave)
+                invoice = "yes" if rng.random() < 0.8 else "no"
+            else:
+                status, arrival, leave_t, invoice = "scheduled", "", "", "no"
+            yield (
+                f"{rng.getrandbits(128):032x}", iso, planned, rng.choice(patients),
+                status, arrival, leave_t, services, invoice
+            )
+
+
+def write_csv(path, n, seed=42, **kwargs):
+    """写成与导出格式一致的 CSV（给迁移 / 导入基准用），返回行数"""
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(FIELDS)
+        for row in generate_rows(n, seed, **kwargs):
+            w.writerow(row)
+            count += 1
+    return count
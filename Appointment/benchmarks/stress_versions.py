@@ -0,0 +1,100 @@
+"""
+多进程并发修改的压力测试：证明带 expected_version 的 update_termin 不会丢失修改
+
+用法（在 Appointment 目录下）：
+    python benchmarks/stress_versions.py [进程数] [每个进程的修改次数] [行数]
+    python benchmarks/stress_versions.py 8 200 4 --naive     # 对照：不带版本号，会丢修改
+
+在临时目录中建库。每个进程像一台前台电脑一样反复"读一行 → 把 patient 里的计数加一 → 写回"，
+只在很少几行上争抢；遇到版本冲突就重新读再改
+结束时检查：每行的计数 == 所有进程成功提交的次数之和，且 version 正好增加了同样多
+"""
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+
+
+def _setup_path():
+    if str(SRC_DIR) not in sys.path:
+        sys.path.insert(0, str(SRC_DIR))
+
+
+def _worker(ids, updates, seed, naive):
+    _setup_path()
+    from termin import get_termin, update_termin, VERSION_CONFLICT_MSG
+
+    rnd = random.Random(seed)
+    done = {tid: 0 for tid in ids}
+    conflicts = 0
+    for _ in range(updates):
+        tid = rnd.choice(ids)
+        while True:
+            row = get_termin(tid)
+            n = int(row["patient"].split(":")[1])
+            time.sleep(rnd.random() / 1000)   # 读和写之间的"思考时间"，让冲突更容易发生
+            ok, msg = update_termin(
+                tid, patient=f"ctr:{n + 1}", expected_version=None if naive else row["version"]
+            )
+            if ok:
+                done[tid] += 1
+                break
+            if not msg.startswith(VERSION_CONFLICT_MSG):
+                raise RuntimeError(msg)
+            conflicts += 1
+    return done, conflicts
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    naive = "--naive" in sys.argv
+    procs = int(args[0]) if len(args) > 0 else 8
+    updates = int(args[1]) if len(args) > 1 else 200
+    rows = int(args[2]) if len(args) > 2 else 4
+
+    # 子进程用 spawn 启动（与 Windows 一致），环境变量会带过去
+    os.environ["APPDATA"] = tempfile.mkdtemp(prefix="termin_stress_")
+    _setup_path()
+    from db import close_all, get_conn
+    from termin import add_termin
+
+    ids = []
+    for i in range(rows):
+        ok, msg, row = add_termin("ctr:0", f"{1 + i:02d}-06-2026", "09:00", return_row=True, allow_conflict=True)
+        ids.append(row["id"])
+    close_all()
+
+    ctx = multiprocessing.get_context("spawn")
+    start = time.perf_counter()
+    with ctx.Pool(procs) as pool:
+        results = pool.starmap(_worker, [(ids, updates, seed, naive) for seed in range(procs)])
+    seconds = time.perf_counter() - start
+
+    committed = {tid: sum(r[0][tid] for r in results) for tid in ids}
+    conflicts = sum(r[1] for r in results)
+    final = {
+        r["id"]: (int(r["patient"].split(":")[1]), r["version"])
+        for r in get_conn().execute(
+            f"SELECT id, patient, version FROM termins WHERE id IN ({', '.join('?' * len(ids))})", ids
+        )
+    }
+
+    lost = sum(committed[tid] - final[tid][0] for tid in ids)
+    bad_version = [tid for tid in ids if final[tid][1] - 1 != committed[tid]]
+    total = sum(committed.values())
+    print(f"processes={procs} updates/process={updates} rows={rows} mode={'naive' if naive else 'expected_version'}")
+    print(f"committed updates : {total} in {seconds:.2f}s ({total / seconds:.0f}/s)")
+    print(f"version conflicts : {conflicts} (retried)")
+    print(f"lost updates      : {lost}")
+    print(f"version mismatches: {len(bad_version)}")
+    if not naive and (lost or bad_version):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
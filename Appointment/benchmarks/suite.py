@@ -0,0 +1,308 @@
+"""
+基准套件：先用 datagen 生成 CSV 并导入（同时就是迁移基准），再依次测各项，结果输出为 JSON
+
+每项结果都带 unit，越小越好的是耗时（ms），越大越好的是吞吐（rows/s、ops/s）
+--compare 旧结果.json 时逐项打印与旧结果的比值，方便看回归
+"""
+import argparse
+import json
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from . import SRC_DIR
+from . import datagen
+
+import db
+import termin
+from backup import auto_backup, create_backup
+from importer import import_csv
+
+# 查询形状：名字 → get_termins / search_termins / count_termins 的参数
+QUERY_SHAPES = {
+    "first_page": ("get", dict(limit=200)),
+    "day": ("get", dict(date_from="{day}", date_to="{day}")),
+    "week": ("get", dict(date_from="{day}", date_to="{week_end}")),
+    "month": ("get", dict(date_from="{month}-01", date_to="{month}-31")),
+    "month_arrived": ("get", dict(date_from="{month}-01", date_to="{month}-31", status="arrived")),
+    "invoice_open_page": ("get", dict(invoice_sent="no", limit=200)),
+    "patient_substring": ("get", dict(patient="Müller", limit=200)),
+    "deep_keyset_page": ("get", dict(limit=200, after="{deep_key}")),
+    "search_prefix": ("search", dict(query="mül mass", limit=200)),
+    "count_all": ("count", dict()),
+    "count_month": ("count", dict(date_from="{month}-01", date_to="{month}-31")),
+}
+
+
+def _timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e3)
+    samples.sort()
+    return {
+        "unit": "ms",
+        "n": repeat,
+        "mean": round(statistics.fmean(samples), 3),
+        "p50": round(samples[len(samples) // 2], 3),
+        "p95": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "min": round(samples[0], 3),
+    }
+
+
+def _rate(count, seconds, unit):
+    return {"unit": unit, "count": count, "seconds": round(seconds, 3), "rate": round(count / seconds, 1)}
+
+
+# ----------------- 各项 -----------------
+def bench_migrate(tmp, rows, seed):
+    csv_path = tmp / "termins.csv"
+    start = time.perf_counter()
+    datagen.write_csv(csv_path, rows, seed)
+    gen_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    imported, rejected = import_csv(csv_path)
+    result = _rate(imported, time.perf_counter() - start, "rows/s")
+    result["rejected"] = rejected
+    result["generate_seconds"] = round(gen_s, 3)
+    return result
+
+
+def _params():
+    """从已导入的数据里挑查询用的日期和 keyset 位置：取日期范围中间的一天"""
+    conn = db.get_conn()
+    lo, hi = conn.execute("SELECT MIN(date), MAX(date) FROM termins").fetchone()
+    lo, hi = date.fromisoformat(lo), date.fromisoformat(hi)
+    mid = conn.execute(
+        "SELECT date FROM termins WHERE date >= ? ORDER BY date LIMIT 1",
+        ((lo + (hi - lo) / 2).isoformat(),)
+    ).fetchone()[0]
+    total = conn.execute("SELECT COUNT(*) FROM termins").fetchone()[0]
+    deep = conn.execute(
+        "SELECT date, planned_time, id FROM termins ORDER BY date, planned_time, id LIMIT 1 OFFSET ?",
+        (total * 3 // 4,)
+    ).fetchone()
+    return {
+        "day": mid,
+        "week_end": (date.fromisoformat(mid) + timedelta(days=6)).isoformat(),
+        "month": mid[:7],
+        "deep_key": tuple(deep),
+    }
+
+
+def _fill(kwargs, params):
+    out = {}
+    for k, v in kwargs.items():
+        if v == "{deep_key}":
+            out[k] = params["deep_key"]
+        elif isinstance(v, str):
+            out[k] = v.format(**params)
+        else:
+            out[k] = v
+    return out
+
+
+def bench_queries(repeat):
+    params = _params()
+    fns = {"get": termin.get_termins, "search": termin.search_termins, "count": termin.count_termins}
+    results = {}
+    for name, (kind, kwargs) in QUERY_SHAPES.items():
+        kwargs = _fill(kwargs, params)
+        fn = fns[kind]
+
+        def cold():
+            termin.clear_cache()   # 测的是 SQL + 行转换，不让查询缓存命中
+            fn(**kwargs)
+
+        results[name] = _timed(cold, repeat)
+    kwargs = _fill(QUERY_SHAPES["month"][1], params)
+    termin.get_termins(**kwargs)
+    results["month_cached"] = _timed(lambda: termin.get_termins(**kwargs), repeat)
+    return results
+
+
+def bench_writes(ops):
+    day = date.fromisoformat(_params()["day"]).strftime("%d-%m-%Y")
+    start = time.perf_counter()
+    ids = []
+    for i in range(ops):
+        _, _, row = termin.add_termin(f"Bench {i}", day, "12:00", return_row=True, allow_conflict=True)
+        ids.append(row["id"])
+    add = _rate(ops, time.perf_counter() - start, "ops/s")
+
+    start = time.perf_counter()
+    for tid in ids:
+        termin.update_termin(tid, arrival_time="12:05", leave_time="12:50", services=["Massage"])
+    update = _rate(ops, time.perf_counter() - start, "ops/s")
+
+    start = time.perf_counter()
+    for tid in ids:
+        termin.delete_termin(tid)
+    delete = _rate(ops, time.perf_counter() - start, "ops/s")
+    return {"add_termin": add, "update_termin": update, "delete_termin": delete}
+
+
+def bench_export(tmp):
+    out = {}
+    for name, compress in (("export_csv", False), ("export_csv_gz", True)):
+        path = tmp / ("export.csv.gz" if compress else "export.csv")
+        start = time.perf_counter()
+        n = termin.export_termins_to_csv(str(path), compress=compress)
+        out[name] = _rate(n, time.perf_counter() - start, "rows/s")
+        out[name]["bytes"] = path.stat().st_size
+    return out
+
+
+def bench_backup():
+    start = time.perf_counter()
+    create_backup()
+    direct = (time.perf_counter() - start) * 1e3
+
+    start = time.perf_counter()
+    t = auto_backup()
+    started = (time.perf_counter() - start) * 1e3
+    t.join()
+    total = (time.perf_counter() - start) * 1e3
+    return {
+        "create_backup": {"unit": "ms", "value": round(direct, 1)},
+        # 启动时真正挡住主线程的只是 auto_backup() 这一次调用
+        "auto_backup_blocking": {"unit": "ms", "value": round(started, 3)},
+        "auto_backup_total": {"unit": "ms", "value": round(total, 1)},
+    }
+
+
+def bench_gui_refresh(repeat):
+    """不显示窗口地跑 TerminApp.refresh，计到结果插入表格为止；没有显示环境时跳过"""
+    import tkinter as tk
+    try:
+        from ui import TerminApp
+        app = TerminApp()
+    except tk.TclError as e:
+        return {"skipped": str(e)}
+    app.withdraw()
+
+    def refresh_and_wait():
+        app.refresh()
+        while app._loading:
+            app.update()
+            time.sleep(0.0005)
+
+    results = {}
+    try:
+        for rng in ("all", "month"):
+            app.range_var.set(rng)
+            refresh_and_wait()
+
+            def cold():
+                termin.clear_cache()
+                app.tree.delete(*app.tree.get_children())
+                app._values.clear()
+                app._keys.clear()
+                app._shown = 0
+                app._query = {}
+                refresh_and_wait()
+
+            results[f"refresh_{rng}"] = _timed(cold, repeat)
+            # 条件不变时只做 diff，不重建表格
+            results[f"refresh_{rng}_unchanged"] = _timed(refresh_and_wait, repeat)
+    finally:
+        app.destroy()
+    return results
+
+
+# ----------------- 入口 -----------------
+def _meta(rows, seed):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SRC_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "rows": rows,
+        "seed": seed,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+    }
+
+
+def _flatten(results, prefix=""):
+    for k, v in results.items():
+        if isinstance(v, dict) and "unit" not in v and "skipped" not in v:
+            yield from _flatten(v, f"{prefix}{k}.")
+        else:
+            yield f"{prefix}{k}", v
+
+
+def _headline(v):
+    if "rate" in v:
+        return v["rate"]
+    if "p50" in v:
+        return v["p50"]
+    return v.get("value")
+
+
+def compare(old, new):
+    old_items = dict(_flatten(old["results"]))
+    print(f"{'benchmark':40} {'old':>12} {'new':>12} {'new/old':>8}")
+    for name, v in _flatten(new["results"]):
+        o = old_items.get(name)
+        if "unit" not in v or not o or "unit" not in o:
+            continue
+        a, b = _headline(o), _headline(v)
+        ratio = f"{b / a:8.2f}" if a else "       -"
+        better = "↑" if v["unit"].endswith("/s") else "↓"
+        print(f"{name:40} {a:12} {b:12} {ratio}  ({v['unit']}, {better} 更好)")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m benchmarks", description="termins 性能基准")
+    ap.add_argument("--rows", type=int, default=10_000, help="生成的预约行数（10k–5M）")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--repeat", type=int, default=20, help="每个查询形状重复次数")
+    ap.add_argument("--write-ops", type=int, default=500, help="增 / 改 / 删各做多少次")
+    ap.add_argument("--skip", action="append", default=[],
+                    choices=["queries", "writes", "export", "backup", "gui"])
+    ap.add_argument("--out", help="结果 JSON 写到这里（默认打印到标准输出）")
+    ap.add_argument("--compare", help="与这个旧结果 JSON 逐项比较")
+    args = ap.parse_args(argv)
+
+    tmp = Path(tempfile.mkdtemp(prefix="termin_bench_files_"))
+    results = {"migrate_csv": bench_migrate(tmp, args.rows, args.seed)}
+    print(f"已生成并导入 {args.rows} 行", file=sys.stderr)
+
+    steps = [
+        ("queries", lambda: bench_queries(args.repeat)),
+        ("writes", lambda: bench_writes(args.write_ops)),
+        ("export", lambda: bench_export(tmp)),
+        ("backup", bench_backup),
+        ("gui", lambda: bench_gui_refresh(max(3, args.repeat // 4))),
+    ]
+    for name, fn in steps:
+        if name in args.skip:
+            continue
+        print(f"运行 {name} ...", file=sys.stderr)
+        results[name] = fn()
+
+    report = {"meta": _meta(args.rows, args.seed), "results": results}
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(text, encoding="utf-8")
+    else:
+        print(text)
+
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text(encoding="utf-8")), report)
@@ -0,0 +1,291 @@
+"""
+按年份归档：把已经结束的年份里处理完的预约（已到达且已发账单）搬到 archive/termins_<年>.db
+
+    python archive.py run [--year 2023] [--all-rows]   # 默认归档今年以前的所有年份
+    python archive.py list
+
+termins.db 只留下近期和还没处理完的预约，日常查询的索引更浅，自动备份也更小更快
+termin.get_termins / search_termins / count_termins / get_termin / 导出 在日期范围碰到归档年份时自动一起查
+（每个归档文件单独一条只读用途的连接，结果按同一排序归并）；
+归档文件里有同样的全文索引和项目关联表（没有触发器，归档时整体重填），所以搜索和按项目统计也包括归档年份
+归档过的行只读：不能再修改或删除
+每次归档后会把该年的归档文件备份一份到 backups/archive/（归档文件平时不会变）
+"""
+import os
+import re
+import sqlite3
+import threading
+import weakref
+from datetime import date
+
+import db
+from db import DB_FILE, DERIVED_COLUMNS, mark_all_changed
+
+ARCHIVE_DIR = DB_FILE.parent / "archive"
+ARCHIVE_BACKUP_DIR = DB_FILE.parent / "backups" / "archive"
+_FILE_RE = re.compile(r"termins_(\d{4})\.db$")
+
+
+class ArchiveError(RuntimeError):
+    pass
+
+
+def archive_file(year):
+    return ARCHIVE_DIR / f"termins_{int(year)}.db"
+
+
+# ----------------- 归档文件列表 -----------------
+# 目录的 mtime 没变就不重新列目录（其它进程新建归档文件时 mtime 会变）
+_years_cache = (None, ())
+_years_lock = threading.Lock()
+
+
+def archived_years():
+    global _years_cache
+    try:
+        mtime = ARCHIVE_DIR.stat().st_mtime_ns
+    except FileNotFoundError:
+        return ()
+    with _years_lock:
+        if _years_cache[0] != mtime:
+            years = sorted(
+                int(m.group(1)) for m in (_FILE_RE.match(p.name) for p in ARCHIVE_DIR.iterdir()) if m
+            )
+            _years_cache = (mtime, tuple(years))
+        return _years_cache[1]
+
+
+def years_for(date_from=None, date_to=None):
+    """与 [date_from, date_to] 有交集的归档年份；近期的查询这里直接返回空"""
+    lo = int(date_from[:4]) if date_from else None
+    hi = int(date_to[:4]) if date_to else None
+    return [y for y in archived_years() if (lo is None or y >= lo) and (hi is None or y <= hi)]
+
+
+# ----------------- 读 -----------------
+_local = threading.local()
+
+
+class _Holder:
+    pass
+
+
+def _close(conns):
+    for conn in conns.values():
+        conn.close()
+    conns.clear()
+
+
+def get_conn(year):
+    """
+    当前线程读某个归档文件用的连接（复用，和 db.get_conn 一样）
+    导出等短命线程不会调用这里的关闭函数：线程结束时 threading.local 里的 holder 被释放，连接随之关闭
+    """
+    holder = getattr(_local, "holder", None)
+    if holder is None:
+        holder = _local.holder = _Holder()
+        holder.conns = {}
+        weakref.finalize(holder, _close, holder.conns)   # 进程退出时也会执行
+    conn = holder.conns.get(year)
+    if conn is None:
+        conn = holder.conns[year] = db._open_conn(archive_file(year))
+        _upgrade(conn)
+    return conn
+
+
+def _missing_tables(conn):
+    names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return {"termins_fts", "termin_services"} - names
+
+
+def _upgrade(conn):
+    """旧版本建的归档文件没有全文索引 / 项目关联表：第一次打开时补上（只会发生一次）"""
+    if not _missing_tables(conn):
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        missing = _missing_tables(conn)   # 拿到写锁之后再看一次，别的进程可能刚补完
+        for stmt in db._statements(_schema_sql("main")):
+            conn.execute(stmt)
+        if "termins_fts" in missing:
+            db.fill_search_index(conn)
+        if "termin_services" in missing:
+            db.backfill_services(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def close_conns():
+    """关闭当前线程打开的归档连接（删除 / 替换归档文件之前）"""
+    holder = getattr(_local, "holder", None)
+    if holder is not None:
+        _close(holder.conns)
+
+
+def find(tid):
+    """在归档里按 id 找一行，返回 (年份, 行)；找不到返回 None"""
+    for year in reversed(archived_years()):
+        row = get_conn(year).execute("SELECT * FROM termins WHERE id = ?", (tid,)).fetchone()
+        if row is not None:
+            return year, dict(row)
+    return None
+
+
+# ----------------- 归档 -----------------
+def _schema_sql(schema):
+    derived = ",\n".join(
+        f"        {name} INTEGER GENERATED ALWAYS AS ({expr}) VIRTUAL" for name, expr in DERIVED_COLUMNS.items()
+    )
+    # 列的顺序与迁移后的 termins 无关：读的时候总是列出列名
+    return f"""
+    CREATE TABLE IF NOT EXISTS {schema}.termins (
+        id TEXT PRIMARY KEY,
+        date TEXT,
+        planned_time TEXT,
+        patient TEXT,
+        status TEXT,
+        arrival_time TEXT,
+        leave_time TEXT,
+        services TEXT,
+        invoice_sent TEXT,
+        version INTEGER NOT NULL DEFAULT 1,
+{derived}
+    );
+    CREATE INDEX IF NOT EXISTS {schema}.idx_termins_date_time_id ON termins (date, planned_time, id);
+    CREATE INDEX IF NOT EXISTS {schema}.idx_termins_status_date_id ON termins (status, date, planned_time, id);
+    {db.SEARCH_INDEX_SQL.format(schema=schema)};
+    CREATE TABLE IF NOT EXISTS {schema}.services (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE COLLATE NOCASE
+    );
+    CREATE TABLE IF NOT EXISTS {schema}.termin_services (
+        termin_id TEXT NOT NULL,
+        service_id INTEGER NOT NULL,
+        date TEXT,
+        PRIMARY KEY (termin_id, service_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS {schema}.idx_termin_services_service_date
+        ON termin_services (service_id, date, termin_id);
+    """
+
+
+def archive_year(year, all_rows=False, vacuum=True):
+    """
+    把 year 年已到达且已发账单的预约（all_rows=True 时是这一年全部的预约）搬进归档文件，返回行数
+    只能归档今年以前的年份；可以重复执行（之后处理完的行会补进去）
+    """
+    from termin import TERMIN_COLUMNS   # 延迟导入：termin 本身也要用这个模块
+
+    year = int(year)
+    if year >= date.today().year:
+        raise ArchiveError(f"{year} 年还没结束，不能归档")
+
+    db.init_db()
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    path = archive_file(year)
+    cols = ", ".join(TERMIN_COLUMNS)
+    where = "date BETWEEN ? AND ?" + ("" if all_rows else " AND status = 'arrived' AND invoice_sent = 'yes'")
+    params = (f"{year}-01-01", f"{year}-12-31")
+
+    # 单独开一条连接：ATTACH 不能在事务里做，也不想动进程里共用的写连接
+    conn = db._open_conn()
+    try:
+        conn.execute("ATTACH DATABASE ? AS arch", (str(path),))
+        conn.executescript(_schema_sql("arch"))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # WAL 模式下跨两个库的事务只对每个库分别原子；中途断电最多在两边各留一份，
+            # 再运行一次就会用 INSERT OR REPLACE 覆盖、再从 termins.db 删掉
+            conn.execute(
+                f"INSERT OR REPLACE INTO arch.termins ({cols}) SELECT {cols} FROM main.termins WHERE {where}",
+                params
+            )
+            moved = conn.execute(
+                f"DELETE FROM main.termins WHERE {where} AND id IN (SELECT id FROM arch.termins)", params
+            ).rowcount
+            # INSERT OR REPLACE 会换掉被覆盖行的 rowid，整体重填比逐行同步简单（每年只归档一次）
+            db.fill_search_index(conn, "arch")
+            db.backfill_services(conn, "arch")
+            if moved:
+                mark_all_changed(conn)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.execute("DETACH DATABASE arch")
+
+        if moved and vacuum:
+            # 删掉的行留下的空页不会自己还给文件系统，备份 API 也会照样复制它们
+            conn.execute("VACUUM")
+            db.fill_search_index(conn)
+            conn.commit()
+    finally:
+        conn.close()
+
+    if moved:
+        backup_archive(year)
+    return moved
+
+
+def archive_closed_years(all_rows=False):
+    """归档今年以前的所有年份，返回 {年份: 行数}"""
+    db.init_db()
+    this_year = date.today().year
+    years = [
+        int(r[0]) for r in db.get_conn().execute(
+            "SELECT DISTINCT substr(date, 1, 4) FROM termins WHERE date < ? ORDER BY 1", (f"{this_year}-01-01",)
+        ) if r[0] and r[0].isdigit()
+    ]
+    result = {}
+    for i, y in enumerate(years):
+        result[y] = archive_year(y, all_rows, vacuum=(i == len(years) - 1))
+    return result
+
+
+def backup_archive(year):
+    """归档文件的备份（同一年只留最新的一份）"""
+    ARCHIVE_BACKUP_DIR.mkdir(parents=True, exist_ok=True)
+    target = ARCHIVE_BACKUP_DIR / archive_file(year).name
+    tmp = target.with_name(target.name + ".tmp")
+    src = sqlite3.connect(archive_file(year))
+    dest = sqlite3.connect(tmp)
+    try:
+        src.backup(dest)
+    finally:
+        dest.close()
+        src.close()
+    os.replace(tmp, target)
+    return target
+
+
+def main(argv=None):
+    import argparse
+
+    ap = argparse.ArgumentParser(description="按年份归档 termins")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list", help="列出归档文件")
+    p = sub.add_parser("run", help="归档（默认今年以前的所有年份）")
+    p.add_argument("--year", type=int, help="只归档这一年")
+    p.add_argument("--all-rows", action="store_true", help="连没到达 / 没发账单的行也一起归档")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "list":
+        for y in archived_years():
+            f = archive_file(y)
+            n = get_conn(y).execute("SELECT COUNT(*) FROM termins").fetchone()[0]
+            print(f"{y}  {n} 行  {f.stat().st_size / 1024:.0f} KB  {f}")
+        print(f"termins.db  {DB_FILE.stat().st_size / 1024:.0f} KB")
+    elif args.cmd == "run":
+        if args.year:
+            result = {args.year: archive_year(args.year, args.all_rows)}
+        else:
+            result = archive_closed_years(args.all_rows)
+        for y, n in result.items():
+            print(f"{y}: 归档 {n} 行")
+        print(f"✅ 完成，termins.db 现在 {DB_FILE.stat().st_size / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
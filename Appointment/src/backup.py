@@ -1,16 +1,179 @@
-import shutil
-from pathlib import Path
-from db import DB_FILE, init_db
-
-def auto_backup():
-    # ⭐ 先确保数据库和表存在
-    init_db()
-
-    if not DB_FILE.exists():
-        return
-
-    backup_dir = DB_FILE.parent / "backups"
-    backup_dir.mkdir(exist_ok=True)
-
-    backup_file = backup_dir / "termins_backup.db"
-    shutil.copy2(DB_FILE, backup_file)
\ No newline at end of file
+import argparse
+import gzip
+import shutil
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+import db
+from db import DB_FILE, init_db, close_conn, invalidate_caches, mark_all_changed, migrate, write_conn, write_lock
+
+BACKUP_DIR = DB_FILE.parent / "backups"
+BACKUP_KEEP = 10            # 保留最近几份
+PAGES_PER_STEP = 256        # 每步复制的页数，步与步之间稍停一下，少占磁盘带宽
+STEP_SLEEP = 0.005
+
+
+class BackupError(RuntimeError):
+    pass
+
+
+def list_backups():
+    """按时间从新到旧返回所有备份文件"""
+    if not BACKUP_DIR.exists():
+        return []
+    files = [p for p in BACKUP_DIR.glob("termins_*.db*") if not p.name.endswith(".tmp")]
+    return sorted(files, key=lambda p: p.name, reverse=True)
+
+
+def _quick_check(path):
+    conn = sqlite3.connect(path)
+    try:
+        result = conn.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        conn.close()
+    if result != "ok":
+        raise BackupError(f"备份校验失败: {result}")
+
+
+def _copy_snapshot(dest, progress=None):
+    """
+    分步把当前数据库复制到 dest
+    备份 API 发现源库被别的连接改过就会从头再来，写入频繁时可能一直复制不完；
+    所以单独开一条源连接，在它上面一直开着读事务：WAL 模式下这个快照在整个备份期间固定不变，
+    别的连接照常写入，备份不会重来，得到的是开始那一刻的完整数据
+    """
+    src = db._open_conn()
+    try:
+        src.execute("BEGIN")
+        src.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()   # 真正拿到读快照
+        src.backup(dest, pages=PAGES_PER_STEP, progress=progress, sleep=STEP_SLEEP)
+        src.rollback()
+    finally:
+        src.close()
+
+
+def create_backup(compress=False, keep=BACKUP_KEEP):
+    """
+    用 SQLite 在线备份 API 分步复制当前数据库，期间其它连接可以照常读写
+    校验通过后才改名为正式文件，并删除多余的旧备份；返回备份文件路径
+    """
+    init_db()
+    BACKUP_DIR.mkdir(exist_ok=True)
+
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    target = BACKUP_DIR / f"termins_{stamp}.db"
+    tmp = target.with_name(target.name + ".tmp")
+
+    dest = sqlite3.connect(tmp)
+    try:
+        _copy_snapshot(dest)
+    finally:
+        dest.close()
+
+    try:
+        _quick_check(tmp)
+        if compress:
+            target = target.with_name(target.name + ".gz")
+            with tmp.open("rb") as src, gzip.open(target, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            tmp.unlink()
+        else:
+            tmp.replace(target)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+    for old in list_backups()[keep:]:
+        old.unlink(missing_ok=True)
+
+    return target
+
+
+def restore_backup(path):
+    """
+    用备份覆盖当前数据库（通过备份 API 写入，WAL 和其它连接都能正确看到）
+    拿着本进程的写锁、写到共用的写连接上，本进程其它线程的连接不用关，下次读就是恢复后的数据；
+    恢复前请先关闭其它正在使用数据库的程序
+    """
+    path = Path(path)
+    if not path.exists() and (BACKUP_DIR / path).exists():
+        path = BACKUP_DIR / path
+    if not path.exists():
+        raise BackupError(f"找不到备份文件: {path}")
+
+    src_path = path
+    if path.suffix == ".gz":
+        src_path = BACKUP_DIR / (path.stem + ".restore.tmp")
+        with gzip.open(path, "rb") as src, src_path.open("wb") as dst:
+            shutil.copyfileobj(src, dst)
+
+    try:
+        _quick_check(src_path)
+        init_db()
+        with write_lock() as conn:
+            src = sqlite3.connect(src_path)
+            try:
+                src.backup(conn)
+            finally:
+                src.close()
+            # 旧备份的 schema 版本可能更低，补跑迁移
+            migrate(conn)
+            with write_conn() as conn:
+                mark_all_changed(conn)
+        invalidate_caches()
+    finally:
+        if src_path != path:
+            src_path.unlink(missing_ok=True)
+
+
+def _backup_worker(compress):
+    try:
+        create_backup(compress=compress)
+    except Exception as e:
+        print(f"⚠ 自动备份失败: {e}")
+    finally:
+        close_conn()
+
+
+def auto_backup(compress=False):
+    """
+    在后台线程做一次备份，不阻塞启动
+    不是守护线程：程序关闭时会等这次备份完成
+    """
+    for stale in BACKUP_DIR.glob("*.tmp") if BACKUP_DIR.exists() else []:
+        stale.unlink(missing_ok=True)
+
+    t = threading.Thread(target=_backup_worker, args=(compress,), name="auto-backup")
+    t.start()
+    return t
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="termins 数据库备份 / 恢复")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list", help="列出备份")
+    p = sub.add_parser("create", help="立即备份")
+    p.add_argument("--gzip", action="store_true", help="压缩备份文件")
+    p = sub.add_parser("restore", help="从备份恢复（会覆盖当前数据）")
+    p.add_argument("path", help="备份文件；写 latest 表示最新一份")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "list":
+        for f in list_backups():
+            print(f"{f.name}  {f.stat().st_size / 1024:.0f} KB")
+    elif args.cmd == "create":
+        print(f"✅ 已备份到 {create_backup(compress=args.gzip)}")
+    elif args.cmd == "restore":
+        path = args.path
+        if path == "latest":
+            backups = list_backups()
+            if not backups:
+                raise SystemExit("没有可用的备份")
+            path = backups[0]
+        restore_backup(path)
+        print(f"✅ 已从 {path} 恢复")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+server.py 的客户端：方法名、参数和返回值都与 termin 模块里的同名函数一致，
+界面只需要把函数换成 RemoteTermin 的方法（见 ui.py 里的 TERMIN_SERVER）
+
+每个线程一条 HTTP keep-alive 连接；连接断开时读请求重连后重发一次，
+写请求只有在还没发出去时才重发
+"""
+import http.client
+import json
+import threading
+from pathlib import Path
+from urllib.parse import quote, urlencode, urlsplit
+
+from archive import ArchiveError
+from termin import ExportCancelled, VersionConflict
+
+TIMEOUT = 30
+EXPORT_CHUNK = 64 * 1024
+
+
+class RemoteError(RuntimeError):
+    pass
+
+
+class RemoteTermin:
+    def __init__(self, base_url, timeout=TIMEOUT):
+        url = urlsplit(base_url if "//" in base_url else f"http://{base_url}")
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    # ---------- HTTP ----------
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def _send(self, method, path, params=None, body=None):
+        if params:
+            params = {k: v for k, v in params.items() if v not in (None, "")}
+            if params:
+                path += "?" + urlencode(params)
+        data = None
+        headers = {}
+        if body is not None:
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+
+        for attempt in (1, 2):
+            conn = self._conn()
+            sent = False
+            try:
+                conn.request(method, path, body=data, headers=headers)
+                sent = True
+                return conn.getresponse()
+            except (ConnectionError, http.client.RemoteDisconnected, http.client.CannotSendRequest):
+                conn.close()
+                self._local.conn = None
+                # 已经发出去的写请求不能重发：服务器可能已经执行了，只是回应丢了（重发会多建一条预约）
+                if attempt == 2 or (sent and method != "GET"):
+                    raise
+        raise AssertionError("unreachable")
+
+    def _json(self, method, path, params=None, body=None, not_found=None):
+        resp = self._send(method, path, params, body)
+        payload = json.loads(resp.read() or b"{}")
+        if resp.status == 404 and not_found is not None:
+            return not_found
+        if resp.status == 409:
+            raise VersionConflict(payload.get("row"))
+        if resp.status == 403:
+            raise ArchiveError(payload.get("error"))
+        if resp.status >= 400:
+            raise RemoteError(payload.get("error") or f"HTTP {resp.status}")
+        return payload
+
+    @staticmethod
+    def _id(tid):
+        return quote(tid, safe="")
+
+    @staticmethod
+    def _query(after=None, before=None, columns=None, **params):
+        if after:
+            params["after"] = ",".join(after)
+        if before:
+            params["before"] = ",".join(before)
+        if columns:
+            params["columns"] = ",".join(columns)
+        return params
+
+    # ---------- 读 ----------
+    def get_termins(self, date_from=None, date_to=None, status=None, invoice_sent=None, patient=None,
+                    limit=None, offset=None, columns=None, after=None, before=None):
+        return self._json("GET", "/termins", self._query(
+            date_from=date_from, date_to=date_to, status=status, invoice_sent=invoice_sent,
+            patient=patient, limit=limit, offset=offset, columns=columns, after=after, before=before
+        ))["rows"]
+
+    def search_termins(self, query, date_from=None, date_to=None, status=None, invoice_sent=None,
+                       limit=None, offset=None, columns=None, after=None, before=None):
+        return self._json("GET", "/termins/search", self._query(
+            q=query, date_from=date_from, date_to=date_to, status=status, invoice_sent=invoice_sent,
+            limit=limit, offset=offset, columns=columns, after=after, before=before
+        ))["rows"]
+
+    def count_termins(self, query=None, date_from=None, date_to=None, status=None, invoice_sent=None,
+                      patient=None):
+        return self._json("GET", "/termins/count", dict(
+            q=query, date_from=date_from, date_to=date_to, status=status,
+            invoice_sent=invoice_sent, patient=patient
+        ))["count"]
+
+    def get_termin(self, tid, columns=None):
+        payload = self._json("GET", f"/termins/{self._id(tid)}", self._query(columns=columns), not_found={})
+        return payload.get("row")
+
+    def change_seq(self):
+        return self._json("GET", "/changes")["seq"]
+
+    def get_changes(self, seq, columns=None):
+        p = self._json("GET", "/changes", self._query(since=seq, columns=columns))
+        return p["seq"], p["rows"], p["deleted"]
+
+    # ---------- 写 ----------
+    def add_termin(self, patient, date_ddmmyyyy, planned_time, *, return_row=False, allow_conflict=False):
+        p = self._json("POST", "/termins", body=dict(
+            patient=patient, date=date_ddmmyyyy, planned_time=planned_time, allow_conflict=allow_conflict
+        ))
+        return (p["ok"], p["msg"], p["row"]) if return_row else (p["ok"], p["msg"])
+
+    def update_termin(self, tid, *, return_row=False, **fields):
+        body = {k: v for k, v in fields.items() if v is not None}
+        p = self._json("PATCH", f"/termins/{self._id(tid)}", body=body)
+        return (p["ok"], p["msg"], p["row"]) if return_row else (p["ok"], p["msg"])
+
+    def delete_termin(self, tid, expected_version=None):
+        return self._json(
+            "DELETE", f"/termins/{self._id(tid)}", dict(expected_version=expected_version), not_found={}
+        ).get("row")
+
+    def bulk_update_termins(self, ids, *, expected_versions=None, **fields):
+        p = self._json("POST", "/termins/bulk-update", body=dict(
+            fields, ids=list(ids), expected_versions=expected_versions
+        ))
+        return p["ok"], p["msg"], p["rows"]
+
+    def bulk_delete_termins(self, ids, *, expected_versions=None):
+        p = self._json("POST", "/termins/bulk-delete", body=dict(
+            ids=list(ids), expected_versions=expected_versions
+        ))
+        return p["ok"], p["msg"], p["rows"]
+
+    def add_series(self, patient, start_ddmmyyyy, planned_time, interval_weeks=1, count=None,
+                   until_ddmmyyyy=None, services=None):
+        p = self._json("POST", "/series", body=dict(
+            patient=patient, start_date=start_ddmmyyyy, planned_time=planned_time,
+            interval_weeks=interval_weeks, count=count, until=until_ddmmyyyy, services=services
+        ))
+        return p["ok"], p["msg"], p["id"]
+
+    # ---------- 导出 ----------
+    def export_termins_to_csv(self, csv_path, date_from=None, date_to=None, status=None,
+                              invoice_sent=None, patient=None, compress=None, progress=None, cancel=None):
+        """由服务器导出，再下载到 csv_path；进度按已下载字节折算成行数；和本地导出一样先写 .tmp 再改名"""
+        csv_path = Path(csv_path)
+        if compress is None:
+            compress = csv_path.suffix.lower() == ".gz"
+        resp = self._send("GET", "/export.gz" if compress else "/export", dict(
+            date_from=date_from, date_to=date_to, status=status, invoice_sent=invoice_sent, patient=patient
+        ))
+        if resp.status >= 400:
+            raise RemoteError(json.loads(resp.read() or b"{}").get("error") or f"HTTP {resp.status}")
+
+        rows = int(resp.getheader("X-Row-Count") or 0)
+        size = int(resp.getheader("Content-Length") or 0)
+        done = 0
+        tmp = csv_path.with_name(csv_path.name + ".tmp")
+        try:
+            with tmp.open("wb") as f:
+                while True:
+                    if cancel is not None and cancel.is_set():
+                        raise ExportCancelled()
+                    chunk = resp.read(EXPORT_CHUNK)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    done += len(chunk)
+                    if progress and size:
+                        progress(rows * done // size, rows)
+            tmp.replace(csv_path)
+        except BaseException:
+            # 没读完的响应会让这条连接不能再用
+            self._conn().close()
+            self._local.conn = None
+            tmp.unlink(missing_ok=True)
+            raise
+        return rows
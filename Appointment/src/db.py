@@ -1,41 +1,683 @@
-import sqlite3
-from pathlib import Path
-import os
-
-APP_NAME = "TerminSystem"
-
-def get_app_data_dir():
-    """
-    返回用户可写的数据目录
-    Windows: %APPDATA%\\TerminSystem
-    """
-    base = Path(os.environ.get("APPDATA", Path.home()))
-    data_dir = base / APP_NAME
-    data_dir.mkdir(parents=True, exist_ok=True)
-    return data_dir
-
-
-DB_FILE = get_app_data_dir() / "termins.db"
-
-
-def get_conn():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-
-def init_db():
-    with get_conn() as conn:
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS termins (
-            id TEXT PRIMARY KEY,
-            date TEXT,
-            planned_time TEXT,
-            patient TEXT,
-            status TEXT,
-            arrival_time TEXT,
-            leave_time TEXT,
-            services TEXT,
-            invoice_sent TEXT
-        )
-        """)
+import sqlite3
+from pathlib import Path
+import os
+import random
+import threading
+import time
+import atexit
+import unicodedata
+from contextlib import contextmanager
+
+import instrument
+
+APP_NAME = "TerminSystem"
+
+def get_app_data_dir():
+    """
+    返回用户可写的数据目录
+    Windows: %APPDATA%\\TerminSystem
+    """
+    base = Path(os.environ.get("APPDATA", Path.home()))
+    data_dir = base / APP_NAME
+    data_dir.mkdir(parents=True, exist_ok=True)
+    return data_dir
+
+
+DB_FILE = get_app_data_dir() / "termins.db"
+
+# ----------------- 连接管理 -----------------
+# 每个线程复用一条长连接，避免每次查询都重新打开文件、解析 schema
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KIB = 16 * 1024          # 页缓存 16 MB（负数表示 KiB）
+MMAP_SIZE = 256 * 1024 * 1024       # 内存映射 256 MB
+STATEMENT_CACHE = 256               # 预编译语句缓存条数
+
+_local = threading.local()
+_all_conns = []
+_all_conns_lock = threading.Lock()
+
+
+def _open_conn(db_file=None):
+    conn = sqlite3.connect(
+        db_file or DB_FILE,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE,
+        check_same_thread=False,   # 仅供退出时统一关闭，实际仍只在所属线程使用
+        factory=instrument.connection_factory(),
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    # INSERT OR REPLACE 删除旧行时也要触发同步全文索引的 DELETE 触发器
+    conn.execute("PRAGMA recursive_triggers=ON")
+    _register_functions(conn)
+    return conn
+
+
+def fold(text):
+    """
+    搜索用的规范化：去掉变音符号、全角转半角、不区分大小写（Müller → muller，Ｍ → m）
+    全文索引里存的和查询词都先过一遍，和 SQLite 版本无关（trigram 到 3.45 才有 remove_diacritics）
+    """
+    if not text:
+        return text
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return unicodedata.normalize("NFC", stripped).casefold()
+
+
+def _register_functions(conn):
+    # 全文索引的触发器要调用 fold()：每条会写 termins 的连接都必须注册
+    conn.create_function("fold", 1, fold, deterministic=True)
+
+
+def get_conn():
+    """
+    返回当前线程复用的连接
+    仍然可以 `with get_conn() as conn:`，with 只负责提交 / 回滚，不会关闭连接
+    进程内第一次取连接时自动建表 / 迁移
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _open_conn()
+        _local.conn = conn
+        with _all_conns_lock:
+            _all_conns.append(conn)
+        if not _schema_ready:
+            _ensure_schema(conn)
+    return conn
+
+
+def close_conn():
+    """关闭当前线程的连接（工作线程结束前调用）"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        return
+    _local.conn = None
+    _local.version_seen = None
+    with _all_conns_lock:
+        if conn in _all_conns:
+            _all_conns.remove(conn)
+    conn.close()
+
+
+# 进程内的写操作共用一条连接、串行执行
+_write_lock = threading.RLock()
+_write_conn = None
+
+# 写事务用 BEGIN IMMEDIATE 一开始就拿写锁：先读后写的事务不会在中途因为别的进程已经写过而失败
+# 其它进程长时间占着写锁时（busy_timeout 等完仍是 SQLITE_BUSY），按指数退避重试几次
+WRITE_RETRIES = 5
+RETRY_BASE_DELAY = 0.05
+
+
+def _is_busy(e):
+    msg = str(e).lower()
+    return "locked" in msg or "busy" in msg
+
+
+def _get_write_conn():
+    global _write_conn
+    if _write_conn is None:
+        _write_conn = _open_conn()
+        with _all_conns_lock:
+            _all_conns.append(_write_conn)
+        if not _schema_ready:
+            _ensure_schema(_write_conn)
+    return _write_conn
+
+
+def _begin_immediate(conn):
+    for attempt in range(WRITE_RETRIES + 1):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            return
+        except sqlite3.OperationalError as e:
+            if not _is_busy(e) or attempt == WRITE_RETRIES:
+                raise
+            time.sleep(RETRY_BASE_DELAY * 2 ** attempt * (1 + random.random()))
+
+
+@contextmanager
+def write_conn():
+    """
+    with write_conn() as conn: 在一个事务里写入，正常结束提交，异常回滚
+    锁可重入：同一线程里嵌套调用时并入外层事务，由最外层提交
+    """
+    with _write_lock:
+        conn = _get_write_conn()
+        if conn.in_transaction:
+            yield conn
+            return
+        _begin_immediate(conn)
+        try:
+            _note_foreign_writes(conn)
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        last = _last_change(conn)
+        conn.commit()
+        _note_own_commit(last)
+
+
+@contextmanager
+def write_lock():
+    """
+    with write_lock() as conn: 拿着进程内的写锁但不开事务，返回共用的写连接
+    给备份 API、迁移这类自己管事务的操作用；里面仍可以嵌套 with write_conn()
+    """
+    with _write_lock:
+        yield _get_write_conn()
+
+
+# ----------------- 别的连接的写入 -----------------
+# data_version() 在每次读缓存之前都会调用，所以不能碰写连接（那要等写锁，写事务可能要好几秒）：
+# 在调用线程自己的读连接上取 PRAGMA data_version，它对任何别的连接的提交都会变化，也包括本进程的写连接
+# 为了分清是不是只有本进程自己写过，write_conn() 提交后记下自己的提交次数和变更日志最后的 seq：
+# - 读连接看到变化、而这期间本进程没提交过 → 一定是别人写的
+# - 这期间本进程也提交过 → 变更日志最后一条不是自己写的，才算别人写过
+# - 别人在本进程两次写入之间的写入，由下一次写事务开始时对比变更日志发现
+# - 线程（或它重开的读连接）第一次调用时没有可比的旧值，别的线程的读连接可能还没看到刚才的写入，
+#   所以第一次也算作变化；线程都在池里复用，这只会在启动和重连时多清一次缓存
+# 只会多算（多清一次缓存），不会漏算
+_version_lock = threading.Lock()
+_own_commits = 0
+_own_last_seq = None     # 本进程最近一次提交后变更日志的最后 seq；None 表示还没写过
+_foreign_gen = 0         # data_version() 的返回值：发现别的连接写过就 +1
+
+
+def _last_change(conn):
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM termin_changes").fetchone()[0]
+
+
+def _note_foreign_writes(conn):
+    global _foreign_gen
+    last = _last_change(conn)
+    with _version_lock:
+        if last != _own_last_seq:
+            _foreign_gen += 1
+
+
+def _note_own_commit(last):
+    global _own_commits, _own_last_seq
+    with _version_lock:
+        _own_commits += 1
+        _own_last_seq = last
+
+
+def data_version():
+    """
+    别的连接（其它进程 / 归档 / 还原备份等）提交过写入后，这个值就会变化；
+    本进程通过 write_conn() 的写入不会改变它（那些写入由调用方按日期失效缓存）
+    不等写锁，写事务进行中也能马上返回
+    """
+    global _foreign_gen
+    with _version_lock:
+        own, own_seq = _own_commits, _own_last_seq
+    conn = get_conn()
+    v = conn.execute("PRAGMA data_version").fetchone()[0]
+    seen = getattr(_local, "version_seen", None)
+    _local.version_seen = (v, own)
+    if seen is None or (seen[0] != v and (seen[1] == own or _last_change(conn) != own_seq)):
+        with _version_lock:
+            _foreign_gen += 1
+    with _version_lock:
+        return _foreign_gen
+
+
+@atexit.register
+def close_all():
+    """进程退出时关闭所有线程的连接，WAL 会在最后一个连接关闭时合并回主库"""
+    global _write_conn
+    with _all_conns_lock:
+        conns = list(_all_conns)
+        _all_conns.clear()
+    _local.conn = None
+    _write_conn = None
+    for conn in conns:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+# ----------------- Schema 迁移 -----------------
+# 按 termins.services（; 分隔）重建 services / termin_services
+# 触发器里不能用 WITH，所以拆分只能在这里（迁移 / 批量导入后）用递归 CTE 做，平时由 termin.py 维护
+# {schema}: main，或者 ATTACH 进来的归档文件（见 archive.py）
+SERVICES_BACKFILL_SQL = """
+    DELETE FROM {schema}.termin_services;
+    WITH RECURSIVE split(tid, d, rest, name) AS (
+        SELECT id, date, services || ';', NULL FROM {schema}.termins WHERE services <> ''
+        UNION ALL
+        SELECT tid, d, substr(rest, instr(rest, ';') + 1), trim(substr(rest, 1, instr(rest, ';') - 1))
+        FROM split WHERE rest <> ''
+    )
+    INSERT OR IGNORE INTO {schema}.services (name)
+        SELECT DISTINCT name FROM split WHERE name <> '';
+    WITH RECURSIVE split(tid, d, rest, name) AS (
+        SELECT id, date, services || ';', NULL FROM {schema}.termins WHERE services <> ''
+        UNION ALL
+        SELECT tid, d, substr(rest, instr(rest, ';') + 1), trim(substr(rest, 1, instr(rest, ';') - 1))
+        FROM split WHERE rest <> ''
+    )
+    INSERT OR IGNORE INTO {schema}.termin_services (termin_id, service_id, date)
+        SELECT split.tid, s.id, split.d
+        FROM split JOIN {schema}.services s ON s.name = split.name
+        WHERE split.name <> '';
+"""
+
+# 版本号记录在 PRAGMA user_version 中，每一步只执行一次
+# 新的改动只能追加到末尾，已发布的步骤不要修改；每一步都要可重复执行（IF NOT EXISTS）
+# 一步可以是 SQL 脚本，也可以是 step(conn) 函数（在同一个事务里执行）
+# 整数形式的日期 / 时间：day_num 为 1970-01-01 起的天数，*_min 为当天的分钟数（空时间为 NULL）
+# VIRTUAL 生成列不占存储，读取时由 SQLite 计算，SELECT * 也会带上它们
+def _minute_expr(col):
+    return (
+        f"CASE WHEN {col} GLOB '[0-9][0-9]:[0-9][0-9]*'"
+        f" THEN substr({col}, 1, 2) * 60 + substr({col}, 4, 2) END"
+    )
+
+
+DERIVED_COLUMNS = {
+    "day_num": "CAST(julianday(date) - 2440587.5 AS INTEGER)",
+    "planned_min": _minute_expr("planned_time"),
+    "arrival_min": _minute_expr("arrival_time"),
+    "leave_min": _minute_expr("leave_time"),
+}
+
+
+def _add_derived_columns(conn):
+    # ALTER TABLE 不支持 IF NOT EXISTS，先查已有列保证可重复执行
+    existing = {r[1] for r in conn.execute("PRAGMA table_xinfo(termins)")}
+    for name, expr in DERIVED_COLUMNS.items():
+        if name not in existing:
+            conn.execute(
+                f"ALTER TABLE termins ADD COLUMN {name} INTEGER GENERATED ALWAYS AS ({expr}) VIRTUAL"
+            )
+
+
+SEARCH_INDEX_SQL = 'CREATE VIRTUAL TABLE IF NOT EXISTS {schema}.termins_fts USING fts5(patient, services, tokenize="trigram")'
+SEARCH_INDEX_FILL = """
+    DELETE FROM {schema}.termins_fts;
+    INSERT INTO {schema}.termins_fts (rowid, patient, services)
+        SELECT rowid, fold(patient), fold(services) FROM {schema}.termins;
+"""
+
+
+def _folded_search_index(conn):
+    """
+    全文索引改存 fold() 之后的姓名 / 项目：Müller 用 muller、mull、MÜLL 都能搜到
+    不再是外部内容表（内容来自 termins 原文，没法先规范化），索引自己存一份规范化的文本，
+    termin 里不到 3 个字符的词也在这份文本上用 LIKE 比较
+    """
+    conn.execute("DROP TABLE IF EXISTS termins_fts")
+    for name in ("termins_fts_ai", "termins_fts_ad", "termins_fts_au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.execute(SEARCH_INDEX_SQL.format(schema="main"))
+    conn.execute("""
+        CREATE TRIGGER termins_fts_ai AFTER INSERT ON termins BEGIN
+            INSERT INTO termins_fts (rowid, patient, services)
+            VALUES (new.rowid, fold(new.patient), fold(new.services));
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER termins_fts_ad AFTER DELETE ON termins BEGIN
+            DELETE FROM termins_fts WHERE rowid = old.rowid;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER termins_fts_au AFTER UPDATE OF patient, services ON termins BEGIN
+            UPDATE termins_fts SET patient = fold(new.patient), services = fold(new.services)
+            WHERE rowid = new.rowid;
+        END
+    """)
+    fill_search_index(conn)
+
+
+def fill_search_index(conn, schema="main"):
+    """
+    在调用方的事务里按 termins 重新填全文索引（VACUUM 之后 rowid 可能变化、批量导入删掉过触发器）
+    schema: ATTACH 进来的归档文件（见 archive.py）
+    """
+    for stmt in _statements(SEARCH_INDEX_FILL.format(schema=schema)):
+        conn.execute(stmt)
+
+
+def _add_version_column(conn):
+    existing = {r[1] for r in conn.execute("PRAGMA table_xinfo(termins)")}
+    if "version" not in existing:
+        conn.execute("ALTER TABLE termins ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+
+
+def _trigram_search_index(conn):
+    """
+    全文索引换成 trigram：unicode61 不会给中文分词，"三" / "三丰" 搜不到"张三丰"，"ller" 也搜不到"Müller"
+    trigram 按任意子串匹配（不区分大小写），但查询词至少要 3 个字符，更短的词由 termin 逐行比较
+    （变音符号见第 12 步）
+    """
+    conn.execute("DROP TABLE IF EXISTS termins_fts")   # 触发器按表名引用，重建后照样生效
+    for tokenize in ("trigram remove_diacritics 1", "trigram"):
+        try:
+            conn.execute(f"""
+                CREATE VIRTUAL TABLE termins_fts USING fts5(
+                    patient, services,
+                    content='termins', content_rowid='rowid',
+                    tokenize="{tokenize}"
+                )
+            """)
+            break
+        except sqlite3.OperationalError:
+            continue
+    conn.execute("INSERT INTO termins_fts(termins_fts) VALUES ('rebuild')")
+
+
+CHANGE_LOG_KEEP = 10_000
+
+
+MIGRATIONS = [
+    # 1: 初始表结构（旧库已存在该表，IF NOT EXISTS 保证兼容）
+    """
+    CREATE TABLE IF NOT EXISTS termins (
+        id TEXT PRIMARY KEY,
+        date TEXT,
+        planned_time TEXT,
+        patient TEXT,
+        status TEXT,
+        arrival_time TEXT,
+        leave_time TEXT,
+        services TEXT,
+        invoice_sent TEXT
+    );
+    """,
+    # 2: get_termins 的各种过滤 + ORDER BY date, planned_time 都能走索引，免去全表扫描和排序
+    """
+    CREATE INDEX IF NOT EXISTS idx_termins_date_time
+        ON termins (date, planned_time);
+    CREATE INDEX IF NOT EXISTS idx_termins_status_date
+        ON termins (status, date, planned_time);
+    CREATE INDEX IF NOT EXISTS idx_termins_invoice_date
+        ON termins (invoice_sent, date, planned_time);
+    """,
+    # 3: 姓名 / 项目全文索引（外部内容表，由触发器与 termins 同步）
+    #    unicode61 + remove_diacritics：Müller 也能用 muller 搜到；中文按前缀匹配（第 10 步换成了 trigram，第 12 步改存去掉变音符号的文本）
+    #    注意：termins 没有 INTEGER PRIMARY KEY，VACUUM 之后需要 rebuild_search_index()
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS termins_fts USING fts5(
+        patient, services,
+        content='termins', content_rowid='rowid',
+        tokenize="unicode61 remove_diacritics 2",
+        prefix='1 2 3'
+    );
+    CREATE TRIGGER IF NOT EXISTS termins_fts_ai AFTER INSERT ON termins BEGIN
+        INSERT INTO termins_fts(rowid, patient, services)
+        VALUES (new.rowid, new.patient, new.services);
+    END;
+    CREATE TRIGGER IF NOT EXISTS termins_fts_ad AFTER DELETE ON termins BEGIN
+        INSERT INTO termins_fts(termins_fts, rowid, patient, services)
+        VALUES ('delete', old.rowid, old.patient, old.services);
+    END;
+    CREATE TRIGGER IF NOT EXISTS termins_fts_au AFTER UPDATE OF patient, services ON termins BEGIN
+        INSERT INTO termins_fts(termins_fts, rowid, patient, services)
+        VALUES ('delete', old.rowid, old.patient, old.services);
+        INSERT INTO termins_fts(rowid, patient, services)
+        VALUES (new.rowid, new.patient, new.services);
+    END;
+    INSERT INTO termins_fts(termins_fts) VALUES ('rebuild');
+    """,
+    # 4: 排序键补上 id，keyset 分页 (date, planned_time, id) > (?, ?, ?) 可以直接走索引
+    """
+    DROP INDEX IF EXISTS idx_termins_date_time;
+    DROP INDEX IF EXISTS idx_termins_status_date;
+    DROP INDEX IF EXISTS idx_termins_invoice_date;
+    CREATE INDEX IF NOT EXISTS idx_termins_date_time_id
+        ON termins (date, planned_time, id);
+    CREATE INDEX IF NOT EXISTS idx_termins_status_date_id
+        ON termins (status, date, planned_time, id);
+    CREATE INDEX IF NOT EXISTS idx_termins_invoice_date_id
+        ON termins (invoice_sent, date, planned_time, id);
+    """,
+    # 5: 项目目录 + 预约-项目关联表；关联表冗余一份 date，按项目 + 日期统计只扫索引
+    #    termins.services 仍保留，作为显示和全文搜索用的文本
+    """
+    CREATE TABLE IF NOT EXISTS services (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE COLLATE NOCASE
+    );
+    CREATE TABLE IF NOT EXISTS termin_services (
+        termin_id TEXT NOT NULL,
+        service_id INTEGER NOT NULL REFERENCES services (id),
+        date TEXT,
+        PRIMARY KEY (termin_id, service_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_termin_services_service_date
+        ON termin_services (service_id, date, termin_id);
+    CREATE INDEX IF NOT EXISTS idx_termin_services_date
+        ON termin_services (date, service_id);
+    CREATE TRIGGER IF NOT EXISTS termin_services_ad AFTER DELETE ON termins BEGIN
+        DELETE FROM termin_services WHERE termin_id = old.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS termin_services_au_date AFTER UPDATE OF date ON termins BEGIN
+        UPDATE termin_services SET date = new.date WHERE termin_id = new.id;
+    END;
+    """ + SERVICES_BACKFILL_SQL.format(schema="main"),
+    # 6: 整数日期 / 分钟生成列（见 DERIVED_COLUMNS）
+    _add_derived_columns,
+    # 7: 重复预约。series 只存规则，每次预约在查询时按日期窗口现算（见 series.py）
+    #    series_exceptions 记录取消的日期（termin_id 为 NULL）和已经转成真实预约的日期
+    """
+    CREATE TABLE IF NOT EXISTS series (
+        id TEXT PRIMARY KEY,
+        patient TEXT NOT NULL,
+        planned_time TEXT NOT NULL,
+        services TEXT NOT NULL DEFAULT '',
+        start_date TEXT NOT NULL,
+        interval_weeks INTEGER NOT NULL DEFAULT 1 CHECK (interval_weeks >= 1),
+        count INTEGER CHECK (count IS NULL OR count >= 1),
+        until_date TEXT,
+        end_date TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_series_window ON series (start_date, end_date);
+    CREATE TABLE IF NOT EXISTS series_exceptions (
+        series_id TEXT NOT NULL,
+        date TEXT NOT NULL,
+        termin_id TEXT,
+        PRIMARY KEY (series_id, date)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_series_exceptions_date
+        ON series_exceptions (date, series_id);
+    """,
+    # 8: 乐观并发控制的行版本号，每次修改加一（见 termin.update_termin 的 expected_version）
+    _add_version_column,
+    # 9: 变更日志，由触发器维护；各窗口按 seq 轮询，只取变化的行（见 termin.get_changes）
+    #    termin_id 为 NULL 表示说不清哪些行变了（疗程规则、批量导入、还原备份），需要整体刷新
+    #    疗程里取消 / 转成真实行的某一次记成它现算的 id；只保留最近 CHANGE_LOG_KEEP 条
+    f"""
+    CREATE TABLE IF NOT EXISTS termin_changes (
+        seq INTEGER PRIMARY KEY,
+        termin_id TEXT
+    );
+    CREATE TRIGGER IF NOT EXISTS termin_changes_ai AFTER INSERT ON termins BEGIN
+        INSERT INTO termin_changes (termin_id) VALUES (new.id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS termin_changes_au AFTER UPDATE ON termins BEGIN
+        INSERT INTO termin_changes (termin_id) VALUES (new.id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS termin_changes_ad AFTER DELETE ON termins BEGIN
+        INSERT INTO termin_changes (termin_id) VALUES (old.id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS series_exceptions_changes_ai AFTER INSERT ON series_exceptions BEGIN
+        INSERT INTO termin_changes (termin_id) VALUES ('series:' || new.series_id || ':' || new.date);
+    END;
+    CREATE TRIGGER IF NOT EXISTS series_exceptions_changes_ad AFTER DELETE ON series_exceptions BEGIN
+        INSERT INTO termin_changes (termin_id) VALUES ('series:' || old.series_id || ':' || old.date);
+    END;
+    CREATE TRIGGER IF NOT EXISTS series_changes_ai AFTER INSERT ON series BEGIN
+        INSERT INTO termin_changes (termin_id) VALUES (NULL);
+    END;
+    CREATE TRIGGER IF NOT EXISTS series_changes_au AFTER UPDATE ON series BEGIN
+        INSERT INTO termin_changes (termin_id) VALUES (NULL);
+    END;
+    CREATE TRIGGER IF NOT EXISTS series_changes_ad AFTER DELETE ON series BEGIN
+        INSERT INTO termin_changes (termin_id) VALUES (NULL);
+    END;
+    CREATE TRIGGER IF NOT EXISTS termin_changes_trim AFTER INSERT ON termin_changes BEGIN
+        DELETE FROM termin_changes WHERE seq <= new.seq - {CHANGE_LOG_KEEP};
+    END;
+    """,
+    # 10: 全文索引改用 trigram（子串匹配，中文也能搜）
+    _trigram_search_index,
+    # 11: 批量导入时暂时删掉的索引 / 触发器的 DDL（见 defer_secondary_schema），导入中途崩溃也能恢复
+    """
+    CREATE TABLE IF NOT EXISTS deferred_schema (
+        name TEXT PRIMARY KEY,
+        type TEXT NOT NULL,
+        sql TEXT NOT NULL
+    );
+    """,
+    # 12: 全文索引存去掉变音符号的文本
+    _folded_search_index,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def _ensure_schema(conn):
+    global _schema_ready
+    with _schema_lock:
+        if _schema_ready:
+            return
+        migrate(conn)
+        if conn.execute("SELECT 1 FROM deferred_schema LIMIT 1").fetchone():
+            # 上次批量导入没走到重建那一步（进程被杀 / 崩溃），或者别的进程正在导入：
+            # 先把索引和触发器补回来，不然查询会全表扫描、全文索引和变更日志也不再同步
+            # 这里可能已经拿着写锁（写连接第一次打开时），所以直接在 conn 上开事务，和 migrate 一样
+            _begin_immediate(conn)
+            try:
+                _restore_deferred(conn)
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+        _schema_ready = True
+
+
+def migrate(conn):
+    """把 conn 所在的数据库升级到 SCHEMA_VERSION，返回升级前的版本号"""
+    _register_functions(conn)   # 也可能是 _open_conn 以外打开的连接（测试、工具脚本）
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for i in range(version, SCHEMA_VERSION):
+        step = MIGRATIONS[i]
+        if callable(step):
+            conn.commit()
+            conn.execute("BEGIN")
+            try:
+                step(conn)
+                conn.execute(f"PRAGMA user_version = {i + 1}")
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            continue
+        # executescript 会先提交当前事务，这里显式包一层事务保证每一步原子
+        conn.executescript(
+            "BEGIN;\n" + step + f"\nPRAGMA user_version = {i + 1};\nCOMMIT;"
+        )
+    return version
+
+
+def init_db():
+    """确保表结构为最新版本；每个进程只真正执行一次"""
+    if not _schema_ready:
+        _ensure_schema(get_conn())
+
+
+def mark_all_changed(conn):
+    """批量导入 / 还原备份之后调用：变更日志里记一条"全部都变了"，各窗口会整体刷新"""
+    conn.execute("INSERT INTO termin_changes (termin_id) VALUES (NULL)")
+
+
+def invalidate_caches():
+    """
+    本进程通过 write_conn() 做了不按日期失效的大批量写入（批量导入等）之后调用：
+    data_version() 换一个值，所有按它缓存的结果（termin / schedule）都会丢掉
+    """
+    global _foreign_gen
+    with _version_lock:
+        _foreign_gen += 1
+
+
+def _statements(script):
+    """把多条语句的脚本拆开，好在 write_conn() 的事务里逐条执行（executescript 会先提交）"""
+    stmt = ""
+    for line in script.splitlines(keepends=True):
+        stmt += line
+        if sqlite3.complete_statement(stmt):
+            if stmt.strip():
+                yield stmt
+            stmt = ""
+
+
+def rebuild_search_index():
+    """按 termins 表重建全文索引（VACUUM 之后 rowid 可能变化时调用）"""
+    with write_conn() as conn:
+        fill_search_index(conn)
+
+
+def rebuild_services_index():
+    """按 termins.services 重建整个项目关联表（平时由 termin.py 和 importer.py 随每次写入维护，这里用于修复）"""
+    with write_conn() as conn:
+        backfill_services(conn)
+
+
+def backfill_services(conn, schema="main"):
+    """在调用方的事务里按 termins.services 重建整个项目关联表"""
+    for stmt in _statements(SERVICES_BACKFILL_SQL.format(schema=schema)):
+        conn.execute(stmt)
+
+
+# ----------------- 批量导入时延后建索引 -----------------
+def defer_secondary_schema():
+    """
+    删掉 termins 上的二级索引和触发器，返回删掉的个数；之后必须调用 restore_secondary_schema()
+    DDL 和删除在同一个事务里先存进 deferred_schema 表：进程中途被杀时，
+    下一个打开数据库的进程会在 _ensure_schema 里补回来
+    """
+    with write_conn() as conn:
+        objs = conn.execute("""
+            SELECT type, name, sql FROM sqlite_master
+            WHERE tbl_name = 'termins' AND type IN ('index', 'trigger') AND sql IS NOT NULL
+        """).fetchall()
+        conn.executemany(
+            "INSERT OR REPLACE INTO deferred_schema (name, type, sql) VALUES (?, ?, ?)",
+            [(o["name"], o["type"], o["sql"]) for o in objs]
+        )
+        for o in objs:
+            conn.execute(f'DROP {o["type"].upper()} IF EXISTS "{o["name"]}"')
+    return len(objs)
+
+
+def restore_secondary_schema():
+    """重建 defer_secondary_schema() 删掉的索引和触发器，并按 termins 重建全文索引"""
+    with write_conn() as conn:
+        _restore_deferred(conn)
+
+
+def _restore_deferred(conn):
+    """在调用方的写事务里执行；已经存在的（别的进程先补回来了）跳过"""
+    existing = {r[0] for r in conn.execute("SELECT name FROM sqlite_master")}
+    for r in conn.execute("SELECT name, sql FROM deferred_schema").fetchall():
+        if r["name"] not in existing:
+            conn.execute(r["sql"])
+    conn.execute("DELETE FROM deferred_schema")
+    # 删掉期间写入的行没有进全文索引和变更日志（项目关联表由导入程序逐批维护，不受影响）
+    fill_search_index(conn)
+    mark_all_changed(conn)
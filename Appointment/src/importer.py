@@ -0,0 +1,242 @@
+"""
+CSV → SQLite 批量导入
+
+    python importer.py data/termins.csv [--rejects 拒绝行.csv] [--batch-size N]
+
+- 流式读取 CSV，分批 executemany，每批一个事务
+- 日期 / 时间 / 项目统一成数据库里的格式，无法识别的行写到旁边的 *.rejects.csv
+- 项目关联表（按项目统计用）和每批行在同一个事务里更新，和是否延后建索引无关
+- 导入期间先删掉 termins 上的二级索引和触发器，导入完成后重建（含全文索引）；
+  删掉的 DDL 存在数据库里，中途被杀的话下次打开数据库时自动补回来（见 db.defer_secondary_schema）
+- 和其它写入一样走 db.write_conn()（进程内唯一的写连接 + BEGIN IMMEDIATE）
+"""
+import argparse
+import csv
+import sys
+import uuid
+from functools import lru_cache
+from itertools import islice
+from pathlib import Path
+
+from db import (
+    defer_secondary_schema, init_db, invalidate_caches, mark_all_changed, restore_secondary_schema, write_conn
+)
+
+BATCH_SIZE = 20000
+
+FIELDS = (
+    "id", "date", "planned_time", "patient", "status",
+    "arrival_time", "leave_time", "services", "invoice_sent"
+)
+
+_YES = {"yes", "y", "ja", "true", "1", "是"}
+_NO = {"no", "n", "nein", "false", "0", "否", ""}
+
+
+class RowError(ValueError):
+    pass
+
+
+# ----------------- 单字段规范化 -----------------
+# 同一个诊所的日期 / 时间重复率极高，缓存后百万行也只解析几千次
+@lru_cache(maxsize=65536)
+def normalize_date(s: str) -> str:
+    """YYYY-MM-DD / DD-MM-YYYY / DD.MM.YYYY → YYYY-MM-DD"""
+    s = s.strip()
+    for sep in ("-", ".", "/"):
+        parts = s.split(sep)
+        if len(parts) == 3:
+            break
+    else:
+        raise RowError(f"无法识别的日期: {s!r}")
+
+    if len(parts[0]) == 4:
+        y, m, d = parts
+    else:
+        d, m, y = parts
+    try:
+        y, m, d = int(y), int(m), int(d)
+    except ValueError:
+        raise RowError(f"无法识别的日期: {s!r}") from None
+
+    if not (1900 <= y <= 2999 and 1 <= m <= 12 and 1 <= d <= _days_in_month(y, m)):
+        raise RowError(f"日期超出范围: {s!r}")
+    return f"{y:04d}-{m:02d}-{d:02d}"
+
+
+def _days_in_month(y, m):
+    if m == 2:
+        return 29 if (y % 4 == 0 and y % 100 != 0) or y % 400 == 0 else 28
+    return 30 if m in (4, 6, 9, 11) else 31
+
+
+@lru_cache(maxsize=4096)
+def normalize_time(s: str, required=False) -> str:
+    """H:MM / HH:MM / HH:MM:SS → HH:MM；空字符串原样返回（除非 required）"""
+    s = s.strip()
+    if not s:
+        if required:
+            raise RowError("缺少时间")
+        return ""
+    parts = s.replace(".", ":").split(":")
+    try:
+        h, m = int(parts[0]), int(parts[1])
+    except (ValueError, IndexError):
+        raise RowError(f"无法识别的时间: {s!r}") from None
+    if not (0 <= h <= 23 and 0 <= m <= 59):
+        raise RowError(f"时间超出范围: {s!r}")
+    return f"{h:02d}:{m:02d}"
+
+
+@lru_cache(maxsize=4096)
+def normalize_services(s: str) -> str:
+    s = (s or "").replace("，", ";").replace(",", ";")
+    return ";".join(x.strip() for x in s.split(";") if x.strip())
+
+
+def normalize_row(r: dict) -> tuple:
+    """返回按 FIELDS 顺序排列的元组，无法修正的行抛出 RowError"""
+    patient = (r.get("patient") or "").strip()
+    if not patient:
+        raise RowError("缺少姓名")
+
+    arrival = normalize_time(r.get("arrival_time") or "")
+    leave = normalize_time(r.get("leave_time") or "")
+
+    status = (r.get("status") or "").strip().lower()
+    if status not in ("arrived", "scheduled"):
+        if status:
+            raise RowError(f"未知状态: {status!r}")
+        status = "arrived" if arrival else "scheduled"
+
+    invoice = (r.get("invoice_sent") or "").strip().lower()
+    if invoice in _YES:
+        invoice = "yes"
+    elif invoice in _NO:
+        invoice = "no"
+    else:
+        raise RowError(f"未知账单状态: {invoice!r}")
+
+    return (
+        (r.get("id") or "").strip() or uuid.uuid4().hex,
+        normalize_date(r.get("date") or ""),
+        normalize_time(r.get("planned_time") or "", required=True),
+        patient,
+        status,
+        arrival,
+        leave,
+        normalize_services(r.get("services") or ""),
+        invoice,
+    )
+
+
+# ----------------- 导入 -----------------
+_ID, _DATE, _SERVICES = (FIELDS.index(c) for c in ("id", "date", "services"))
+
+
+def _sync_services(conn, rows):
+    """这一批行的项目关联（同 termin._set_services_many；services 已经由 normalize_services 规范化）"""
+    conn.executemany("DELETE FROM termin_services WHERE termin_id = ?", [(r[_ID],) for r in rows])
+    links = [(r[_ID], r[_DATE], name) for r in rows if r[_SERVICES] for name in r[_SERVICES].split(";")]
+    if not links:
+        return
+    conn.executemany("INSERT OR IGNORE INTO services (name) VALUES (?)", {(name,) for _, _, name in links})
+    conn.executemany("""
+        INSERT OR IGNORE INTO termin_services (termin_id, service_id, date)
+        SELECT ?, id, ? FROM services WHERE name = ?
+    """, links)
+
+
+def default_rejects_path(csv_path):
+    csv_path = Path(csv_path)
+    return csv_path.with_name(csv_path.stem + ".rejects.csv")
+
+
+def import_csv(csv_path, rejects_path=None, batch_size=BATCH_SIZE, defer_indexes=True, progress=None):
+    """
+    导入 CSV，已存在的 id 会被覆盖（与旧的 migrate_csv_to_db.py 一致）
+    rejects_path: 被拒绝的行写到这里，默认 <csv>.rejects.csv（没有拒绝行时不创建）
+    progress:     progress(已导入行数, 已拒绝行数)，每批调用一次
+    返回 (导入行数, 拒绝行数)
+    """
+    csv_path = Path(csv_path)
+    rejects_path = Path(rejects_path or default_rejects_path(csv_path))
+
+    init_db()
+    deferred = defer_secondary_schema() if defer_indexes else 0
+
+    imported = rejected = 0
+    rejects_file = rejects_writer = None
+    # 覆盖已有行时 version 加一，界面上拿着旧版本的修改会发现冲突（见 termin.update_termin）
+    sql = (
+        f"INSERT INTO termins ({', '.join(FIELDS)}) VALUES ({', '.join('?' * len(FIELDS))})"
+        f" ON CONFLICT (id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in FIELDS[1:])},"
+        " version = version + 1"
+    )
+
+    try:
+        with csv_path.open(newline="", encoding="utf-8-sig") as f:
+            reader = csv.DictReader(f)
+            line_no = 1
+            while True:
+                chunk = list(islice(reader, batch_size))
+                if not chunk:
+                    break
+
+                good = []
+                for r in chunk:
+                    line_no += 1
+                    try:
+                        good.append(normalize_row(r))
+                    except RowError as e:
+                        if rejects_writer is None:
+                            rejects_file = rejects_path.open("w", newline="", encoding="utf-8-sig")
+                            rejects_writer = csv.writer(rejects_file)
+                            rejects_writer.writerow(["line", "error"] + list(reader.fieldnames))
+                        rejects_writer.writerow([line_no, str(e)] + [r.get(k, "") for k in reader.fieldnames])
+                        rejected += 1
+
+                with write_conn() as conn:
+                    conn.executemany(sql, good)
+                    _sync_services(conn, good)
+                imported += len(good)
+                if progress:
+                    progress(imported, rejected)
+    finally:
+        if rejects_file is not None:
+            rejects_file.close()
+        if deferred:
+            restore_secondary_schema()   # 导入期间变更日志的触发器也被删掉了，这里会记一条"全部都变了"
+        else:
+            with write_conn() as conn:
+                mark_all_changed(conn)
+        invalidate_caches()
+
+    return imported, rejected
+
+
+def main(argv=None, default_csv=None):
+    ap = argparse.ArgumentParser(description="把 CSV 批量导入 termins 数据库")
+    ap.add_argument("csv", nargs="?" if default_csv else None, default=default_csv,
+                    help="要导入的 CSV 文件")
+    ap.add_argument("--rejects", help="被拒绝的行写到这里（默认 <csv>.rejects.csv）")
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="每个事务的行数")
+    ap.add_argument("--keep-indexes", action="store_true",
+                    help="导入期间保留索引（少量数据时更快）")
+    args = ap.parse_args(argv)
+
+    def show(done, bad):
+        print(f"\r已导入 {done} 行，拒绝 {bad} 行", end="", file=sys.stderr, flush=True)
+
+    imported, rejected = import_csv(
+        args.csv, args.rejects, args.batch_size,
+        defer_indexes=not args.keep_indexes, progress=show
+    )
+    print(file=sys.stderr)
+    print(f"✅ CSV → SQLite 导入完成：{imported} 行")
+    if rejected:
+        print(f"⚠ 拒绝 {rejected} 行，详见 {args.rejects or default_rejects_path(args.csv)}")
+
+
+if __name__ == "__main__":
+    main()
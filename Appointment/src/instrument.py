@@ -0,0 +1,332 @@
+"""
+性能埋点（默认关闭）
+
+设置环境变量 TERMIN_PERF=1 后启动程序即开启，记录三类事件到滚动日志 <数据目录>/logs/perf.log：
+- call: termin.py 里访问数据库的函数（termin.TIMED_FUNCTIONS）的耗时，以及其中花在 SQLite 里的时间和语句数
+        （总耗时减去 sql_ms 就是 Python 里转换行、拼结果的时间）
+- sql:  每条语句的耗时（执行 + 取完所有行）和行数
+- span: 界面上的操作，例如表格刷新、时间轴重画，以及其中 Tk 插入 / 绘制的部分
+
+    python main_cli.py perf [--top 20]      # 最慢的操作和每种操作的分位数
+
+关闭时 timed / span 等都直接返回原函数或空上下文，几乎没有额外开销
+"""
+import functools
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+ENABLED = os.environ.get("TERMIN_PERF", "") not in ("", "0")
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 3
+SQL_TEXT_MAX = 200
+
+_local = threading.local()
+_logger = None
+_logger_lock = threading.Lock()
+
+
+def log_file():
+    from db import get_app_data_dir   # 延迟导入：db 本身也要用这个模块
+    return get_app_data_dir() / "logs" / "perf.log"
+
+
+def _get_logger():
+    global _logger
+    with _logger_lock:
+        if _logger is None:
+            # 延迟导入：没开埋点时启动不用加载 logging
+            import logging
+            from logging.handlers import RotatingFileHandler
+
+            path = log_file()
+            path.parent.mkdir(exist_ok=True)
+            handler = RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger = logging.getLogger("termin.perf")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(handler)
+            _logger = logger
+    return _logger
+
+
+def record(kind, name, ms, **extra):
+    event = {"t": round(time.time(), 3), "kind": kind, "name": name, "ms": round(ms, 3),
+             "thread": threading.current_thread().name, **extra}
+    _get_logger().info(json.dumps(event, ensure_ascii=False))
+
+
+# ----------------- 函数 / 界面操作 -----------------
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+@contextmanager
+def _measure(kind, name):
+    # 每一层记下自己的 SQL 时间和语句数，嵌套调用时外层也会算上内层的
+    frame = {"name": name, "sql_ms": 0.0, "statements": 0}
+    stack = _stack()
+    stack.append(frame)
+    start = time.perf_counter()
+    try:
+        yield frame
+    finally:
+        ms = (time.perf_counter() - start) * 1e3
+        stack.pop()
+        if stack:
+            stack[-1]["sql_ms"] += frame["sql_ms"]
+            stack[-1]["statements"] += frame["statements"]
+        record(kind, name, ms, sql_ms=round(frame["sql_ms"], 3), statements=frame["statements"])
+
+
+def span(name):
+    """with span("ui.refresh.apply"): ... 只在开启时计时"""
+    if not ENABLED:
+        return nullcontext()
+    return _measure("span", name)
+
+
+def record_since(name, start, **extra):
+    """异步操作（比如表格刷新跨了后台线程）从 start = time.perf_counter() 算到现在"""
+    if ENABLED:
+        record("span", name, (time.perf_counter() - start) * 1e3, **extra)
+
+
+def timed(fn, name=None):
+    """开启时返回计时包装后的函数，否则原样返回"""
+    if not ENABLED:
+        return fn
+    name = name or f"{fn.__module__}.{fn.__name__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with _measure("call", name):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def instrument_module(namespace, names):
+    """
+    把 names 列出的函数换成计时版本（在模块末尾用 globals() 调用）
+    只列访问数据库的入口：parse_services、page_key 这类小工具一次调用不到一微秒，
+    在表格刷新里每行都要调，包上一层反而让它们占满日志、拖慢被测的操作
+    """
+    if not ENABLED:
+        return
+    for attr in names:
+        namespace[attr] = timed(namespace[attr])
+
+
+# ----------------- SQL -----------------
+_WS = re.compile(r"\s+")
+
+
+def _sql_text(sql):
+    return _WS.sub(" ", sql).strip()[:SQL_TEXT_MAX]
+
+
+def _trace(statement):
+    # set_trace_callback 每开始执行一条语句（含触发器里的语句、executescript 里的每一条）调一次
+    stack = getattr(_local, "stack", None)
+    if stack:
+        stack[-1]["statements"] += 1
+
+
+class TracedCursor(sqlite3.Cursor):
+    """计每条语句从执行到取完所有行花在 SQLite 里的时间；行转换等 Python 时间不算在内"""
+
+    _pending = None
+
+    def _finish(self):
+        pending = self._pending
+        if pending is None:
+            return
+        self._pending = None
+        sql, ms, rows = pending
+        stack = _stack()
+        if stack:
+            stack[-1]["sql_ms"] += ms
+        record("sql", sql, ms, rows=rows, op=stack[-1]["name"] if stack else None)
+
+    def _timed_step(self, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        if self._pending is not None:
+            sql, ms, rows = self._pending
+            self._pending = (sql, ms + (time.perf_counter() - start) * 1e3, rows)
+        return result
+
+    def _count(self, n):
+        if self._pending is not None:
+            sql, ms, rows = self._pending
+            self._pending = (sql, ms, rows + n)
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        self._pending = (_sql_text(sql), (time.perf_counter() - start) * 1e3, 0)
+        if self.description is None:   # 不返回行的语句
+            self._count(max(self.rowcount, 0))
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._pending = (_sql_text(sql), (time.perf_counter() - start) * 1e3, max(self.rowcount, 0))
+        self._finish()
+        return self
+
+    def executescript(self, sql_script):
+        self._finish()
+        start = time.perf_counter()
+        super().executescript(sql_script)
+        self._pending = (_sql_text(sql_script), (time.perf_counter() - start) * 1e3, 0)
+        self._finish()
+        return self
+
+    def fetchone(self):
+        row = self._timed_step(super().fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._count(1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed_step(super().fetchmany, size or self.arraysize)
+        self._count(len(rows))
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed_step(super().fetchall)
+        self._count(len(rows))
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self._timed_step(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        self._count(1)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # 只取了一行就丢掉的游标（fetchone 取单行）在这里补记
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class TracedConnection(sqlite3.Connection):
+    """所有游标都换成 TracedCursor；conn.execute() 等快捷方法也改走游标的 execute"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(_trace)
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def connection_factory():
+    return TracedConnection if ENABLED else sqlite3.Connection
+
+
+# ----------------- 汇总 -----------------
+def load_events(path=None):
+    """读取日志（含滚动出去的旧文件），按时间顺序返回事件"""
+    path = path or log_file()
+    files = [path.with_name(f"{path.name}.{i}") for i in range(LOG_BACKUPS, 0, -1)] + [path]
+    events = []
+    for f in files:
+        if not f.exists():
+            continue
+        with f.open(encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    continue   # 写到一半的行
+    return events
+
+
+def _percentile(sorted_ms, p):
+    if not sorted_ms:
+        return 0.0
+    k = max(0, min(len(sorted_ms) - 1, round(p / 100 * len(sorted_ms) + 0.5) - 1))
+    return sorted_ms[k]
+
+
+def summarize(events, kinds=("call", "span", "sql")):
+    """按 (kind, name) 分组：次数、总耗时、p50 / p95 / p99 / 最大值、平均 SQL 占比"""
+    groups = {}
+    for e in events:
+        if e.get("kind") in kinds:
+            groups.setdefault((e["kind"], e["name"]), []).append(e)
+
+    out = []
+    for (kind, name), evs in groups.items():
+        ms = sorted(e["ms"] for e in evs)
+        total = sum(ms)
+        sql_ms = sum(e.get("sql_ms", 0) for e in evs)
+        out.append({
+            "kind": kind, "name": name, "count": len(ms), "total_ms": total,
+            "p50": _percentile(ms, 50), "p95": _percentile(ms, 95), "p99": _percentile(ms, 99),
+            "max": ms[-1],
+            "sql_share": sql_ms / total if kind != "sql" and total else None,
+            "rows": sum(e.get("rows", 0) for e in evs) if kind == "sql" else None,
+        })
+    out.sort(key=lambda g: g["total_ms"], reverse=True)
+    return out
+
+
+def print_summary(top=20, kinds=("call", "span", "sql"), path=None):
+    events = load_events(path)
+    if not events:
+        print(f"没有性能记录。用 TERMIN_PERF=1 启动程序后再看（日志：{path or log_file()}）")
+        return
+
+    slowest = sorted((e for e in events if e.get("kind") in kinds), key=lambda e: e["ms"], reverse=True)
+    print(f"最慢的 {top} 次操作：")
+    for e in slowest[:top]:
+        extra = f"  rows={e['rows']}" if "rows" in e else f"  sql={e.get('sql_ms', 0):.1f}ms"
+        when = time.strftime("%m-%d %H:%M:%S", time.localtime(e["t"]))
+        print(f"  {e['ms']:9.1f} ms  {when}  {e['kind']:4}  {e['name'][:80]}{extra}")
+
+    print()
+    print(f"{'kind':5} {'count':>7} {'total ms':>10} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'SQL%':>5}  name")
+    for g in summarize(events, kinds)[:max(top, 1) * 2]:
+        share = f"{g['sql_share'] * 100:4.0f}%" if g["sql_share"] is not None else "    -"
+        print(
+            f"{g['kind']:5} {g['count']:7} {g['total_ms']:10.1f} {g['p50']:8.2f} {g['p95']:8.2f}"
+            f" {g['p99']:8.2f} {g['max']:8.2f} {share}  {g['name'][:80]}"
+        )
@@ -1,24 +1,41 @@
-from backup import auto_backup
-
-def main():
-    from termin import add_termin, get_termins  # 延迟导入（关键）
-
-    while True:
-        print("1 新建  2 查看  0 退出")
-        c = input("> ")
-
-        if c == "1":
-            print(add_termin(
-                input("姓名: "),
-                input("日期 DD-MM-YYYY: "),
-                input("时间 HH:MM: ")
-            ))
-        elif c == "2":
-            for r in get_termins():
-                print(r)
-        elif c == "0":
-            break
-
-if __name__ == "__main__":
-    auto_backup()   # ⭐ 第一件事：备份
-    main()
\ No newline at end of file
+import sys
+from backup import auto_backup
+
+def main():
+    from termin import add_termin, get_termins  # 延迟导入（关键）
+
+    while True:
+        print("1 新建  2 查看  0 退出")
+        c = input("> ")
+
+        if c == "1":
+            print(add_termin(
+                input("姓名: "),
+                input("日期 DD-MM-YYYY: "),
+                input("时间 HH:MM: ")
+            ))
+        elif c == "2":
+            for r in get_termins():
+                print(r)
+        elif c == "0":
+            break
+
+def perf_summary(argv):
+    """python main_cli.py perf [--top N] [--kind call|span|sql]"""
+    import argparse
+    from instrument import print_summary
+
+    ap = argparse.ArgumentParser(
+        prog="main_cli.py perf", description="性能记录汇总（先用 TERMIN_PERF=1 运行程序收集）"
+    )
+    ap.add_argument("--top", type=int, default=20, help="列出最慢的多少次操作")
+    ap.add_argument("--kind", action="append", choices=["call", "span", "sql"], help="只看这类事件，可重复")
+    args = ap.parse_args(argv)
+    print_summary(top=args.top, kinds=tuple(args.kind or ("call", "span", "sql")))
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["perf"]:
+        perf_summary(sys.argv[2:])
+    else:
+        auto_backup()   # ⭐ 第一件事：备份
+        main()
\ No newline at end of file
@@ -1,10 +1,47 @@
-from backup import auto_backup
-
-def main():
-    from ui import TerminApp
-    app = TerminApp()
-    app.mainloop()
-
-if __name__ == "__main__":
-    auto_backup()   # ⭐ 先备份
-    main()
\ No newline at end of file
+"""
+图形界面入口
+
+    python main_gui.py                     # 正常启动
+    python main_gui.py --profile-startup   # 第一页数据画出来后打印启动各阶段耗时，然后退出
+                                           # （第一次查询失败时带上 error，退出码为 1）
+
+启动顺序：先建窗口、在后台线程查第一页（第一次取连接时才检查 / 升级表结构），
+画出来之后才开始自动备份，备份不再和第一次查询抢磁盘
+"""
+import json
+import os
+import sys
+import time
+
+_START = time.perf_counter()
+
+
+def _ms():
+    return round((time.perf_counter() - _START) * 1000, 1)
+
+
+def _after_first_paint(app, marks, profile, error=None):
+    marks["first_paint_ms"] = _ms()
+    if error is not None:
+        marks["error"] = str(error)
+    if profile:
+        print(json.dumps(marks), flush=True)
+        app.destroy()
+        return
+    if not os.environ.get("TERMIN_SERVER"):
+        from backup import auto_backup
+        auto_backup()   # ⭐ 画出来之后再备份（连服务器时由服务器那台电脑备份）
+
+
+def main(profile=False):
+    marks = {}
+    from ui import TerminApp
+    marks["import_ms"] = _ms()
+    app = TerminApp(on_first_paint=lambda error: _after_first_paint(app, marks, profile, error))
+    marks["window_ms"] = _ms()
+    app.mainloop()
+    return 1 if profile and "error" in marks else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(profile="--profile-startup" in sys.argv[1:]))
@@ -1,19 +1,8 @@
-import csv
-from db import get_conn, init_db
-from pathlib import Path
-
-CSV_FILE = Path(__file__).resolve().parent.parent / "data" / "termins.csv"
-
-init_db()
-
-with get_conn() as conn, open(CSV_FILE, newline="", encoding="utf-8") as f:
-    reader = csv.DictReader(f)
-    for r in reader:
-        conn.execute("""
-        INSERT OR REPLACE INTO termins
-        VALUES (:id, :date, :planned_time, :patient,
-                :status, :arrival_time, :leave_time,
-                :services, :invoice_sent)
-        """, r)
-
-print("✅ CSV → SQLite 迁移完成")
+from pathlib import Path
+from importer import main
+
+CSV_FILE = Path(__file__).resolve().parent.parent / "data" / "termins.csv"
+
+# 旧入口：不带参数时仍导入 data/termins.csv，其余参数见 importer.py
+if __name__ == "__main__":
+    main(default_csv=str(CSV_FILE))
@@ -0,0 +1,262 @@
+"""
+排班引擎：按天建立占用区间，回答“这个时间段空不空”“从某天起最近的 N 个空档”
+
+- 每天一个 DaySchedule：按开始时间排好的区间列表 + 一个按分钟记的占用位图（Python int）
+  判断空闲只是一次位与运算，与当天预约数无关
+- 区间优先用实际到达/离开时间，没有时按预约时间 + DEFAULT_DURATION_MIN
+- 重复预约（series）现算出来的每一次也算占用
+- 数据只按天缓存，写入时由 termin 按日期失效，其它进程写入时靠 data_version 整体失效
+- 时间解析不了的旧数据（空的预约时间、"25:99" 之类）不算占用，跳过
+"""
+import re
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import series
+from db import get_conn, data_version
+
+DEFAULT_DURATION_MIN = 90
+DAY_START_MIN = 8 * 60          # 找空档时只在营业时间内找
+DAY_END_MIN = 20 * 60
+SLOT_STEP_MIN = 15              # 候选开始时间的间隔
+OPEN_WEEKDAYS = (0, 1, 2, 3, 4, 5)   # 周一到周六
+MAX_SEARCH_DAYS = 366           # 没给结束日期时最多往后找多少天
+LOAD_CHUNK_DAYS = 31            # 找空档时一次从数据库读多少天
+
+CONFLICT_MSG = "时间冲突"
+
+MINUTES_PER_DAY = 24 * 60
+
+_SPAN_COLUMNS = "id, date, patient, planned_time, arrival_time, leave_time, planned_min, arrival_min, leave_min"
+
+
+# ----------------- 区间 -----------------
+_HM_RE = re.compile(r"(\d{1,2}):(\d{2})")
+
+
+def normalize_hm(t) -> str:
+    """
+    "9:05" / "09:05" → "09:05"；不是合法时间（00–23 点、00–59 分）时抛出 ValueError
+    写入数据库之前都要经过这里：*_min 生成列和按 planned_time 排序都假定是严格的 HH:MM
+    """
+    m = _HM_RE.fullmatch(t.strip()) if isinstance(t, str) else None
+    if m is None or int(m[1]) > 23 or int(m[2]) > 59:
+        raise ValueError(f"时间格式错误: {t!r}")
+    return f"{int(m[1]):02d}:{m[2]}"
+
+
+def to_min(t) -> int:
+    """HH:MM（或已经是分钟数）→ 当天第几分钟；格式不对时抛出 ValueError"""
+    if isinstance(t, int):
+        return t
+    h, m = normalize_hm(t).split(":")
+    return int(h) * 60 + int(m)
+
+
+def min_to_hm(m: int) -> str:
+    return f"{m // 60:02d}:{m % 60:02d}"
+
+
+def appt_span(r):
+    """
+    返回预约占用的 (开始分钟, 结束分钟)；r 里有 *_min 列时直接用，否则解析字符串
+    连预约时间都解析不了（旧数据）时返回 None，调用方跳过这一行
+    """
+    start = r.get("arrival_min")
+    end = r.get("leave_min")
+    if start is None and "arrival_min" not in r and r.get("arrival_time") and r.get("leave_time"):
+        try:
+            start, end = to_min(r["arrival_time"]), to_min(r["leave_time"])
+        except ValueError:
+            start = end = None
+    if start is not None and end is not None and end > start:
+        return start, end
+    s = r.get("planned_min")
+    if s is None:
+        try:
+            s = to_min(r["planned_time"])
+        except ValueError:
+            return None
+    return s, s + DEFAULT_DURATION_MIN
+
+
+def _mask(start, end):
+    start = max(start, 0)
+    end = min(end, MINUTES_PER_DAY)
+    if end <= start:
+        return 0
+    return ((1 << (end - start)) - 1) << start
+
+
+class DaySchedule:
+    __slots__ = ("date", "intervals", "starts", "busy")
+
+    def __init__(self, date_iso, rows=()):
+        self.date = date_iso
+        self.intervals = sorted((*span, r["id"]) for r in rows for span in [appt_span(r)] if span)
+        self.starts = [s for s, _, _ in self.intervals]
+        busy = 0
+        for s, e, _ in self.intervals:
+            busy |= _mask(s, e)
+        self.busy = busy
+
+    def is_free(self, start, length=DEFAULT_DURATION_MIN):
+        return not (self.busy & _mask(start, start + length))
+
+    def conflicts(self, start, end, exclude_id=None):
+        """与 [start, end) 重叠的预约 id"""
+        # 开始时间 >= end 的区间不可能重叠；再往前的区间要看结束时间
+        hi = bisect_left(self.starts, end)
+        return [tid for s, e, tid in self.intervals[:hi] if e > start and tid != exclude_id]
+
+    def free_slots(self, length=DEFAULT_DURATION_MIN, step=SLOT_STEP_MIN,
+                   day_start=DAY_START_MIN, day_end=DAY_END_MIN):
+        """按时间顺序生成当天可用的开始分钟"""
+        window = _mask(day_start, day_end)
+        if self.busy & window == window:
+            return   # 整天排满，排满的日历上大部分日子走这里
+        m = day_start
+        while m + length <= day_end:
+            blocked = self.busy & _mask(m, m + length)
+            if not blocked:
+                yield m
+                m += step
+                continue
+            # 跳到挡住的那段占用之后，再对齐到 step
+            last_busy = blocked.bit_length()
+            m += -(-(last_busy - m) // step) * step
+
+
+# ----------------- 按天缓存 -----------------
+CACHE_MAX_DAYS = 2048
+
+_days = OrderedDict()
+_days_lock = threading.Lock()
+_days_version = None
+_days_gen = 0
+
+
+def invalidate(*dates):
+    """termin 写入后调用，丢掉这些日期的缓存"""
+    global _days_gen
+    with _days_lock:
+        _days_gen += 1
+        for d in dates:
+            if d:
+                _days.pop(d, None)
+
+
+def clear_cache():
+    global _days_gen
+    with _days_lock:
+        _days.clear()
+        _days_gen += 1
+
+
+def _check_version():
+    global _days_version, _days_gen
+    v = data_version()   # 在锁外取，避免和写锁互相等待
+    with _days_lock:
+        if v != _days_version:
+            _days_version = v
+            _days.clear()
+            _days_gen += 1
+        return _days_gen
+
+
+def _load(date_from, date_to):
+    """保证 [date_from, date_to] 每一天都在缓存里，返回 {日期: DaySchedule}"""
+    gen = _check_version()
+    d0, d1 = date.fromisoformat(date_from), date.fromisoformat(date_to)
+    wanted = [(d0 + timedelta(days=i)).isoformat() for i in range((d1 - d0).days + 1)]
+
+    with _days_lock:
+        found = {d: _days[d] for d in wanted if d in _days}
+    missing = [d for d in wanted if d not in found]
+    if not missing:
+        return found
+
+    conn = get_conn()
+    rows = {}
+    for r in conn.execute(
+        f"SELECT {_SPAN_COLUMNS} FROM termins WHERE date BETWEEN ? AND ?",
+        (missing[0], missing[-1])
+    ):
+        rows.setdefault(r["date"], []).append(dict(r))
+    for r in series.occurrences(conn, missing[0], missing[-1]):
+        rows.setdefault(r["date"], []).append(r)
+
+    loaded = {d: DaySchedule(d, rows.get(d, ())) for d in missing}
+    with _days_lock:
+        if gen == _days_gen:
+            _days.update(loaded)
+            while len(_days) > CACHE_MAX_DAYS:
+                _days.popitem(last=False)
+    found.update(loaded)
+    return found
+
+
+def get_day(date_iso):
+    return _load(date_iso, date_iso)[date_iso]
+
+
+# ----------------- 查询 -----------------
+def is_free(date_iso, start, length=DEFAULT_DURATION_MIN, exclude_id=None):
+    """date_iso 这天从 start（HH:MM 或分钟数）开始 length 分钟内是否没有其它预约"""
+    day = get_day(date_iso)
+    s = to_min(start)
+    if exclude_id is None:
+        return day.is_free(s, length)
+    return not day.conflicts(s, s + length, exclude_id)
+
+
+def next_free_slots(date_from, length=DEFAULT_DURATION_MIN, n=5, date_to=None,
+                    not_before=None, step=SLOT_STEP_MIN):
+    """
+    从 date_from 起按时间顺序找 n 个空档，返回 [(YYYY-MM-DD, HH:MM), ...]
+    not_before: date_from 当天不早于这个时间（HH:MM），一般传当前时间
+    只在 OPEN_WEEKDAYS 的营业时间内找，最多找到 date_to（默认往后 MAX_SEARCH_DAYS 天）
+    """
+    d = date.fromisoformat(date_from)
+    last = date.fromisoformat(date_to) if date_to else d + timedelta(days=MAX_SEARCH_DAYS)
+    first_start = max(DAY_START_MIN, to_min(not_before)) if not_before else DAY_START_MIN
+
+    out = []
+    while d <= last and len(out) < n:
+        chunk_end = min(d + timedelta(days=LOAD_CHUNK_DAYS - 1), last)
+        days = _load(d.isoformat(), chunk_end.isoformat())
+        while d <= chunk_end and len(out) < n:
+            if d.weekday() in OPEN_WEEKDAYS:
+                iso = d.isoformat()
+                start = first_start if iso == date_from else DAY_START_MIN
+                for m in days[iso].free_slots(length, step, day_start=start):
+                    out.append((iso, min_to_hm(m)))
+                    if len(out) >= n:
+                        break
+            d += timedelta(days=1)
+    return out
+
+
+def find_conflicts(conn, date_iso, start, end, exclude_id=None):
+    """
+    直接查数据库（不走缓存），给写入时在同一个事务里检查用
+    返回与 [start, end) 重叠的预约行
+    """
+    rows = [dict(r) for r in conn.execute(
+        f"SELECT {_SPAN_COLUMNS} FROM termins WHERE date = ? AND id != ?",
+        (date_iso, exclude_id or "")
+    )]
+    rows += [r for r in series.occurrences(conn, date_iso, date_iso) if r["id"] != exclude_id]
+    out = []
+    for r in rows:
+        span = appt_span(r)
+        if span and span[0] < end and span[1] > start:
+            out.append(r)
+    return out
+
+
+def conflict_message(rows):
+    parts = [f"{r['patient']} {min_to_hm(s)}–{min_to_hm(e)}" for r in rows for s, e in [appt_span(r)]]
+    return f"{CONFLICT_MSG}：与 " + "、".join(parts) + " 重叠"
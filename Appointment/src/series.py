@@ -0,0 +1,121 @@
+"""
+重复预约（疗程）：从某天起每周 / 每 N 周一次，可以限定次数或截止日期
+
+- series 表只存规则，不为每一次预约插行；查询时只在请求的日期窗口里现算，
+  长期疗程不会让 termins 变大，也不会拖慢按日期的范围查询
+- 某一次登记到达 / 修改时（termin.update_termin）才转成 termins 里的真实行，
+  并记到 series_exceptions；取消某一次也记在那里（termin_id 为 NULL）
+- 现算出来的行 id 形如 series:<series_id>:<YYYY-MM-DD>，状态固定为 scheduled、未发账单
+"""
+from datetime import date, timedelta
+
+SERIES_PREFIX = "series:"
+HORIZON_DAYS = 365    # 不限期的疗程，在没给结束日期的查询里最多展开到今天之后这么多天
+
+
+def occurrence_id(sid, date_iso):
+    return f"{SERIES_PREFIX}{sid}:{date_iso}"
+
+
+def parse_occurrence_id(tid):
+    """返回 (series_id, 日期)；不是现算出来的 id 时返回 None"""
+    if not isinstance(tid, str) or not tid.startswith(SERIES_PREFIX):
+        return None
+    sid, _, d = tid[len(SERIES_PREFIX):].rpartition(":")
+    return (sid, d) if sid and d else None
+
+
+def end_date(start_iso, interval_weeks=1, count=None, until=None):
+    """最后一次的日期（YYYY-MM-DD）；既没有次数也没有截止日期时返回 None"""
+    start = date.fromisoformat(start_iso)
+    step = 7 * interval_weeks
+    last = None
+    if count:
+        last = start + timedelta(days=step * (count - 1))
+    if until:
+        u = date.fromisoformat(until)
+        cand = start + timedelta(days=step * ((u - start).days // step))
+        last = cand if last is None else min(last, cand)
+    return last.isoformat() if last else None
+
+
+def window_end(date_to=None):
+    return date_to or (date.today() + timedelta(days=HORIZON_DAYS)).isoformat()
+
+
+def occurrence_dates(s, date_from=None, date_to=None):
+    """按顺序生成 series 行 s 落在 [date_from, date_to] 里的日期（不扣除例外）"""
+    start = date.fromisoformat(s["start_date"])
+    step = 7 * s["interval_weeks"]
+    lo = max(start, date.fromisoformat(date_from)) if date_from else start
+    hi = date.fromisoformat(window_end(date_to))
+    if s["end_date"]:
+        hi = min(hi, date.fromisoformat(s["end_date"]))
+
+    d = start + timedelta(days=step * -(-(lo - start).days // step))
+    while d <= hi:
+        yield d.isoformat()
+        d += timedelta(days=step)
+
+
+def occurrence_row(s, date_iso):
+    return {
+        "id": occurrence_id(s["id"], date_iso),
+        "date": date_iso,
+        "planned_time": s["planned_time"],
+        "patient": s["patient"],
+        "status": "scheduled",
+        "arrival_time": "",
+        "leave_time": "",
+        "services": s["services"],
+        "invoice_sent": "no",
+        "version": 0    # 还没有真实行；第一次修改时转成真实行，version 从 1 开始
+    }
+
+
+def occurrences(conn, date_from=None, date_to=None):
+    """
+    [date_from, date_to] 里还没取消、也没转成真实行的每一次预约
+    结果按 date, planned_time, id 排序，与 termins 的查询顺序一致
+    """
+    date_to = window_end(date_to)
+    series = conn.execute(
+        "SELECT * FROM series WHERE start_date <= ? AND (end_date IS NULL OR end_date >= ?)",
+        (date_to, date_from or "")
+    ).fetchall()
+    if not series:
+        return []
+
+    skip = {
+        (r["series_id"], r["date"]) for r in conn.execute(
+            "SELECT series_id, date FROM series_exceptions WHERE date BETWEEN ? AND ?",
+            (date_from or "", date_to)
+        )
+    }
+    rows = [
+        occurrence_row(s, d)
+        for s in series
+        for d in occurrence_dates(s, date_from, date_to)
+        if (s["id"], d) not in skip
+    ]
+    rows.sort(key=lambda r: (r["date"], r["planned_time"], r["id"]))
+    return rows
+
+
+def get_occurrence(conn, tid):
+    """按现算的 id 取一次预约；这天不在规则里、已取消或已转成真实行时返回 None"""
+    parsed = parse_occurrence_id(tid)
+    if parsed is None:
+        return None
+    sid, d = parsed
+    s = conn.execute("SELECT * FROM series WHERE id = ?", (sid,)).fetchone()
+    try:
+        if s is None or d not in occurrence_dates(s, d, d):
+            return None
+    except ValueError:   # 日期部分不是合法日期
+        return None
+    if conn.execute(
+        "SELECT 1 FROM series_exceptions WHERE series_id = ? AND date = ?", (sid, d)
+    ).fetchone():
+        return None
+    return occurrence_row(s, d)
@@ -0,0 +1,368 @@
+"""
+本地 HTTP/JSON 服务：多台前台电脑通过它访问同一个数据库，不再各自打开共享盘上的 SQLite 文件
+
+    python server.py [--host 0.0.0.0] [--port 8765] [--readers 4]
+
+客户端设置环境变量 TERMIN_SERVER=http://<服务器>:8765 后启动 main_gui.py 即可（见 client.py）
+只用标准库（asyncio）；所有写操作由一个写线程串行执行，读操作在读线程池里并发
+没有登录验证，只应在诊所内网里使用
+
+接口（JSON 进 JSON 出；过滤参数与 termin.get_termins 相同，after / before 写成 date,planned_time,id）：
+    GET    /termins                 列表          {"rows": [...]}
+    GET    /termins/search?q=       全文搜索      {"rows": [...]}
+    GET    /termins/count           计数          {"count": n}
+    GET    /termins/<id>            单条          {"row": {...}}（不存在时 404）
+    POST   /termins                 新建          {"ok", "msg", "row"}
+    PATCH  /termins/<id>            修改          {"ok", "msg", "row"}
+    DELETE /termins/<id>            删除          {"row": {...}}（不存在时 404）
+                                    ?expected_version= 与现在的版本不一致时 409 {"error", "row"}
+    POST   /termins/bulk-update     批量修改      {"ids", "expected_versions", 字段...} → {"ok", "msg", "rows"}
+    POST   /termins/bulk-delete     批量删除      {"ids", "expected_versions"} → {"ok", "msg", "rows"}
+    POST   /series                  新建重复预约  {"ok", "msg", "id"}
+    GET    /changes                 最新变更序号  {"seq": n}
+    GET    /changes?since=n         变化的行      {"seq", "rows", "deleted"}（rows 为 null 时整体刷新）
+    GET    /export[.gz]             导出 CSV      文件内容，X-Row-Count 为行数
+    GET    /health
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import tempfile
+from http import HTTPStatus
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import archive
+import termin
+from backup import auto_backup
+from db import init_db
+from worker import DbWorker
+
+DEFAULT_PORT = 8765
+READERS = 4
+MAX_BODY = 1024 * 1024
+EXPORT_CHUNK = 64 * 1024
+
+FILTER_KEYS = ("date_from", "date_to", "status", "invoice_sent", "patient")
+UPDATE_KEYS = (
+    "patient", "date", "planned_time", "arrival_time", "leave_time", "services", "invoice_sent",
+    "allow_conflict", "expected_version"
+)
+
+
+class HttpError(Exception):
+    def __init__(self, status, msg):
+        super().__init__(msg)
+        self.status = status
+
+
+# ----------------- 参数 -----------------
+def _filters(q, keys=FILTER_KEYS):
+    return {k: q[k] for k in keys if q.get(k)}
+
+
+def _int(q, key):
+    if not q.get(key):
+        return None
+    try:
+        return int(q[key])
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, f"{key} 必须是整数") from None
+
+
+def _after(q, key="after"):
+    """after / before 参数：page_key() 三个字段用逗号连起来"""
+    if not q.get(key):
+        return None
+    parts = q[key].split(",", 2)
+    if len(parts) != 3:
+        raise HttpError(HTTPStatus.BAD_REQUEST, f"{key} 应为 date,planned_time,id")
+    return tuple(parts)
+
+
+def _columns(q):
+    return tuple(c for c in q["columns"].split(",") if c) if q.get("columns") else None
+
+
+def _json_body(body):
+    if not body:
+        return {}
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "请求体不是合法的 JSON") from None
+    if not isinstance(data, dict):
+        raise HttpError(HTTPStatus.BAD_REQUEST, "请求体应为 JSON 对象")
+    return data
+
+
+def _result(res):
+    ok, msg, row = res
+    return {"ok": ok, "msg": msg, "row": row}
+
+
+# ----------------- 服务 -----------------
+class TerminServer:
+    def __init__(self, readers=READERS):
+        self.db = DbWorker(readers=readers)
+        self._routes = [
+            ("GET", re.compile(r"/health"), self.health),
+            ("GET", re.compile(r"/termins"), self.list_termins),
+            ("GET", re.compile(r"/termins/search"), self.search),
+            ("GET", re.compile(r"/termins/count"), self.count),
+            ("GET", re.compile(r"/termins/(?P<tid>[^/]+)"), self.get_one),
+            ("POST", re.compile(r"/termins"), self.create),
+            ("POST", re.compile(r"/termins/bulk-update"), self.bulk_update),
+            ("POST", re.compile(r"/termins/bulk-delete"), self.bulk_delete),
+            ("PATCH", re.compile(r"/termins/(?P<tid>[^/]+)"), self.update),
+            ("DELETE", re.compile(r"/termins/(?P<tid>[^/]+)"), self.delete),
+            ("POST", re.compile(r"/series"), self.create_series),
+            ("GET", re.compile(r"/changes"), self.changes),
+            ("GET", re.compile(r"/export(?P<gz>\.gz)?"), self.export),
+        ]
+
+    async def read(self, fn, *args, **kwargs):
+        return await asyncio.wrap_future(self.db.read(fn, *args, **kwargs))
+
+    async def write(self, fn, *args, **kwargs):
+        return await asyncio.wrap_future(self.db.write(fn, *args, **kwargs))
+
+    # ---------- 接口 ----------
+    async def health(self, q, body):
+        return {"ok": True}
+
+    async def list_termins(self, q, body):
+        rows = await self.read(
+            termin.get_termins, **_filters(q), limit=_int(q, "limit"), offset=_int(q, "offset"),
+            columns=_columns(q), after=_after(q), before=_after(q, "before")
+        )
+        return {"rows": rows}
+
+    async def search(self, q, body):
+        rows = await self.read(
+            termin.search_termins, q.get("q", ""), **_filters(q, FILTER_KEYS[:-1]),
+            limit=_int(q, "limit"), offset=_int(q, "offset"), columns=_columns(q), after=_after(q),
+            before=_after(q, "before")
+        )
+        return {"rows": rows}
+
+    async def count(self, q, body):
+        return {"count": await self.read(termin.count_termins, query=q.get("q"), **_filters(q))}
+
+    async def get_one(self, q, body, tid):
+        row = await self.read(termin.get_termin, tid, columns=_columns(q))
+        if row is None:
+            raise HttpError(HTTPStatus.NOT_FOUND, "预约不存在")
+        return {"row": row}
+
+    async def create(self, q, body):
+        data = _json_body(body)
+        try:
+            args = (data["patient"], data["date"], data["planned_time"])
+        except KeyError as e:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"缺少字段 {e.args[0]}") from None
+        res = await self.write(
+            termin.add_termin, *args, return_row=True, allow_conflict=bool(data.get("allow_conflict"))
+        )
+        return _result(res)
+
+    async def update(self, q, body, tid):
+        data = _json_body(body)
+        unknown = set(data) - set(UPDATE_KEYS)
+        if unknown:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"未知字段: {', '.join(sorted(unknown))}")
+        return _result(await self.write(termin.update_termin, tid, **data, return_row=True))
+
+    async def delete(self, q, body, tid):
+        row = await self.write(termin.delete_termin, tid, expected_version=_int(q, "expected_version"))
+        if row is None:
+            raise HttpError(HTTPStatus.NOT_FOUND, "预约不存在")
+        return {"row": row}
+
+    async def bulk_update(self, q, body):
+        data = _json_body(body)
+        ids = data.pop("ids", None) or []
+        expected = data.pop("expected_versions", None)
+        ok, msg, rows = await self.write(termin.bulk_update_termins, ids, expected_versions=expected, **data)
+        return {"ok": ok, "msg": msg, "rows": rows}
+
+    async def bulk_delete(self, q, body):
+        data = _json_body(body)
+        ok, msg, rows = await self.write(
+            termin.bulk_delete_termins, data.get("ids") or [], expected_versions=data.get("expected_versions")
+        )
+        return {"ok": ok, "msg": msg, "rows": rows}
+
+    async def create_series(self, q, body):
+        data = _json_body(body)
+        try:
+            ok, msg, sid = await self.write(
+                termin.add_series, data["patient"], data["start_date"], data["planned_time"],
+                interval_weeks=data.get("interval_weeks", 1), count=data.get("count"),
+                until_ddmmyyyy=data.get("until"), services=data.get("services")
+            )
+        except KeyError as e:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"缺少字段 {e.args[0]}") from None
+        return {"ok": ok, "msg": msg, "id": sid}
+
+    async def changes(self, q, body):
+        since = _int(q, "since")
+        if since is None:
+            return {"seq": await self.read(termin.change_seq)}
+        seq, rows, deleted = await self.read(termin.get_changes, since, columns=_columns(q))
+        return {"seq": seq, "rows": rows, "deleted": deleted}
+
+    async def export(self, q, body, gz=None):
+        """先在读线程里导出到临时文件，再分块发给客户端"""
+        fd, name = tempfile.mkstemp(suffix=".csv.gz" if gz else ".csv", prefix="termin_export_")
+        os.close(fd)
+        tmp = Path(name)
+        try:
+            n = await self.read(termin.export_termins_to_csv, tmp, **_filters(q), compress=bool(gz))
+        except RuntimeError as e:   # 没有数据
+            tmp.unlink(missing_ok=True)
+            raise HttpError(HTTPStatus.NOT_FOUND, str(e)) from None
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        return _FileResponse(tmp, n, "application/gzip" if gz else "text/csv; charset=utf-8")
+
+    # ---------- HTTP ----------
+    def _route(self, method, path):
+        allowed = False
+        for m, pattern, handler in self._routes:
+            match = pattern.fullmatch(path)
+            if match:
+                if m == method:
+                    return handler, {k: unquote(v) if v else v for k, v in match.groupdict().items()}
+                allowed = True
+        if allowed:
+            raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED, "不支持的请求方法")
+        raise HttpError(HTTPStatus.NOT_FOUND, "没有这个接口")
+
+    async def handle(self, reader, writer):
+        """一个 TCP 连接；支持 HTTP/1.1 keep-alive，一个连接上可以连续发多个请求"""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    method, target, version = line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._send_json(writer, HTTPStatus.BAD_REQUEST, {"error": "Content-Length 无效"}, False)
+                    break
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                if length > MAX_BODY:
+                    await self._send_json(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "请求体太大"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload = HTTPStatus.OK, None
+                try:
+                    url = urlsplit(target)
+                    q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                    handler, kwargs = self._route(method.upper(), url.path.rstrip("/") or "/")
+                    payload = await handler(q, body, **kwargs)
+                except HttpError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except termin.VersionConflict as e:
+                    status, payload = HTTPStatus.CONFLICT, {"error": str(e), "row": e.row}
+                except archive.ArchiveError as e:
+                    status, payload = HTTPStatus.FORBIDDEN, {"error": str(e)}
+                except Exception as e:
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"{type(e).__name__}: {e}"}
+
+                if isinstance(payload, _FileResponse):
+                    await payload.send(writer, keep_alive)
+                else:
+                    await self._send_json(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _send_json(writer, status, payload, keep_alive):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        writer.write(_head(status, "application/json; charset=utf-8", len(data), keep_alive) + data)
+        await writer.drain()
+
+    async def serve(self, host, port):
+        init_db()
+        auto_backup()
+        server = await asyncio.start_server(self.handle, host, port)
+        addrs = ", ".join(str(s.getsockname()) for s in server.sockets)
+        print(f"✅ termin 服务已启动：{addrs}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.db.shutdown()
+
+
+def _head(status, content_type, length, keep_alive, extra=None):
+    lines = [
+        f"HTTP/1.1 {status.value} {status.phrase}",
+        f"Content-Type: {content_type}",
+        f"Content-Length: {length}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    lines += [f"{k}: {v}" for k, v in (extra or {}).items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+class _FileResponse:
+    def __init__(self, path, rows, content_type):
+        self.path = path
+        self.rows = rows
+        self.content_type = content_type
+
+    async def send(self, writer, keep_alive):
+        loop = asyncio.get_running_loop()
+        try:
+            size = self.path.stat().st_size
+            writer.write(_head(HTTPStatus.OK, self.content_type, size, keep_alive, {"X-Row-Count": self.rows}))
+            with self.path.open("rb") as f:
+                while True:
+                    chunk = await loop.run_in_executor(None, f.read, EXPORT_CHUNK)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+                    await writer.drain()
+        finally:
+            self.path.unlink(missing_ok=True)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="termins HTTP/JSON 服务")
+    ap.add_argument("--host", default="127.0.0.1", help="监听地址；给其它电脑用时写 0.0.0.0")
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT)
+    ap.add_argument("--readers", type=int, default=READERS, help="读线程数")
+    args = ap.parse_args(argv)
+    try:
+        asyncio.run(TerminServer(args.readers).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
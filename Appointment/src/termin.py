@@ -1,169 +1,1138 @@
-import uuid
-from datetime import datetime
-from db import get_conn, init_db
-import csv
-from pathlib import Path
-
-# 确保数据库和表存在
-init_db()
-
-
-# ----------------- 工具 -----------------
-def _now_id():
-    return uuid.uuid4().hex
-
-def parse_services(s: str):
-    """
-    数据库存的是用 ; 分隔的字符串
-    UI 需要的是 list[str]
-    """
-    if not s:
-        return []
-    return [x.strip() for x in s.split(";") if x.strip()]
-
-def _normalize_services(services):
-    """
-    UI 里传进来的是 list[str]
-    数据库存成用 ; 连接的字符串
-    """
-    if not services:
-        return ""
-    if isinstance(services, list):
-        return ";".join(x.strip() for x in services if x.strip())
-    return str(services)
-
-
-# ----------------- 核心接口（保持不变） -----------------
-
-def get_termins(date_from=None, date_to=None, status=None):
-    sql = "SELECT * FROM termins WHERE 1=1"
-    params = []
-
-    if date_from:
-        sql += " AND date >= ?"
-        params.append(date_from)
-    if date_to:
-        sql += " AND date <= ?"
-        params.append(date_to)
-    if status:
-        sql += " AND status = ?"
-        params.append(status)
-
-    sql += " ORDER BY date, planned_time"
-
-    with get_conn() as conn:
-        rows = conn.execute(sql, params).fetchall()
-
-    return [dict(r) for r in rows]
-
-
-def add_termin(patient, date_ddmmyyyy, planned_time):
-    try:
-        date_iso = datetime.strptime(date_ddmmyyyy, "%d-%m-%Y").strftime("%Y-%m-%d")
-    except ValueError:
-        return False, "日期格式错误，应为 DD-MM-YYYY"
-
-    tid = _now_id()
-
-    with get_conn() as conn:
-        conn.execute("""
-        INSERT INTO termins (
-            id, date, planned_time, patient,
-            status, arrival_time, leave_time,
-            services, invoice_sent
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            tid,
-            date_iso,
-            planned_time,
-            patient,
-            "scheduled",
-            "",
-            "",
-            "",
-            "no"
-        ))
-
-    return True, "创建成功"
-
-
-def update_termin(
-    tid,
-    patient=None,
-    date=None,
-    planned_time=None,
-    arrival_time=None,
-    leave_time=None,
-    services=None,
-    invoice_sent=None
-):
-    fields = []
-    params = []
-
-    if patient is not None:
-        fields.append("patient = ?")
-        params.append(patient)
-
-    if date is not None:
-        fields.append("date = ?")
-        params.append(date)
-
-    if planned_time is not None:
-        fields.append("planned_time = ?")
-        params.append(planned_time)
-
-    if arrival_time is not None:
-        fields.append("arrival_time = ?")
-        params.append(arrival_time)
-        fields.append("status = ?")
-        params.append("arrived" if arrival_time else "scheduled")
-
-    if leave_time is not None:
-        fields.append("leave_time = ?")
-        params.append(leave_time)
-
-    if services is not None:
-        fields.append("services = ?")
-        params.append(_normalize_services(services))
-
-    if invoice_sent is not None:
-        fields.append("invoice_sent = ?")
-        params.append(invoice_sent)
-
-    if not fields:
-        return True, "无修改"
-
-    sql = "UPDATE termins SET " + ", ".join(fields) + " WHERE id = ?"
-    params.append(tid)
-
-    with get_conn() as conn:
-        conn.execute(sql, params)
-
-    return True, "更新成功"
-
-
-def delete_termin(tid):
-    with get_conn() as conn:
-        conn.execute("DELETE FROM termins WHERE id = ?", (tid,))
-
-def export_termins_to_csv(csv_path: str):
-    """
-    将当前 SQLite 中的 termins 表导出为 CSV
-    """
-    with get_conn() as conn:
-        rows = conn.execute("SELECT * FROM termins ORDER BY date, planned_time").fetchall()
-
-    if not rows:
-        raise RuntimeError("当前没有任何数据可导出")
-
-    csv_path = Path(csv_path)
-
-    with csv_path.open("w", newline="", encoding="utf-8-sig") as f:
-        writer = csv.writer(f)
-
-        # 表头
-        writer.writerow(rows[0].keys())
-
-        # 数据行
-        for r in rows:
-            writer.writerow(list(r))
+from datetime import datetime, date as _date
+from db import get_conn, write_conn, data_version, fold
+import archive
+import instrument
+import schedule
+import series
+import heapq
+import threading
+from collections import OrderedDict
+from itertools import islice
+from pathlib import Path
+
+# ----------------- 工具 -----------------
+def _now_id():
+    import uuid   # 延迟导入：uuid 会连带加载 platform 等模块，启动时用不到
+    return uuid.uuid4().hex
+
+def parse_services(s: str):
+    """
+    数据库存的是用 ; 分隔的字符串
+    UI 需要的是 list[str]
+    """
+    if not s:
+        return []
+    return [x.strip() for x in s.split(";") if x.strip()]
+
+def _normalize_services(services):
+    """
+    UI 里传进来的是 list[str]
+    数据库存成用 ; 连接的字符串
+    """
+    if not services:
+        return ""
+    if isinstance(services, list):
+        return ";".join(x.strip() for x in services if x.strip())
+    return str(services)
+
+
+# ----------------- 核心接口（保持不变） -----------------
+
+TERMIN_COLUMNS = (
+    "id", "date", "planned_time", "patient", "status",
+    "arrival_time", "leave_time", "services", "invoice_sent", "version"
+)
+
+# 导出的 CSV 与导入格式一致，不带 version
+CSV_COLUMNS = TERMIN_COLUMNS[:-1]
+
+
+# 数据库计算的整数列（见 db.DERIVED_COLUMNS），只在 columns 里显式要求时才返回
+DERIVED_COLUMNS = ("day_num", "planned_min", "arrival_min", "leave_min")
+
+_ALL_COLUMNS_SQL = ", ".join(TERMIN_COLUMNS)
+
+
+def _select_list(columns, table=""):
+    if not columns:
+        return ", ".join(table + c for c in TERMIN_COLUMNS)
+    unknown = [c for c in columns if c not in TERMIN_COLUMNS and c not in DERIVED_COLUMNS]
+    if unknown:
+        raise ValueError(f"未知列: {', '.join(unknown)}")
+    return ", ".join(table + c for c in columns)
+
+
+_EPOCH_ORDINAL = _date(1970, 1, 1).toordinal()
+
+
+def _project(row, columns):
+    """把整行（含现算的疗程预约）裁成 columns，生成列按数据库同样的规则补上"""
+    if not columns:
+        return {c: row[c] for c in TERMIN_COLUMNS}
+    out = {}
+    for c in columns:
+        if c in row:
+            out[c] = row[c]
+        elif c == "day_num":
+            out[c] = _date.fromisoformat(row["date"]).toordinal() - _EPOCH_ORDINAL
+        else:   # *_min；与生成列一样，解析不了的旧数据是 NULL
+            try:
+                out[c] = schedule.to_min(row[c[:-len("min")] + "time"])
+            except ValueError:
+                out[c] = None
+    return out
+
+
+def _series_rows(conn, date_from=None, date_to=None, status=None, invoice_sent=None,
+                 patient=None, after=None, terms=(), before=None):
+    """与 _filter_sql / _search_sql 相同的过滤条件下，窗口里现算出来的疗程预约（已排序）"""
+    if status not in (None, "", "scheduled") or invoice_sent not in (None, "", "no"):
+        return []
+    rows = series.occurrences(conn, date_from, date_to)
+    if patient:
+        rows = [r for r in rows if patient in r["patient"]]
+    if terms:
+        rows = [
+            r for r in rows
+            if all(t in fold(r["patient"]) or t in fold(r["services"] or "") for t in terms)
+        ]
+    if after:
+        after = tuple(after)
+        rows = [r for r in rows if page_key(r) > after]
+    if before:
+        before = tuple(before)
+        rows = [r for r in rows if page_key(r) < before]
+    return rows
+
+
+def _filter_sql(
+    date_from=None, date_to=None, status=None, invoice_sent=None, patient=None,
+    after=None, table="", before=None
+):
+    sql = ""
+    params = []
+
+    if date_from:
+        sql += f" AND {table}date >= ?"
+        params.append(date_from)
+    if date_to:
+        sql += f" AND {table}date <= ?"
+        params.append(date_to)
+    if status:
+        sql += f" AND {table}status = ?"
+        params.append(status)
+    if invoice_sent:
+        sql += f" AND {table}invoice_sent = ?"
+        params.append(invoice_sent)
+    if patient:
+        sql += f" AND instr({table}patient, ?) > 0"
+        params.append(patient)
+    if after:
+        # keyset 分页：从上一页最后一行之后继续，走 (date, planned_time, id) 索引
+        sql += f" AND ({table}date, {table}planned_time, {table}id) > (?, ?, ?)"
+        params.extend(after)
+    if before:
+        sql += f" AND ({table}date, {table}planned_time, {table}id) < (?, ?, ?)"
+        params.extend(before)
+
+    return sql, params
+
+
+def _limit_sql(limit=None, offset=None):
+    if limit is not None:
+        if offset:
+            return " LIMIT ? OFFSET ?", [int(limit), int(offset)]
+        return " LIMIT ?", [int(limit)]
+    if offset:
+        return " LIMIT -1 OFFSET ?", [int(offset)]
+    return "", []
+
+
+# ----------------- 查询缓存 -----------------
+# get_termins / count_termins 的结果按查询参数缓存（LRU）
+# 本进程的写操作只让涉及到的日期失效；其它进程的写入通过 PRAGMA data_version 发现，整体清空
+CACHE_MAX_ENTRIES = 256
+CACHE_MAX_ROWS = 100_000
+
+_cache = OrderedDict()      # key → (date_from, date_to, 行数, 结果)
+_cache_lock = threading.Lock()
+_cache_rows = 0
+_cache_gen = 0              # 每次失效 +1，查询期间发生过失效的结果不写入缓存
+_cache_version = None
+_cache_stats = {"hits": 0, "misses": 0, "invalidated": 0}
+
+
+def _cache_get(key):
+    """命中返回 (True, 结果)，否则返回 (False, 当前代号)"""
+    global _cache_version, _cache_gen
+    v = data_version()   # 在 _cache_lock 外面取，避免和写锁互相等待
+    with _cache_lock:
+        if v != _cache_version:
+            _cache_version = v
+            _cache_clear_locked()
+        entry = _cache.get(key)
+        if entry is None:
+            _cache_stats["misses"] += 1
+            return False, _cache_gen
+        _cache.move_to_end(key)
+        _cache_stats["hits"] += 1
+        return True, entry[3]
+
+
+def _cache_put(key, gen, date_from, date_to, n, value):
+    global _cache_rows
+    with _cache_lock:
+        if gen != _cache_gen or n > CACHE_MAX_ROWS:
+            return
+        old = _cache.pop(key, None)
+        if old is not None:
+            _cache_rows -= old[2]
+        _cache[key] = (date_from, date_to, n, value)
+        _cache_rows += n
+        while len(_cache) > CACHE_MAX_ENTRIES or _cache_rows > CACHE_MAX_ROWS:
+            _, evicted = _cache.popitem(last=False)
+            _cache_rows -= evicted[2]
+
+
+def _cache_clear_locked():
+    global _cache_rows, _cache_gen
+    _cache_stats["invalidated"] += len(_cache)
+    _cache.clear()
+    _cache_rows = 0
+    _cache_gen += 1
+
+
+def _invalidate_dates(*dates):
+    """删除日期范围包含这些日期的缓存项"""
+    global _cache_rows, _cache_gen
+    dates = [d for d in dates if d]
+    schedule.invalidate(*dates)
+    with _cache_lock:
+        _cache_gen += 1
+        for key, (df, dt, n, _) in list(_cache.items()):
+            if any((not df or df <= d) and (not dt or d <= dt) for d in dates):
+                del _cache[key]
+                _cache_rows -= n
+                _cache_stats["invalidated"] += 1
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache_clear_locked()
+
+
+def cache_info():
+    """命中 / 未命中 / 失效次数，以及当前缓存的条目数和行数"""
+    with _cache_lock:
+        return dict(_cache_stats, entries=len(_cache), rows=_cache_rows)
+
+
+def get_termins(
+    date_from=None,
+    date_to=None,
+    status=None,
+    invoice_sent=None,
+    patient=None,
+    limit=None,
+    offset=None,
+    columns=None,
+    after=None,
+    before=None
+):
+    """
+    所有过滤都在 SQL 里完成，结果已按 date, planned_time, id 排好序
+    patient: 姓名包含该字符串（区分大小写，与原来 UI 的 `in` 判断一致）
+    columns: 只取这些列，默认全部
+    after: 上一页最后一行的 page_key()，只返回排在它之后的行
+    before: 某一行的 page_key()，只返回排在它之前的行；limit / offset 从 before 往前数，
+            即紧挨着 before 的最后 limit 行（结果仍是正序），用来往回翻页
+    重复预约（series）在窗口里现算出来一起返回；没给 date_to 时只展开到 series.HORIZON_DAYS 天后
+    日期范围碰到已归档的年份时，归档文件里的行也一起返回
+    """
+    return _query_rows(
+        (), date_from, date_to, status, invoice_sent, patient, limit, offset, columns, after, before
+    )
+
+
+def _query_rows(terms, date_from, date_to, status, invoice_sent, patient, limit, offset, columns, after,
+                before=None):
+    """get_termins / search_termins 共用：terms 为空时不搜索"""
+    key = (
+        "rows", terms or None, date_from or None, date_to or None, status or None, invoice_sent or None,
+        patient or None, limit, offset or None,
+        tuple(columns) if columns else None, tuple(after) if after else None, tuple(before) if before else None
+    )
+    hit, cached = _cache_get(key)
+    if hit:
+        return [dict(r) for r in cached]
+    gen = cached
+
+    where, params = _filter_sql(
+        date_from, date_to, status, invoice_sent, patient, after, table="t.", before=before
+    )
+    source, cond, search_params = _search_sql(terms)
+    params = search_params + params
+    # 往回翻页：倒着取 limit 行，最后再翻成正序
+    desc = before is not None
+    order = " ORDER BY t.date, t.planned_time, t.id"
+    if desc:
+        order = " ORDER BY t.date DESC, t.planned_time DESC, t.id DESC"
+
+    with get_conn() as conn:
+        occ = _series_rows(conn, date_from, date_to, status, invoice_sent, patient, after, terms, before)
+        years = archive.years_for(date_from, date_to)
+        if not occ and not years:
+            limit_sql, limit_params = _limit_sql(limit, offset)
+            sql = f"SELECT {_select_list(columns, 't.')} FROM {source} WHERE 1=1{cond}{where}{order}{limit_sql}"
+            rows = [dict(r) for r in conn.execute(sql, params + limit_params)]
+        else:
+            # 和现算的疗程预约、归档文件里的行按同一个顺序归并，分页在归并之后做
+            # 每个来源最多只需要取 stop 行；归档文件里也有同样的全文索引（见 archive.py）
+            skip = offset or 0
+            stop = skip + limit if limit is not None else None
+            limit_sql, limit_params = _limit_sql(stop)
+            extra = [c for c in columns or () if c in DERIVED_COLUMNS]
+            sql = (
+                f"SELECT {_select_list(TERMIN_COLUMNS + tuple(extra), 't.')} FROM {source}"
+                f" WHERE 1=1{cond}{where}{order}{limit_sql}"
+            )
+            sources = [conn] + [archive.get_conn(y) for y in years]
+            parts = [[dict(r) for r in c.execute(sql, params + limit_params)] for c in sources]
+            merged = heapq.merge(*parts, occ[::-1] if desc else occ, key=page_key, reverse=desc)
+            rows = [_project(r, columns) for r in islice(merged, skip, stop)]
+        if desc:
+            rows.reverse()
+
+    _cache_put(key, gen, date_from, date_to, len(rows), rows)
+    return [dict(r) for r in rows]
+
+
+def get_termin(tid, columns=None):
+    """按主键取一条，不存在时返回 None；也接受现算的疗程预约 id"""
+    with get_conn() as conn:
+        if series.parse_occurrence_id(tid):
+            row = series.get_occurrence(conn, tid)
+            return _project(row, columns) if row else None
+        row = conn.execute(
+            f"SELECT {_select_list(columns)} FROM termins WHERE id = ?", (tid,)
+        ).fetchone()
+    if row is None:
+        found = archive.find(tid)
+        return _project(found[1], columns) if found else None
+    return dict(row)
+
+
+_IDS_CHUNK = 500   # 低于 SQLite 默认的参数个数上限
+
+
+def get_termins_by_ids(ids, columns=None):
+    """按主键批量取，结果顺序与 ids 相同，不存在的 id 直接跳过"""
+    ids = list(dict.fromkeys(ids))
+    with get_conn() as conn:
+        found = _fetch_by_ids(conn, ids, columns)
+    return [found[t] for t in ids if t in found]
+
+
+def _fetch_by_ids(conn, ids, columns=None):
+    """{id: 行}；写事务里要用同一个 conn 才能读到自己刚写的内容"""
+    if columns and "id" not in columns:
+        columns = ("id",) + tuple(columns)
+    found = {}
+    for i in range(0, len(ids), _IDS_CHUNK):
+        chunk = ids[i:i + _IDS_CHUNK]
+        marks = ", ".join("?" * len(chunk))
+        for r in conn.execute(
+            f"SELECT {_select_list(columns)} FROM termins WHERE id IN ({marks})", chunk
+        ):
+            found[r["id"]] = dict(r)
+    return found
+
+
+FTS_MIN_TERM = 3   # trigram 索引只能查至少 3 个字符的词
+
+
+def _search_terms(query):
+    """规范化（db.fold）之后的搜索词；全文索引里存的也是规范化之后的文本"""
+    return tuple(fold(query).replace("，", " ").replace(",", " ").replace(";", " ").split())
+
+
+def _search_sql(terms):
+    """
+    把搜索词变成 (FROM 子句, WHERE 条件, 参数)，termins 的别名是 t；词之间是 AND，每个词都是子串匹配
+    至少 3 个字符的词用 trigram 全文索引（引号转义，避免用户输入被当成 FTS 语法）；
+    更短的词（例如一两个汉字）索引帮不上，用 LIKE 在索引挑出来的行（或日期范围内的行）上逐行比较，
+    比较的是索引里存的规范化文本，所以同样不区分变音符号
+    """
+    if not terms:
+        return "termins t", "", []
+    cond, params = "", []
+    for t in terms:
+        if len(t) < FTS_MIN_TERM:
+            like = "%" + t.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            cond += " AND (termins_fts.patient LIKE ? ESCAPE '\\' OR termins_fts.services LIKE ? ESCAPE '\\')"
+            params += [like, like]
+    indexed = [t for t in terms if len(t) >= FTS_MIN_TERM]
+    if not indexed:
+        # CROSS JOIN 固定按 termins 的索引顺序逐行取，免得为 ORDER BY 另外排序
+        return "termins t CROSS JOIN termins_fts ON termins_fts.rowid = t.rowid", cond, params
+    match = " ".join('"' + t.replace('"', '""') + '"' for t in indexed)
+    return (
+        "termins_fts JOIN termins t ON t.rowid = termins_fts.rowid",
+        " AND termins_fts MATCH ?" + cond,
+        [match] + params
+    )
+
+
+def search_termins(
+    query,
+    date_from=None,
+    date_to=None,
+    status=None,
+    invoice_sent=None,
+    limit=None,
+    offset=None,
+    columns=None,
+    after=None,
+    before=None
+):
+    """
+    在姓名和项目中搜索（子串匹配，不区分大小写和变音符号，中文也可以；见 _search_sql）
+    其余参数与 get_termins 相同，同样包括现算的疗程预约和归档年份；query 为空时等同于 get_termins
+    """
+    return _query_rows(
+        _search_terms(query or ""), date_from, date_to, status, invoice_sent, None, limit, offset, columns,
+        after, before
+    )
+
+
+def count_termins(
+    query=None,
+    date_from=None,
+    date_to=None,
+    status=None,
+    invoice_sent=None,
+    patient=None
+):
+    """
+    符合条件的总行数（只走索引，不取行内容）；query 非空时按全文搜索计数
+    和 get_termins / search_termins 一样包括现算的疗程预约和归档年份
+    """
+    terms = _search_terms(query or "")
+    key = (
+        "count", terms or None, date_from or None, date_to or None, status or None,
+        invoice_sent or None, patient or None
+    )
+    hit, cached = _cache_get(key)
+    if hit:
+        return cached
+    gen = cached
+
+    where, params = _filter_sql(date_from, date_to, status, invoice_sent, patient, table="t.")
+    source, cond, search_params = _search_sql(terms)
+    sql = f"SELECT COUNT(*) FROM {source} WHERE 1=1{cond}{where}"
+    params = search_params + params
+
+    with get_conn() as conn:
+        n = conn.execute(sql, params).fetchone()[0]
+        n += len(_series_rows(conn, date_from, date_to, status, invoice_sent, patient, terms=terms))
+        for y in archive.years_for(date_from, date_to):
+            n += archive.get_conn(y).execute(sql, params).fetchone()[0]
+
+    _cache_put(key, gen, date_from, date_to, 1, n)
+    return n
+
+
+def page_key(row):
+    """keyset 分页用的排序键，传给 get_termins / search_termins 的 after"""
+    return row["date"], row["planned_time"], row["id"]
+
+
+_INSERT_SQL = """
+INSERT INTO termins (
+    id, date, planned_time, patient,
+    status, arrival_time, leave_time,
+    services, invoice_sent
+) VALUES (
+    :id, :date, :planned_time, :patient,
+    :status, :arrival_time, :leave_time,
+    :services, :invoice_sent
+)
+"""
+
+
+def add_termin(patient, date_ddmmyyyy, planned_time, *, return_row=False, allow_conflict=False):
+    """
+    return_row=True 时返回 (ok, msg, row)，row 为新插入的整行，失败时为 None
+    与当天其它预约时间重叠时返回失败（msg 以 schedule.CONFLICT_MSG 开头），
+    allow_conflict=True 时照样插入
+    """
+    try:
+        date_iso = datetime.strptime(date_ddmmyyyy, "%d-%m-%Y").strftime("%Y-%m-%d")
+    except ValueError:
+        if return_row:
+            return False, "日期格式错误，应为 DD-MM-YYYY", None
+        return False, "日期格式错误，应为 DD-MM-YYYY"
+
+    try:
+        planned_time = schedule.normalize_hm(planned_time)
+    except ValueError:
+        if return_row:
+            return False, TIME_FORMAT_MSG, None
+        return False, TIME_FORMAT_MSG
+    start = schedule.to_min(planned_time)
+
+    row = {
+        "id": _now_id(),
+        "date": date_iso,
+        "planned_time": planned_time,
+        "patient": patient,
+        "status": "scheduled",
+        "arrival_time": "",
+        "leave_time": "",
+        "services": "",
+        "invoice_sent": "no",
+        "version": 1
+    }
+
+    with write_conn() as conn:
+        if not allow_conflict:
+            clash = schedule.find_conflicts(conn, date_iso, start, start + schedule.DEFAULT_DURATION_MIN)
+            if clash:
+                msg = schedule.conflict_message(clash)
+                return (False, msg, None) if return_row else (False, msg)
+        conn.execute(_INSERT_SQL, row)
+    _invalidate_dates(date_iso)
+
+    if return_row:
+        return True, "创建成功", row
+    return True, "创建成功"
+
+
+def _set_clause(patient=None, date=None, planned_time=None, arrival_time=None, leave_time=None,
+                services=None, invoice_sent=None):
+    """
+    UPDATE 的 SET 部分：为 None 的字段不改，返回 (["列 = ?", ...], 参数)
+    时间统一成 HH:MM（到达 / 离开时间可以是空字符串，表示清掉），格式不对时抛出 ValueError
+    """
+    fields = []
+    params = []
+    if planned_time is not None:
+        planned_time = schedule.normalize_hm(planned_time)
+    if arrival_time:
+        arrival_time = schedule.normalize_hm(arrival_time)
+    if leave_time:
+        leave_time = schedule.normalize_hm(leave_time)
+
+    if patient is not None:
+        fields.append("patient = ?")
+        params.append(patient)
+
+    if date is not None:
+        fields.append("date = ?")
+        params.append(date)
+
+    if planned_time is not None:
+        fields.append("planned_time = ?")
+        params.append(planned_time)
+
+    if arrival_time is not None:
+        fields.append("arrival_time = ?")
+        params.append(arrival_time)
+        fields.append("status = ?")
+        params.append("arrived" if arrival_time else "scheduled")
+
+    if leave_time is not None:
+        fields.append("leave_time = ?")
+        params.append(leave_time)
+
+    if services is not None:
+        fields.append("services = ?")
+        params.append(_normalize_services(services))
+
+    if invoice_sent is not None:
+        fields.append("invoice_sent = ?")
+        params.append(invoice_sent)
+
+    return fields, params
+
+
+def update_termin(
+    tid,
+    patient=None,
+    date=None,
+    planned_time=None,
+    arrival_time=None,
+    leave_time=None,
+    services=None,
+    invoice_sent=None,
+    *,
+    return_row=False,
+    allow_conflict=False,
+    expected_version=None
+):
+    """
+    return_row=True 时返回 (ok, msg, row)，row 为更新后的整行（不存在时为 None）
+    改日期或预约时间后与其它预约重叠时返回失败，allow_conflict=True 时照样更新；
+    只登记到达 / 离开时间不做检查（那是已经发生的事）
+    expected_version: 打开编辑时读到的 version；这期间别人改过或删掉了这一行时不写入，
+    返回失败（msg 以 VERSION_CONFLICT_MSG 开头），row 为数据库里现在的行
+    """
+    try:
+        fields, params = _set_clause(
+            patient, date, planned_time, arrival_time, leave_time, services, invoice_sent
+        )
+    except ValueError:
+        return (False, TIME_FORMAT_MSG, None) if return_row else (False, TIME_FORMAT_MSG)
+    # 下面的冲突检查用规范化之后的时间
+    planned_time = planned_time and schedule.normalize_hm(planned_time)
+    arrival_time = arrival_time and schedule.normalize_hm(arrival_time)
+    leave_time = leave_time and schedule.normalize_hm(leave_time)
+
+    if not fields:
+        if return_row:
+            return True, "无修改", get_termin(tid)
+        return True, "无修改"
+
+    fields.append("version = version + 1")
+    sql = "UPDATE termins SET " + ", ".join(fields) + " WHERE id = ?"
+    occurrence = series.parse_occurrence_id(tid)
+
+    try:
+        with write_conn() as conn:
+            if occurrence:
+                # 疗程里的某一次第一次被修改（通常是登记到达），先转成真实行
+                # 和修改在同一个事务里：修改被拒绝时一起回滚，这一次仍然是现算的，"仍然保存"还能用原来的 id
+                # 别人已经先转过时，现算的那一行（version 0）就过期了，下面的版本检查会发现
+                tid, created = _materialize(conn, tid)
+                if created:
+                    expected_version = None
+            old = conn.execute(
+                "SELECT date, planned_time, arrival_time, leave_time, version FROM termins WHERE id = ?", (tid,)
+            ).fetchone()
+            if old is None and archive.find(tid):
+                raise _Rejected(ARCHIVED_MSG)
+            if expected_version is not None and (old is None or old["version"] != int(expected_version)):
+                msg = VERSION_CONFLICT_MSG + ("：已被删除" if old is None else "，请重新打开后再修改")
+                current = conn.execute(f"SELECT {_ALL_COLUMNS_SQL} FROM termins WHERE id = ?", (tid,)).fetchone()
+                raise _Rejected(msg, dict(current) if current else None)
+            if old is not None and not allow_conflict and (date is not None or planned_time is not None):
+                new = dict(old)
+                new.update((k, v) for k, v in (
+                    ("date", date), ("planned_time", planned_time),
+                    ("arrival_time", arrival_time), ("leave_time", leave_time)
+                ) if v is not None)
+                span = schedule.appt_span(new)   # 旧数据的预约时间解析不了时不检查
+                clash = span and schedule.find_conflicts(conn, new["date"], *span, exclude_id=tid)
+                if clash:
+                    raise _Rejected(schedule.conflict_message(clash))
+            conn.execute(sql, params + [tid])
+            if services is not None and old is not None:
+                _set_services(conn, tid, date or old["date"], parse_services(_normalize_services(services)))
+            if return_row:
+                row = conn.execute(f"SELECT {_ALL_COLUMNS_SQL} FROM termins WHERE id = ?", (tid,)).fetchone()
+    except _Rejected as e:
+        return (False, e.msg, e.row) if return_row else (False, e.msg)
+    if old is not None:
+        _invalidate_dates(old["date"], date)
+
+    if return_row:
+        return True, "更新成功", dict(row) if row else None
+    return True, "更新成功"
+
+
+class _Rejected(Exception):
+    """在 write_conn() 里抛出：回滚这次事务里已经做的（例如刚转成真实行的疗程预约），返回失败"""
+
+    def __init__(self, msg, row=None):
+        super().__init__(msg)
+        self.msg = msg
+        self.row = row
+
+
+def _set_services(conn, tid, date_iso, names):
+    """同步 termin_services 关联表（services 文本列由调用方写入）"""
+    _set_services_many(conn, [(tid, date_iso)], names)
+
+
+def _set_services_many(conn, targets, names):
+    """targets: [(termin_id, date), ...]，这些预约的项目都设为 names"""
+    conn.executemany("DELETE FROM termin_services WHERE termin_id = ?", [(t,) for t, _ in targets])
+    if not names or not targets:
+        return
+    conn.executemany("INSERT OR IGNORE INTO services (name) VALUES (?)", [(n,) for n in names])
+    conn.executemany("""
+        INSERT OR IGNORE INTO termin_services (termin_id, service_id, date)
+        SELECT ?, id, ? FROM services WHERE name = ?
+    """, [(t, d, n) for t, d in targets for n in names])
+
+
+def delete_termin(tid, expected_version=None):
+    """
+    返回被删除的行，不存在时返回 None；疗程里的某一次只记为取消，规则不变
+    expected_version 与数据库里的不一致（别人改过）时不删除，抛出 VersionConflict
+    已归档的行不能删除，抛出 archive.ArchiveError
+    """
+    if series.parse_occurrence_id(tid):
+        sid, d = series.parse_occurrence_id(tid)
+        with write_conn() as conn:
+            row = series.get_occurrence(conn, tid)
+            if row is None:
+                if expected_version is not None:
+                    # 别人已经改过这一次（转成了真实行），不能当作已删除
+                    real = conn.execute(f"""
+                        SELECT {_select_list(None, "t.")} FROM series_exceptions e
+                        JOIN termins t ON t.id = e.termin_id
+                        WHERE e.series_id = ? AND e.date = ?
+                    """, (sid, d)).fetchone()
+                    if real is not None:
+                        raise VersionConflict(dict(real))
+                return None
+            if expected_version is not None and row["version"] != int(expected_version):
+                raise VersionConflict(row)
+            conn.execute(
+                "INSERT OR IGNORE INTO series_exceptions (series_id, date, termin_id) VALUES (?, ?, NULL)",
+                (sid, d)
+            )
+        _invalidate_dates(d)
+        return row
+
+    with write_conn() as conn:
+        row = conn.execute(f"SELECT {_ALL_COLUMNS_SQL} FROM termins WHERE id = ?", (tid,)).fetchone()
+        if row is None:
+            if archive.find(tid):
+                raise archive.ArchiveError(ARCHIVED_MSG)
+            return None
+        if expected_version is not None and row["version"] != int(expected_version):
+            raise VersionConflict(dict(row))
+        conn.execute("DELETE FROM termins WHERE id = ?", (tid,))
+    _invalidate_dates(row["date"])
+    return dict(row)
+
+# ----------------- 批量操作 -----------------
+# 只能批量改不挪动预约时间的字段，所以不用做时间冲突检查
+BULK_FIELDS = ("arrival_time", "leave_time", "services", "invoice_sent")
+
+
+def _version_ok(row, expected_versions, tid):
+    want = expected_versions.get(tid)
+    return want is None or row["version"] == int(want)
+
+
+def bulk_update_termins(ids, *, expected_versions=None, **fields):
+    """
+    在一个事务里把 ids 这些预约的同几个字段改成同样的值（例如月底批量标记账单已发送）
+    fields 只能是 BULK_FIELDS；疗程里现算的预约先转成真实行
+    expected_versions: {id: version}；对不上的行（别人刚改过 / 删掉）跳过，其它行照改
+    返回 (ok, msg, rows)，rows 为改好的行
+    """
+    unknown = set(fields) - set(BULK_FIELDS)
+    if unknown:
+        return False, f"不能批量修改: {', '.join(sorted(unknown))}", []
+    try:
+        sets, values = _set_clause(**fields)
+    except ValueError:
+        return False, TIME_FORMAT_MSG, []
+    ids = list(dict.fromkeys(ids))
+    if not sets or not ids:
+        return True, "无修改", []
+    expected = dict(expected_versions or {})
+
+    with write_conn() as conn:
+        targets = []
+        for tid in ids:
+            if series.parse_occurrence_id(tid):
+                # 与 update_termin 相同：自己刚转的不用比版本，别人先转过的按版本 0 比（一定冲突）
+                real, created = _materialize(conn, tid)
+                want = expected.pop(tid, None)
+                if real is None:
+                    continue
+                if not created:
+                    expected[real] = want
+                tid = real
+            targets.append(tid)
+
+        current = _fetch_by_ids(conn, targets, ("date", "version"))
+        done = [t for t in targets if t in current and _version_ok(current[t], expected, t)]
+        conn.executemany(
+            f"UPDATE termins SET {', '.join(sets)}, version = version + 1 WHERE id = ?",
+            [(*values, t) for t in done]
+        )
+        if "services" in fields:
+            _set_services_many(
+                conn, [(t, current[t]["date"]) for t in done],
+                parse_services(_normalize_services(fields["services"]))
+            )
+        rows = _fetch_by_ids(conn, done)
+    # 转成真实行的疗程预约已经包含在 rows 里（它们的版本一定对得上）
+    _invalidate_dates(*{r["date"] for r in rows.values()})
+
+    msg = f"已修改 {len(done)} 条"
+    if len(done) < len(ids):
+        msg += f"，{len(ids) - len(done)} 条已被其他人改动或删除，没有修改"
+    return True, msg, [rows[t] for t in done]
+
+
+def bulk_delete_termins(ids, *, expected_versions=None):
+    """
+    在一个事务里删掉 ids；疗程里的某一次记为取消
+    expected_versions 同 bulk_update_termins，对不上的行不删
+    返回 (ok, msg, rows)，rows 为删掉的行
+    """
+    ids = list(dict.fromkeys(ids))
+    expected = dict(expected_versions or {})
+    real_ids = [t for t in ids if not series.parse_occurrence_id(t)]
+    occ_ids = [t for t in ids if series.parse_occurrence_id(t)]
+
+    with write_conn() as conn:
+        current = _fetch_by_ids(conn, real_ids)
+        deleted = [current[t] for t in real_ids if t in current and _version_ok(current[t], expected, t)]
+        conn.executemany("DELETE FROM termins WHERE id = ?", [(r["id"],) for r in deleted])
+
+        cancelled = []
+        for tid in occ_ids:
+            row = series.get_occurrence(conn, tid)
+            if row is not None and _version_ok(row, expected, tid):
+                cancelled.append(row)
+        conn.executemany(
+            "INSERT OR IGNORE INTO series_exceptions (series_id, date, termin_id) VALUES (?, ?, NULL)",
+            [series.parse_occurrence_id(r["id"]) for r in cancelled]
+        )
+    rows = deleted + cancelled
+    _invalidate_dates(*{r["date"] for r in rows})
+
+    msg = f"已删除 {len(rows)} 条"
+    if len(rows) < len(ids):
+        msg += f"，{len(ids) - len(rows)} 条已被其他人改动或删除，没有删除"
+    return True, msg, rows
+
+
+# ----------------- 变更通知 -----------------
+# 变更日志 termin_changes 由触发器维护（见 db.MIGRATIONS 第 9 步），别的进程的写入也会记进去
+# 界面记下上次看到的 seq，定时问"这之后哪些行变了"，只更新这些行
+CHANGES_MAX = 500   # 一次变化超过这么多行时，不如整体刷新
+
+
+def change_seq():
+    """当前最新的变更序号；刷新整张表之前先取，之后用 get_changes(seq) 追上"""
+    with get_conn() as conn:
+        return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM termin_changes").fetchone()[0]
+
+
+def changes_since(seq):
+    """
+    返回 (最新序号, seq 之后变化过的 id)；id 为 None 表示需要整体刷新：
+    变化太多、日志已经裁掉了 seq 之后的一部分、疗程规则变了、批量导入或还原了备份
+    """
+    with get_conn() as conn:
+        rows = conn.execute(
+            "SELECT seq, termin_id FROM termin_changes WHERE seq > ? ORDER BY seq LIMIT ?",
+            (seq, CHANGES_MAX + 1)
+        ).fetchall()
+        if not rows:
+            latest = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM termin_changes").fetchone()[0]
+            # 序号倒退：数据库被换掉了（还原备份）
+            return (latest, None) if latest < seq else (seq, [])
+    last = rows[-1]["seq"]
+    # seq 是连续的（只裁最旧的），第一条对不上就是中间有被裁掉的
+    if rows[0]["seq"] != seq + 1 or len(rows) > CHANGES_MAX or any(r["termin_id"] is None for r in rows):
+        return last, None
+    return last, list(dict.fromkeys(r["termin_id"] for r in rows))
+
+
+def get_changes(seq, columns=None):
+    """
+    changes_since 再取出变化的行：返回 (最新序号, rows, deleted_ids)
+    rows 为现在的行（已被删除或取消的不在其中，id 在 deleted_ids 里）；需要整体刷新时 rows 为 None
+    """
+    new_seq, ids = changes_since(seq)
+    if ids is None:
+        return new_seq, None, None
+    if not ids:
+        return new_seq, [], []
+    real = [t for t in ids if not series.parse_occurrence_id(t)]
+    rows = get_termins_by_ids(real, columns)
+    for tid in ids:
+        if series.parse_occurrence_id(tid):
+            row = get_termin(tid, columns)
+            if row is not None:
+                rows.append(row)
+    found = {r["id"] for r in rows}
+    return new_seq, rows, [t for t in ids if t not in found]
+
+
+# ----------------- 重复预约 -----------------
+def _materialize(conn, tid):
+    """
+    在调用方的写事务里把现算的某一次疗程预约转成 termins 里的真实行，返回 (id, 是否这次新建)
+    已转过的返回那一行的 id；已取消的返回 None
+    调用方提交后负责让这一天的缓存失效（改好的行在同一天）；回滚时什么都没发生
+    """
+    sid, d = series.parse_occurrence_id(tid)
+    done = conn.execute(
+        "SELECT termin_id FROM series_exceptions WHERE series_id = ? AND date = ?", (sid, d)
+    ).fetchone()
+    if done is not None:
+        return done["termin_id"], False
+    row = series.get_occurrence(conn, tid)
+    if row is None:
+        return None, False
+    row["id"] = _now_id()
+    conn.execute(_INSERT_SQL, row)
+    _set_services(conn, row["id"], d, parse_services(row["services"]))
+    conn.execute(
+        "INSERT INTO series_exceptions (series_id, date, termin_id) VALUES (?, ?, ?)",
+        (sid, d, row["id"])
+    )
+    return row["id"], True
+
+
+def add_series(patient, start_ddmmyyyy, planned_time, interval_weeks=1, count=None,
+               until_ddmmyyyy=None, services=None):
+    """
+    新建重复预约：从 start 那天起每 interval_weeks 周一次
+    count（次数）和 until（DD-MM-YYYY）都给时先到者为准，都不给表示一直持续
+    返回 (ok, msg, series_id)，失败时 series_id 为 None
+    """
+    try:
+        start = datetime.strptime(start_ddmmyyyy, "%d-%m-%Y").strftime("%Y-%m-%d")
+        until = datetime.strptime(until_ddmmyyyy, "%d-%m-%Y").strftime("%Y-%m-%d") if until_ddmmyyyy else None
+    except ValueError:
+        return False, "日期格式错误，应为 DD-MM-YYYY", None
+    try:
+        planned_time = schedule.normalize_hm(planned_time)
+    except ValueError:
+        return False, TIME_FORMAT_MSG, None
+    interval_weeks = int(interval_weeks)
+    count = int(count) if count else None
+    if interval_weeks < 1 or (count is not None and count < 1):
+        return False, "间隔和次数至少为 1", None
+    if until and until < start:
+        return False, "截止日期早于开始日期", None
+
+    sid = _now_id()
+    with write_conn() as conn:
+        conn.execute("""
+            INSERT INTO series (id, patient, planned_time, services, start_date,
+                                interval_weeks, count, until_date, end_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            sid, patient, planned_time, _normalize_services(services or []), start,
+            interval_weeks, count, until,
+            series.end_date(start, interval_weeks, count, until)
+        ))
+    # 涉及的日期可能很多，直接清空
+    clear_cache()
+    schedule.clear_cache()
+    return True, "创建成功", sid
+
+
+def list_series():
+    with get_conn() as conn:
+        return [dict(r) for r in conn.execute("SELECT * FROM series ORDER BY start_date, planned_time")]
+
+
+def delete_series(sid):
+    """删除规则和例外；已经转成真实行的那几次保留在 termins 里。返回是否存在"""
+    with write_conn() as conn:
+        n = conn.execute("DELETE FROM series WHERE id = ?", (sid,)).rowcount
+        conn.execute("DELETE FROM series_exceptions WHERE series_id = ?", (sid,))
+    clear_cache()
+    schedule.clear_cache()
+    return n > 0
+
+
+# ----------------- 按项目统计 -----------------
+
+def list_services():
+    """所有出现过的项目名"""
+    with get_conn() as conn:
+        return [r[0] for r in conn.execute("SELECT name FROM services ORDER BY name")]
+
+
+def _service_date_sql(date_from, date_to, table="ts."):
+    sql = ""
+    params = []
+    if date_from:
+        sql += f" AND {table}date >= ?"
+        params.append(date_from)
+    if date_to:
+        sql += f" AND {table}date <= ?"
+        params.append(date_to)
+    return sql, params
+
+
+def count_by_service(date_from=None, date_to=None):
+    """日期范围内每个项目的次数 [(项目, 次数)]，按次数从多到少；包括归档年份"""
+    where, params = _service_date_sql(date_from, date_to)
+    sql = (
+        "SELECT s.name, COUNT(*) AS n FROM termin_services ts"
+        " JOIN services s ON s.id = ts.service_id"
+        f" WHERE 1=1{where}"
+        " GROUP BY ts.service_id ORDER BY n DESC, s.name"
+    )
+    with get_conn() as conn:
+        result = [(r[0], r[1]) for r in conn.execute(sql, params)]
+        years = archive.years_for(date_from, date_to)
+        for y in years:
+            result += [(r[0], r[1]) for r in archive.get_conn(y).execute(sql, params)]
+    if not years:
+        return result
+    # 每个文件有自己的项目目录，按名字合并（不区分大小写，同 services.name）
+    totals = {}
+    for name, n in result:
+        shown, total = totals.get(name.lower(), (name, 0))
+        totals[name.lower()] = (shown, total + n)
+    return sorted(totals.values(), key=lambda x: (-x[1], x[0].lower()))
+
+
+def count_service(name, date_from=None, date_to=None):
+    """某个项目在日期范围内的次数（只扫 (service_id, date) 索引）；包括归档年份"""
+    where, params = _service_date_sql(date_from, date_to, table="")
+    sql = (
+        "SELECT COUNT(*) FROM termin_services"
+        f" WHERE service_id = (SELECT id FROM services WHERE name = ?){where}"
+    )
+    params = [name.strip()] + params
+    with get_conn() as conn:
+        sources = [conn] + [archive.get_conn(y) for y in archive.years_for(date_from, date_to)]
+        return sum(c.execute(sql, params).fetchone()[0] for c in sources)
+
+
+def _by_service_sql(columns, where, limit_sql):
+    return (
+        f"SELECT {_select_list(columns, 't.')} FROM termin_services ts"
+        " JOIN termins t ON t.id = ts.termin_id"
+        f" WHERE ts.service_id = (SELECT id FROM services WHERE name = ?){where}"
+        f" ORDER BY t.date, t.planned_time, t.id{limit_sql}"
+    )
+
+
+def get_termins_by_service(name, date_from=None, date_to=None, limit=None, offset=None, columns=None):
+    """做过某个项目的预约，排序与 get_termins 相同；包括归档年份"""
+    where, params = _service_date_sql(date_from, date_to)
+    params = [name.strip()] + params
+    with get_conn() as conn:
+        years = archive.years_for(date_from, date_to)
+        if not years:
+            limit_sql, limit_params = _limit_sql(limit, offset)
+            return [dict(r) for r in conn.execute(_by_service_sql(columns, where, limit_sql), params + limit_params)]
+        # 同 _query_rows：每个文件最多取 stop 行，归并之后再分页
+        skip = offset or 0
+        stop = skip + limit if limit is not None else None
+        limit_sql, limit_params = _limit_sql(stop)
+        extra = tuple(c for c in columns or () if c in DERIVED_COLUMNS)
+        sql = _by_service_sql(TERMIN_COLUMNS + extra, where, limit_sql)
+        sources = [conn] + [archive.get_conn(y) for y in years]
+        parts = [[dict(r) for r in c.execute(sql, params + limit_params)] for c in sources]
+    return [_project(r, columns) for r in islice(heapq.merge(*parts, key=page_key), skip, stop)]
+
+
+EXPORT_BATCH = 1000
+
+
+class ExportCancelled(Exception):
+    """导出被用户取消（已写了一半的文件会被删除）"""
+
+
+VERSION_CONFLICT_MSG = "这条预约已被其他人改动"
+TIME_FORMAT_MSG = "时间格式错误，应为 HH:MM"
+ARCHIVED_MSG = "这条预约已归档，不能再修改或删除"
+
+
+class VersionConflict(Exception):
+    """expected_version 与数据库里的不一致；row 为数据库里现在的行"""
+
+    def __init__(self, row):
+        super().__init__(VERSION_CONFLICT_MSG)
+        self.row = row
+
+
+def export_termins_to_csv(
+    csv_path: str,
+    date_from=None,
+    date_to=None,
+    status=None,
+    invoice_sent=None,
+    patient=None,
+    compress=None,
+    progress=None,
+    cancel=None,
+    batch_size=EXPORT_BATCH
+):
+    """
+    将当前 SQLite 中的 termins 表导出为 CSV，过滤参数与 get_termins 相同
+    按游标分批读取、边读边写，内存占用与表大小无关
+    先写到旁边的 .tmp 文件，写完才改名：中途取消 / 出错 / 程序被关掉都不会留下半截的文件
+
+    compress: True 写 gzip；默认按文件名是否以 .gz 结尾决定
+    progress: progress(已导出行数, 总行数)，每批调用一次
+    cancel:   threading.Event 之类带 is_set() 的对象，置位后抛出 ExportCancelled
+    返回导出的行数
+    """
+    import csv
+    import gzip
+
+    csv_path = Path(csv_path)
+    if compress is None:
+        compress = csv_path.suffix.lower() == ".gz"
+
+    # 只导出真实的行；count_termins 还会算上现算的疗程预约
+    # 碰到已归档的年份时，各个库的游标按 (date, planned_time, id) 归并，仍然是边读边写
+    where, params = _filter_sql(date_from, date_to, status, invoice_sent, patient)
+    sources = [get_conn()] + [archive.get_conn(y) for y in archive.years_for(date_from, date_to)]
+    total = sum(
+        c.execute(f"SELECT COUNT(*) FROM termins WHERE 1=1{where}", params).fetchone()[0] for c in sources
+    )
+    if not total:
+        raise RuntimeError("当前没有任何数据可导出")
+
+    sql = f"SELECT {', '.join(CSV_COLUMNS)} FROM termins WHERE 1=1{where} ORDER BY date, planned_time, id"
+
+    tmp = csv_path.with_name(csv_path.name + ".tmp")
+    if compress:
+        f = gzip.open(tmp, "wt", newline="", encoding="utf-8-sig")
+    else:
+        f = tmp.open("w", newline="", encoding="utf-8-sig")
+
+    done = 0
+    try:
+        with f:
+            writer = csv.writer(f)
+            cursors = [c.execute(sql, params) for c in sources]
+
+            # 表头
+            writer.writerow([d[0] for d in cursors[0].description])
+
+            # 数据行
+            if len(cursors) == 1:
+                rows = cursors[0]
+            else:
+                rows = heapq.merge(*cursors, key=lambda r: (r[1], r[2], r[0]))
+            while True:
+                if cancel is not None and cancel.is_set():
+                    raise ExportCancelled()
+                batch = rows.fetchmany(batch_size) if len(cursors) == 1 else list(islice(rows, batch_size))
+                if not batch:
+                    break
+                writer.writerows(batch)
+                done += len(batch)
+                if progress:
+                    progress(done, total)
+        tmp.replace(csv_path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+    return done
+
+
+# TERMIN_PERF=1 时计时的函数：都是访问数据库的入口
+TIMED_FUNCTIONS = (
+    "get_termins", "get_termin", "get_termins_by_ids", "search_termins", "count_termins",
+    "add_termin", "update_termin", "delete_termin", "bulk_update_termins", "bulk_delete_termins",
+    "change_seq", "changes_since", "get_changes",
+    "add_series", "list_series", "delete_series",
+    "list_services", "count_by_service", "count_service", "get_termins_by_service",
+    "export_termins_to_csv",
+)
+instrument.instrument_module(globals(), TIMED_FUNCTIONS)
@@ -1,758 +1,1612 @@
-import tkinter as tk
-from tkinter import ttk, messagebox
-from datetime import date, datetime, timedelta
-
-
-from termin import (
-    get_termins,
-    add_termin,
-    update_termin,
-    delete_termin,
-    parse_services,
-    export_termins_to_csv
-)
-
-# ----------------- 常量 -----------------
-HOURS = [f"{i:02d}" for i in range(24)]
-MINS = [f"{i:02d}" for i in range(60)]
-WEEKDAY_CN = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
-
-
-# ----------------- 工具 -----------------
-def valid_date_ddmmyyyy(s: str) -> bool:
-    try:
-        datetime.strptime(s, "%d-%m-%Y")
-        return True
-    except ValueError:
-        return False
-
-
-def valid_date_yyyymmdd(s: str) -> bool:
-    try:
-        datetime.strptime(s, "%Y-%m-%d")
-        return True
-    except ValueError:
-        return False
-
-
-def weekday_cn_from_iso(iso_date: str) -> str:
-    try:
-        d = datetime.strptime(iso_date, "%Y-%m-%d").date()
-        return WEEKDAY_CN[d.weekday()]
-    except Exception:
-        return ""
-
-
-def date_de_from_iso(iso_date: str) -> str:
-    try:
-        return datetime.strptime(iso_date, "%Y-%m-%d").strftime("%d.%m.%Y")
-    except Exception:
-        return ""
-
-
-def normalize_services_text(s: str) -> str:
-    s = (s or "").replace("，", ";").replace(",", ";")
-    parts = [x.strip() for x in s.split(";") if x.strip()]
-    return ";".join(parts)
-
-
-def services_str_to_display(s: str) -> str:
-    return ", ".join(parse_services(s or ""))
-
-
-# ----------------- 时间选择控件 -----------------
-class TimePicker(ttk.Frame):
-    def __init__(self, master, initial="00:00"):
-        super().__init__(master)
-        self.h = tk.StringVar()
-        self.m = tk.StringVar()
-
-        self.cb_h = ttk.Combobox(self, values=HOURS, width=3, state="readonly", textvariable=self.h)
-        self.cb_m = ttk.Combobox(self, values=MINS, width=3, state="readonly", textvariable=self.m)
-
-        self.cb_h.grid(row=0, column=0, padx=(0, 6))
-        ttk.Label(self, text=":").grid(row=0, column=1)
-        self.cb_m.grid(row=0, column=2, padx=(6, 0))
-
-        self.set_time(initial)
-
-    def set_enabled(self, enabled: bool):
-        state = "readonly" if enabled else "disabled"
-        self.cb_h.configure(state=state)
-        self.cb_m.configure(state=state)
-
-    def set_time(self, t: str):
-        try:
-            hh, mm = (t or "00:00").split(":")
-        except Exception:
-            hh, mm = "00", "00"
-        self.h.set(hh if hh in HOURS else "00")
-        self.m.set(mm if mm in MINS else "00")
-
-    def get_time(self) -> str:
-        return f"{self.h.get()}:{self.m.get()}"
-
-
-# ================= 主窗口 =================
-class TerminApp(tk.Tk):
-    def __init__(self):
-        super().__init__()
-        self.title("Termin System")
-        self.geometry("1200x650")
-        self.minsize(1050, 580)
-
-        self.range_var = tk.StringVar(value="today")
-        self.status_var = tk.StringVar(value="all")
-        self.invoice_var = tk.StringVar(value="all")
-        self.name_search_var = tk.StringVar()   # ← 明确：姓名搜索
-
-        self._style()
-        self._build_ui()
-        self.refresh()
-
-    def _style(self):
-        style = ttk.Style(self)
-        style.configure("Treeview", rowheight=30, font=("Segoe UI", 10))
-        style.configure("Treeview.Heading", font=("Segoe UI", 10, "bold"))
-
-    def export_csv(self):
-        from tkinter import filedialog
-
-        path = filedialog.asksaveasfilename(
-            title="导出为 CSV",
-            defaultextension=".csv",
-            filetypes=[("CSV 文件", "*.csv")]
-        )
-
-        if not path:
-            return
-
-        try:
-            export_termins_to_csv(path)
-            messagebox.showinfo("导出成功", f"已成功导出到：\n{path}")
-        except Exception as e:
-            messagebox.showerror("导出失败", str(e))
-
-    def _build_ui(self):
-        top = ttk.Frame(self, padding=10)
-        top.pack(fill="x")
-
-        ttk.Label(top, text="范围").pack(side="left")
-        for t, v in [("今天", "today"), ("本月", "month"), ("全部", "all")]:
-            ttk.Radiobutton(top, text=t, value=v, variable=self.range_var,
-                            command=self.refresh).pack(side="left", padx=6)
-
-        ttk.Separator(top, orient="vertical").pack(side="left", fill="y", padx=12)
-
-        ttk.Label(top, text="状态").pack(side="left")
-        for t, v in [("全部", "all"), ("到达", "arrived"), ("未到", "scheduled")]:
-            ttk.Radiobutton(top, text=t, value=v, variable=self.status_var,
-                            command=self.refresh).pack(side="left", padx=6)
-
-        ttk.Separator(top, orient="vertical").pack(side="left", fill="y", padx=12)
-
-        ttk.Label(top, text="账单").pack(side="left")
-        for t, v in [("全部", "all"), ("已发送", "yes"), ("未发送", "no")]:
-            ttk.Radiobutton(top, text=t, value=v, variable=self.invoice_var,
-                            command=self.refresh).pack(side="left", padx=6)
-
-        ttk.Separator(top, orient="vertical").pack(side="left", fill="y", padx=12)
-
-        ttk.Label(top, text="搜索（姓名）").pack(side="left")
-        ttk.Entry(top, textvariable=self.name_search_var, width=22).pack(side="left", padx=8)
-        ttk.Button(top, text="应用", command=self.refresh).pack(side="left")
-
-
-        # 表格
-        self.columns = (
-            "planned", "weekday", "date_de", "patient", "arrived",
-            "range", "services", "invoice", "edit", "delete"
-        )
-        self.tree = ttk.Treeview(self, columns=self.columns, show="headings")
-        self.tree.pack(fill="both", expand=True, padx=10, pady=8)
-
-        headers = {
-            "planned": "预约时间",
-            "weekday": "星期",
-            "date_de": "日期",
-            "patient": "姓名",
-            "arrived": "到达",
-            "range": "到达-离开",
-            "services": "项目",
-            "invoice": "账单",
-            "edit": "",
-            "delete": ""
-        }
-        widths = {
-            "planned": 90, "weekday": 80, "date_de": 110, "patient": 140,
-            "arrived": 70, "range": 160, "services": 320,
-            "invoice": 70, "edit": 45, "delete": 45
-        }
-        for c in self.columns:
-            self.tree.heading(c, text=headers[c])
-            self.tree.column(c, width=widths[c], anchor="center")
-
-        self.tree.bind("<Button-1>", self.on_click)
-
-        bottom = ttk.Frame(self, padding=10)
-        bottom.pack(fill="x")
-        ttk.Button(bottom, text="➕ 新建预约",
-                   command=lambda: NewTerminDialog(self)).pack(side="left")
-        ttk.Button(bottom, text="🗓 今日时间表",
-                   command=lambda: TodayTimelineDialog(self)).pack(side="left", padx=10)
-        ttk.Button(bottom, text="🗓 本周时间表",
-                   command=lambda: WeekTimelineDialog(self)).pack(side="left", padx=10)
-        ttk.Button(
-            bottom,
-            text="📤 导出 CSV",
-            command=self.export_csv
-        ).pack(side="right")
-
-    def refresh(self):
-        self.tree.delete(*self.tree.get_children())
-
-        today = date.today().strftime("%Y-%m-%d")
-        df = dt = None
-        if self.range_var.get() == "today":
-            df = dt = today
-        elif self.range_var.get() == "month":
-            df = today[:7] + "-01"
-            dt = today[:7] + "-31"
-
-        status = None if self.status_var.get() == "all" else self.status_var.get()
-        invoice = None if self.invoice_var.get() == "all" else self.invoice_var.get()
-
-        rows = get_termins(date_from=df, date_to=dt, status=status)
-        rows.sort(key=lambda r: (r["date"], r["planned_time"]))
-
-        name_kw = self.name_search_var.get().strip()
-
-        for r in rows:
-            if name_kw and name_kw not in r["patient"]:
-                continue
-            if invoice and r.get("invoice_sent", "no") != invoice:
-                continue
-
-            self.tree.insert(
-                "", "end", iid=r["id"],
-                values=(
-                    r["planned_time"],
-                    weekday_cn_from_iso(r["date"]),
-                    date_de_from_iso(r["date"]),
-                    r["patient"],
-                    "☑" if r["status"] == "arrived" else "☐",
-                    f"{r['arrival_time']}–{r['leave_time']}" if r["arrival_time"] else "",
-                    services_str_to_display(r.get("services", "")),
-                    "☑" if r.get("invoice_sent") == "yes" else "☐",
-                    "修改🖊",
-                    "删除🗑"
-                )
-            )
-
-    def on_click(self, event):
-        if self.tree.identify("region", event.x, event.y) != "cell":
-            return
-        row_id = self.tree.identify_row(event.y)
-        col = self.tree.identify_column(event.x)
-        if not row_id:
-            return
-
-        idx = int(col[1:]) - 1
-        if idx == self.columns.index("arrived"):
-            ArrivalDialog(self, row_id)
-        elif idx == self.columns.index("edit"):
-            EditDialog(self, row_id)
-        elif idx == self.columns.index("delete"):
-            if messagebox.askyesno("确认删除", "确定删除这条 Termin 吗？"):
-                delete_termin(row_id)
-                self.refresh()
-
-# ================= 本周时间表窗口 =================
-class WeekTimelineDialog(tk.Toplevel):
-    def __init__(self, parent):
-        super().__init__(parent)
-        self.title("本周时间表")
-        self.geometry("1000x800")
-
-        self.canvas = tk.Canvas(self, bg="white", highlightthickness=0)
-        self.canvas.pack(fill="both", expand=True)
-
-        self.canvas.bind("<Configure>", self.redraw)
-
-    def redraw(self, event=None):
-        c = self.canvas
-        c.delete("all")
-
-        width = c.winfo_width()
-        height = c.winfo_height()
-        if width < 100:
-            return
-
-        # ---------- 本周范围 ----------
-        today = date.today()
-        monday = today - timedelta(days=today.weekday())
-        week_days = [monday + timedelta(days=i) for i in range(7)]
-
-        rows = get_termins(
-            date_from=monday.strftime("%Y-%m-%d"),
-            date_to=(monday + timedelta(days=6)).strftime("%Y-%m-%d")
-        )
-
-        # ---------- 布局参数 ----------
-        hour_height = 34
-        top_pad = 40
-        axis_w = 80
-        col_gap = 6
-
-        left = axis_w + 10
-        right = width - 20
-        usable_w = right - left
-        col_w = (usable_w - col_gap * 6) / 7
-
-        # ---------- 星期标题 ----------
-        for i, d in enumerate(week_days):
-            x = left + i * (col_w + col_gap) + col_w / 2
-            label = f"{WEEKDAY_CN[d.weekday()]}\n{d.strftime('%m-%d')}"
-            c.create_text(
-                x, 16,
-                text=label,
-                font=("Segoe UI", 10, "bold"),
-                fill="#333",
-                justify="center"
-            )
-
-        # ---------- 每日列背景 + 竖线 ----------
-        for i in range(7):
-            x1 = left + i * (col_w + col_gap)
-            x2 = x1 + col_w
-
-            # 淡背景（可选，增强列感）
-            c.create_rectangle(
-                x1, top_pad,
-                x2, top_pad + 24 * hour_height,
-                fill="#fafafa",
-                outline=""
-            )
-
-            # 竖分隔线
-            c.create_line(
-                x1, top_pad,
-                x1, top_pad + 24 * hour_height,
-                fill="#ddd"
-            )
-
-        # 最右侧边界线
-        c.create_line(
-            right, top_pad,
-            right, top_pad + 24 * hour_height,
-            fill="#ddd"
-        )
-
-        # ---------- 时间轴 ----------
-        for h in range(24):
-            y = top_pad + h * hour_height
-
-            c.create_text(
-                axis_w - 6, y,
-                text=f"{h:02d}:00",
-                anchor="e",
-                font=("Segoe UI", 9),
-                fill="#555"
-            )
-
-            c.create_line(left, y, right, y, fill="#eee")
-
-
-
-        # ---------- 预约块 ----------
-        for r in rows:
-            d = datetime.strptime(r["date"], "%Y-%m-%d").date()
-            day_idx = (d - monday).days
-            if not (0 <= day_idx <= 6):
-                continue
-
-            if r["arrival_time"] and r["leave_time"]:
-                start = r["arrival_time"]
-                end = r["leave_time"]
-            else:
-                start = r["planned_time"]
-                t = datetime.strptime(start, "%H:%M") + timedelta(minutes=90)
-                end = t.strftime("%H:%M")
-
-            sh, sm = map(int, start.split(":"))
-            eh, em = map(int, end.split(":"))
-
-            y1 = top_pad + sh * hour_height + (sm / 60) * hour_height
-            y2 = top_pad + eh * hour_height + (em / 60) * hour_height
-
-            x1 = left + day_idx * (col_w + col_gap)
-            x2 = x1 + col_w
-
-            c.create_rectangle(
-                x1, y1, x2, y2,
-                fill="#cce5ff",
-                outline="#4a90e2"
-            )
-
-            pad_x = 6
-            pad_y = 6
-            line_h = 16
-
-            # 姓名（主信息）
-            c.create_text(
-                x1 + pad_x,
-                y1 + pad_y,
-                text=r["patient"],
-                anchor="nw",
-                font=("Segoe UI", 9, "bold"),
-                fill="#000"
-            )
-
-            # 时间（次信息）
-            c.create_text(
-                x1 + pad_x,
-                y1 + pad_y + line_h,
-                text=f"{start}–{end}",
-                anchor="nw",
-                font=("Segoe UI", 9),
-                fill="#333"
-            )
-
-            # ---------- 今日红线（仅当在本周） ----------
-            now = datetime.now()
-            if monday <= now.date() <= monday + timedelta(days=6):
-                day_idx = (now.date() - monday).days
-                x1 = left + day_idx * (col_w + col_gap)
-                x2 = x1 + col_w
-                y = top_pad + now.hour * hour_height + (now.minute / 60) * hour_height
-
-                c.create_line(x1, y, x2, y, fill="#d9534f", width=2)
-
-
-
-
-# ================= 今日时间表窗口 =================
-import tkinter as tk
-from datetime import datetime, date, timedelta
-
-class TodayTimelineDialog(tk.Toplevel):
-    def __init__(self, parent):
-        super().__init__(parent)
-        self.title("今日时间表")
-        self.geometry("700x800")
-
-        self.canvas = tk.Canvas(self, bg="white", highlightthickness=0)
-        self.canvas.pack(fill="both", expand=True)
-
-        # 绑定 resize / 首次显示
-        self.canvas.bind("<Configure>", self.redraw)
-
-    def redraw(self, event=None):
-        canvas = self.canvas
-        canvas.delete("all")  # 关键：重画
-
-        width = canvas.winfo_width()
-        height = canvas.winfo_height()
-        if width < 50:  # 防止初始化时 width=1
-            return
-
-        today = date.today().strftime("%Y-%m-%d")
-        rows = [r for r in get_termins(date_from=today, date_to=today)]
-
-        hour_height = 34
-        axis_w = 90
-        top_pad = 20
-
-        left = axis_w + 20
-        right = width - 20
-
-        # ===== 时间轴 =====
-        for h in range(24):
-            y = top_pad + h * hour_height
-
-            canvas.create_text(
-                axis_w, y,
-                text=f"{h:02d}:00",
-                anchor="e",
-                fill="#333",
-                font=("Segoe UI", 10, "bold")
-            )
-
-            canvas.create_line(left, y, right, y, fill="#eee")
-
-
-
-        # ===== 预约块 =====
-        for r in rows:
-            if r["arrival_time"] and r["leave_time"]:
-                start = r["arrival_time"]
-                end = r["leave_time"]
-            else:
-                start = r["planned_time"]
-                t = datetime.strptime(start, "%H:%M") + timedelta(minutes=90)
-                end = t.strftime("%H:%M")
-
-            sh, sm = map(int, start.split(":"))
-            eh, em = map(int, end.split(":"))
-
-            y1 = top_pad + sh * hour_height + (sm / 60) * hour_height
-            y2 = top_pad + eh * hour_height + (em / 60) * hour_height
-
-            canvas.create_rectangle(
-                left, y1, right - 20, y2,
-                fill="#cce5ff",
-                outline="#4a90e2"
-            )
-
-            canvas.create_text(
-                left + 8,
-                (y1 + y2) / 2,
-                text=f"{r['patient']}  {start}-{end}",
-                anchor="w",
-                font=("Segoe UI", 10)
-            )
-
-            # ===== 当前时间红线 =====
-            now = datetime.now()
-            now_y = (
-                    top_pad
-                    + now.hour * hour_height
-                    + (now.minute / 60) * hour_height
-            )
-
-            canvas.create_line(
-                left, now_y, right - 20, now_y,
-                fill="#d9534f", width=2
-            )
-
-
-# ----------------- 新建预约 -----------------
-class NewTerminDialog(tk.Toplevel):
-    def __init__(self, parent: TerminApp):
-        super().__init__(parent)
-        self.parent = parent
-        self.title("新建预约")
-        self.geometry("420x260")
-        self.resizable(False, False)
-
-        frm = ttk.Frame(self, padding=14)
-        frm.pack(fill="both", expand=True)
-
-        ttk.Label(frm, text="姓名").grid(row=0, column=0, sticky="w", pady=8)
-        self.patient = ttk.Entry(frm, width=30)
-        self.patient.grid(row=0, column=1, sticky="ew", pady=8)
-
-        ttk.Label(frm, text="日期（DD-MM-YYYY）").grid(row=1, column=0, sticky="w", pady=8)
-        self.date = ttk.Entry(frm, width=30)
-        self.date.grid(row=1, column=1, sticky="ew", pady=8)
-
-        ttk.Label(frm, text="预约时间").grid(row=2, column=0, sticky="w", pady=8)
-        self.time_picker = TimePicker(frm, initial="00:00")
-        self.time_picker.grid(row=2, column=1, sticky="w", pady=8)
-
-        frm.columnconfigure(1, weight=1)
-
-        btns = ttk.Frame(self, padding=10)
-        btns.pack(fill="x")
-        ttk.Button(btns, text="取消", command=self.destroy).pack(side="right")
-        ttk.Button(btns, text="创建", command=self.save).pack(side="right", padx=10)
-
-    def save(self):
-        name = self.patient.get().strip()
-        d = self.date.get().strip()
-
-        if not name:
-            messagebox.showerror("错误", "姓名不能为空")
-            return
-
-        if not valid_date_ddmmyyyy(d):
-            messagebox.showerror("错误", "日期格式错误，应为 DD-MM-YYYY（例如 25-12-2025）")
-            return
-
-        planned = self.time_picker.get_time()
-        ok, msg = add_termin(name, d, planned)
-        if not ok:
-            messagebox.showerror("错误", msg)
-            return
-
-        self.parent.refresh()
-        self.destroy()
-
-
-# ----------------- 到达登记（复选框驱动） -----------------
-class ArrivalDialog(tk.Toplevel):
-    def __init__(self, parent: TerminApp, tid: str):
-        super().__init__(parent)
-        self.parent = parent
-        self.tid = tid
-        self.title("到达登记")
-        self.geometry("460x300")
-        self.resizable(False, False)
-
-        self.original = next(r for r in get_termins() if r["id"] == tid)
-
-        frm = ttk.Frame(self, padding=14)
-        frm.pack(fill="both", expand=True)
-
-        self.arrived_var = tk.BooleanVar(value=(self.original["status"] == "arrived"))
-
-        ttk.Checkbutton(
-            frm, text="是否到达",
-            variable=self.arrived_var,
-            command=self._toggle
-        ).grid(row=0, column=0, columnspan=2, sticky="w", pady=10)
-
-        ttk.Label(frm, text="到达时间").grid(row=1, column=0, sticky="w", pady=8)
-        self.arrival_picker = TimePicker(frm, initial=self.original.get("arrival_time") or "00:00")
-        self.arrival_picker.grid(row=1, column=1, sticky="w", pady=8)
-
-        ttk.Label(frm, text="离开时间").grid(row=2, column=0, sticky="w", pady=8)
-        self.leave_picker = TimePicker(frm, initial=self.original.get("leave_time") or "00:00")
-        self.leave_picker.grid(row=2, column=1, sticky="w", pady=8)
-
-        ttk.Label(frm, text="项目（; 分隔）").grid(row=3, column=0, sticky="w", pady=8)
-        self.services = ttk.Entry(frm, width=40)
-        self.services.insert(0, self.original.get("services", ""))
-        self.services.grid(row=3, column=1, sticky="ew", pady=8)
-
-        frm.columnconfigure(1, weight=1)
-
-        btns = ttk.Frame(self, padding=10)
-        btns.pack(fill="x")
-        ttk.Button(btns, text="取消", command=self.destroy).pack(side="right")
-        ttk.Button(btns, text="保存", command=self.save).pack(side="right", padx=10)
-
-        self._toggle()
-
-    def _toggle(self):
-        on = self.arrived_var.get()
-        self.arrival_picker.set_enabled(on)
-        self.leave_picker.set_enabled(on)
-        self.services.configure(state="normal" if on else "disabled")
-
-    def save(self):
-        if self.arrived_var.get():
-            services_norm = normalize_services_text(self.services.get())
-            update_termin(
-                self.tid,
-                arrival_time=self.arrival_picker.get_time(),
-                leave_time=self.leave_picker.get_time(),
-                services=[x for x in services_norm.split(";") if x]
-            )
-        else:
-            update_termin(self.tid, arrival_time="", leave_time="", services=[])
-
-        self.parent.refresh()
-        self.destroy()
-
-
-# ----------------- 编辑 Termin（全字段 + 默认不改） -----------------
-class EditDialog(tk.Toplevel):
-    def __init__(self, parent: TerminApp, tid: str):
-        super().__init__(parent)
-        self.parent = parent
-        self.tid = tid
-        self.title("编辑 Termin")
-        self.geometry("520x440")
-        self.resizable(False, False)
-
-        self.original = next(r for r in get_termins() if r["id"] == tid)
-
-        frm = ttk.Frame(self, padding=14)
-        frm.pack(fill="both", expand=True)
-
-        ttk.Label(frm, text="姓名").grid(row=0, column=0, sticky="w", pady=8)
-        self.patient = ttk.Entry(frm, width=40)
-        self.patient.insert(0, self.original.get("patient", ""))
-        self.patient.grid(row=0, column=1, sticky="ew", pady=8)
-
-        ttk.Label(frm, text="日期（YYYY-MM-DD）").grid(row=1, column=0, sticky="w", pady=8)
-        self.date = ttk.Entry(frm, width=40)
-        self.date.insert(0, self.original.get("date", ""))
-        self.date.grid(row=1, column=1, sticky="ew", pady=8)
-
-        ttk.Label(frm, text="预约时间").grid(row=2, column=0, sticky="w", pady=8)
-        self.planned_picker = TimePicker(frm, initial=self.original.get("planned_time") or "00:00")
-        self.planned_picker.grid(row=2, column=1, sticky="w", pady=8)
-
-        ttk.Label(frm, text="到达时间").grid(row=3, column=0, sticky="w", pady=8)
-        self.arrival_picker = TimePicker(frm, initial=self.original.get("arrival_time") or "00:00")
-        self.arrival_picker.grid(row=3, column=1, sticky="w", pady=8)
-
-        ttk.Label(frm, text="离开时间").grid(row=4, column=0, sticky="w", pady=8)
-        self.leave_picker = TimePicker(frm, initial=self.original.get("leave_time") or "00:00")
-        self.leave_picker.grid(row=4, column=1, sticky="w", pady=8)
-
-        ttk.Label(frm, text="项目（; 分隔）").grid(row=5, column=0, sticky="w", pady=8)
-        self.services = ttk.Entry(frm, width=40)
-        self.services.insert(0, self.original.get("services", ""))
-        self.services.grid(row=5, column=1, sticky="ew", pady=8)
-
-        self.invoice_var = tk.BooleanVar(value=(self.original.get("invoice_sent", "no") == "yes"))
-        ttk.Checkbutton(frm, text="已发送账单", variable=self.invoice_var)\
-            .grid(row=6, column=1, sticky="w", pady=10)
-
-        frm.columnconfigure(1, weight=1)
-
-        btns = ttk.Frame(self, padding=10)
-        btns.pack(fill="x")
-        ttk.Button(btns, text="取消", command=self.destroy).pack(side="right")
-        ttk.Button(btns, text="保存修改", command=self.save).pack(side="right", padx=10)
-
-    def save(self):
-        updates = {}
-
-        new_patient = self.patient.get().strip()
-        if new_patient and new_patient != self.original.get("patient", ""):
-            updates["patient"] = new_patient
-
-        new_date = self.date.get().strip()
-        if new_date != self.original.get("date", ""):
-            if not valid_date_yyyymmdd(new_date):
-                messagebox.showerror("错误", "日期必须是 YYYY-MM-DD（例如 2025-12-25）")
-                return
-            updates["date"] = new_date
-
-        new_planned = self.planned_picker.get_time()
-        if new_planned != self.original.get("planned_time", ""):
-            updates["planned_time"] = new_planned
-
-        # 到达/离开：允许单独修改；若原来为空，只有当你不是 00:00 才写入
-        new_arrival = self.arrival_picker.get_time()
-        old_arrival = self.original.get("arrival_time", "")
-        if old_arrival:
-            if new_arrival != old_arrival:
-                updates["arrival_time"] = new_arrival
-        else:
-            if new_arrival != "00:00":
-                updates["arrival_time"] = new_arrival
-
-        new_leave = self.leave_picker.get_time()
-        old_leave = self.original.get("leave_time", "")
-        if old_leave:
-            if new_leave != old_leave:
-                updates["leave_time"] = new_leave
-        else:
-            if new_leave != "00:00":
-                updates["leave_time"] = new_leave
-
-        new_services_norm = normalize_services_text(self.services.get())
-        if new_services_norm != self.original.get("services", ""):
-            updates["services"] = [x for x in new_services_norm.split(";") if x]
-
-        new_invoice = "yes" if self.invoice_var.get() else "no"
-        if new_invoice != self.original.get("invoice_sent", "no"):
-            updates["invoice_sent"] = new_invoice
-
-        if updates:
-            ok, msg = update_termin(self.tid, **updates)
-            if not ok:
-                messagebox.showerror("错误", msg)
-                return
-
-        self.parent.refresh()
-        self.destroy()
-
-
-if __name__ == "__main__":
-    TerminApp().mainloop()
+import bisect
+import math
+import os
+import threading
+import time
+from functools import lru_cache
+import tkinter as tk
+from tkinter import ttk, messagebox
+from datetime import date, datetime, timedelta
+
+
+from termin import (
+    get_termins,
+    get_termin,
+    search_termins,
+    count_termins,
+    page_key,
+    add_termin,
+    add_series,
+    update_termin,
+    delete_termin,
+    bulk_update_termins,
+    bulk_delete_termins,
+    change_seq,
+    get_changes,
+    parse_services,
+    export_termins_to_csv,
+    ExportCancelled,
+    VersionConflict,
+    VERSION_CONFLICT_MSG
+)
+from archive import ArchiveError
+from db import close_conn
+import instrument
+from schedule import appt_span, min_to_hm, CONFLICT_MSG
+from worker import get_worker
+
+# 设置了 TERMIN_SERVER（例如 http://192.168.1.10:8765）时，所有读写都经 server.py 完成，
+# 本机不再打开数据库文件；函数名和返回值都一样，界面其余代码不用区分
+SERVER_URL = os.environ.get("TERMIN_SERVER")
+if SERVER_URL:
+    from client import RemoteTermin
+    _remote = RemoteTermin(SERVER_URL)
+    get_termins = _remote.get_termins
+    get_termin = _remote.get_termin
+    search_termins = _remote.search_termins
+    count_termins = _remote.count_termins
+    add_termin = _remote.add_termin
+    add_series = _remote.add_series
+    update_termin = _remote.update_termin
+    delete_termin = _remote.delete_termin
+    bulk_update_termins = _remote.bulk_update_termins
+    bulk_delete_termins = _remote.bulk_delete_termins
+    change_seq = _remote.change_seq
+    get_changes = _remote.get_changes
+    export_termins_to_csv = _remote.export_termins_to_csv
+
+# ----------------- 常量 -----------------
+HOURS = [f"{i:02d}" for i in range(24)]
+MINS = [f"{i:02d}" for i in range(60)]
+WEEKDAY_CN = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
+# *_min / day_num 是数据库算好的整数（分钟数 / 1970-01-01 起的天数），时间轴不用再解析字符串
+TIMELINE_COLUMNS = (
+    "id", "date", "planned_time", "arrival_time", "leave_time", "patient",
+    "day_num", "planned_min", "arrival_min", "leave_min"
+)
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+REPEAT_CHOICES = {"不重复": 0, "每周": 1, "每两周": 2}
+PAGE_SIZE = 200            # 表格每次从数据库取的行数
+MAX_ROWS = 5 * PAGE_SIZE   # 表格里最多保留的行数，超出时移走离可见区域最远的那一头
+LOAD_MORE_AT = 0.9         # 滚动到这个位置以下时加载下一页（到 1 - LOAD_MORE_AT 以上时加载上一页）
+CHANGE_POLL_MS = 2000      # 多久问一次别的前台有没有改过数据（见 termin.get_changes）
+
+
+# ----------------- 后台查询（在读线程里执行） -----------------
+def _fetch_table(query, limit, after=None, with_count=True, before=None):
+    # 先取变更序号再查：查询期间别人的修改之后还会再取一次，不会漏
+    seq = change_seq() if with_count else None
+    total = count_termins(**query) if with_count else None
+    rows = search_termins(
+        query["query"], date_from=query["date_from"], date_to=query["date_to"],
+        status=query["status"], invoice_sent=query["invoice_sent"],
+        limit=limit, after=after, before=before
+    )
+    return seq, total, rows
+
+
+def _fetch_timeline(date_from, date_to):
+    seq = change_seq()
+    return seq, get_termins(date_from=date_from, date_to=date_to, columns=TIMELINE_COLUMNS)
+
+
+class _ChangePoller:
+    """
+    定时调用 get_changes(seq)，把别的前台（其它进程）的修改应用到窗口上，不用整体重新查询
+    子类在第一次加载完成后设置 self._feed_seq，并实现 _apply_changes(rows, deleted) / _reload()
+    """
+    _feed_seq = None
+    _poll_job = None
+    _polling = False
+    _poll_columns = None
+
+    def _start_polling(self):
+        self._poll_job = self.after(CHANGE_POLL_MS, self._poll_changes)
+
+    def _stop_polling(self):
+        if self._poll_job is not None:
+            self.after_cancel(self._poll_job)
+            self._poll_job = None
+
+    def _poll_changes(self):
+        self._poll_job = self.after(CHANGE_POLL_MS, self._poll_changes)
+        if self._feed_seq is None or self._polling or self._busy():
+            return
+        self._polling = True
+        db = get_worker()
+        db.then(
+            db.read(get_changes, self._feed_seq, columns=self._poll_columns),
+            self._on_changes, on_error=self._on_poll_error, widget=self
+        )
+
+    def _on_changes(self, result):
+        self._polling = False
+        if self._busy():
+            return   # 正在整体刷新，刷新完会带回新的序号
+        seq, rows, deleted = result
+        self._feed_seq = seq
+        if rows is None:
+            self._reload()
+        elif rows or deleted:
+            with instrument.span(f"{type(self).__name__}.apply_changes"):
+                self._apply_changes(rows, deleted)
+
+    def _on_poll_error(self, e):
+        # 网络 / 数据库暂时不可用时不弹窗，下一轮再试
+        self._polling = False
+
+    def _busy(self):
+        return False
+
+
+# ----------------- 工具 -----------------
+def valid_date_ddmmyyyy(s: str) -> bool:
+    try:
+        datetime.strptime(s, "%d-%m-%Y")
+        return True
+    except ValueError:
+        return False
+
+
+def valid_date_yyyymmdd(s: str) -> bool:
+    try:
+        datetime.strptime(s, "%Y-%m-%d")
+        return True
+    except ValueError:
+        return False
+
+
+# 表格里同一天的行很多，格式化结果按字符串缓存
+@lru_cache(maxsize=4096)
+def weekday_cn_from_iso(iso_date: str) -> str:
+    try:
+        return WEEKDAY_CN[date.fromisoformat(iso_date).weekday()]
+    except (TypeError, ValueError):
+        return ""
+
+
+@lru_cache(maxsize=4096)
+def date_de_from_iso(iso_date: str) -> str:
+    try:
+        d = date.fromisoformat(iso_date)
+        return f"{d.day:02d}.{d.month:02d}.{d.year:04d}"
+    except (TypeError, ValueError):
+        return ""
+
+
+def normalize_services_text(s: str) -> str:
+    s = (s or "").replace("，", ";").replace(",", ";")
+    parts = [x.strip() for x in s.split(";") if x.strip()]
+    return ";".join(parts)
+
+
+@lru_cache(maxsize=4096)
+def services_str_to_display(s: str) -> str:
+    return ", ".join(parse_services(s or ""))
+
+
+# ----------------- 时间选择控件 -----------------
+class TimePicker(ttk.Frame):
+    def __init__(self, master, initial="00:00"):
+        super().__init__(master)
+        self.h = tk.StringVar()
+        self.m = tk.StringVar()
+
+        self.cb_h = ttk.Combobox(self, values=HOURS, width=3, state="readonly", textvariable=self.h)
+        self.cb_m = ttk.Combobox(self, values=MINS, width=3, state="readonly", textvariable=self.m)
+
+        self.cb_h.grid(row=0, column=0, padx=(0, 6))
+        ttk.Label(self, text=":").grid(row=0, column=1)
+        self.cb_m.grid(row=0, column=2, padx=(6, 0))
+
+        self.set_time(initial)
+
+    def set_enabled(self, enabled: bool):
+        state = "readonly" if enabled else "disabled"
+        self.cb_h.configure(state=state)
+        self.cb_m.configure(state=state)
+
+    def set_time(self, t: str):
+        try:
+            hh, mm = (t or "00:00").split(":")
+        except Exception:
+            hh, mm = "00", "00"
+        self.h.set(hh if hh in HOURS else "00")
+        self.m.set(mm if mm in MINS else "00")
+
+    def get_time(self) -> str:
+        return f"{self.h.get()}:{self.m.get()}"
+
+
+# ================= 主窗口 =================
+class TerminApp(_ChangePoller, tk.Tk):
+    def __init__(self, on_first_paint=None):
+        """
+        on_first_paint(error): 第一页数据画到屏幕上之后（主线程里）调用一次，启动时不急的事放在那之后做；
+        第一次查询就失败时也会调用，error 为那个异常
+        """
+        super().__init__()
+        self.title("Termin System")
+        self.geometry("1200x650")
+        self.minsize(1050, 580)
+
+        self.range_var = tk.StringVar(value="today")
+        self.status_var = tk.StringVar(value="all")
+        self.invoice_var = tk.StringVar(value="all")
+        self.name_search_var = tk.StringVar()   # ← 姓名 / 项目全文搜索
+        self.count_var = tk.StringVar()
+
+        # 分页状态：当前过滤条件、窗口最后一行的排序键、后面是否已取完，
+        # 窗口第一行之前那一行的排序键（None 表示窗口从第一条开始）和窗口之前的行数
+        self._query = {}
+        self._after = None
+        self._exhausted = True
+        self._head = None
+        self._skipped = 0
+        self._loading = False
+        self._total = 0
+        self._shown = 0
+        # 表格当前显示的内容（iid → 显示值 / 排序键），用于增量刷新
+        self._values = {}
+        self._keys = {}
+        self._versions = {}     # 删除时带上，别人刚改过的行不会被误删
+        self._on_first_paint = on_first_paint
+
+        # 所有数据库访问都走后台线程，结果通过 after() 回到主线程
+        self.db = get_worker()
+        self.db.attach(self)
+
+        self._style()
+        self._build_ui()
+        self.refresh()
+        self._start_polling()
+
+    def _style(self):
+        style = ttk.Style(self)
+        style.configure("Treeview", rowheight=30, font=("Segoe UI", 10))
+        style.configure("Treeview.Heading", font=("Segoe UI", 10, "bold"))
+
+    def export_csv(self):
+        from tkinter import filedialog
+
+        path = filedialog.asksaveasfilename(
+            title="导出为 CSV",
+            defaultextension=".csv",
+            filetypes=[("CSV 文件", "*.csv"), ("压缩 CSV 文件", "*.csv.gz")]
+        )
+
+        if not path:
+            return
+
+        ExportDialog(self, path)
+
+    def _build_ui(self):
+        top = ttk.Frame(self, padding=10)
+        top.pack(fill="x")
+
+        ttk.Label(top, text="范围").pack(side="left")
+        for t, v in [("今天", "today"), ("本月", "month"), ("全部", "all")]:
+            ttk.Radiobutton(top, text=t, value=v, variable=self.range_var,
+                            command=self.refresh).pack(side="left", padx=6)
+
+        ttk.Separator(top, orient="vertical").pack(side="left", fill="y", padx=12)
+
+        ttk.Label(top, text="状态").pack(side="left")
+        for t, v in [("全部", "all"), ("到达", "arrived"), ("未到", "scheduled")]:
+            ttk.Radiobutton(top, text=t, value=v, variable=self.status_var,
+                            command=self.refresh).pack(side="left", padx=6)
+
+        ttk.Separator(top, orient="vertical").pack(side="left", fill="y", padx=12)
+
+        ttk.Label(top, text="账单").pack(side="left")
+        for t, v in [("全部", "all"), ("已发送", "yes"), ("未发送", "no")]:
+            ttk.Radiobutton(top, text=t, value=v, variable=self.invoice_var,
+                            command=self.refresh).pack(side="left", padx=6)
+
+        ttk.Separator(top, orient="vertical").pack(side="left", fill="y", padx=12)
+
+        ttk.Label(top, text="搜索（姓名/项目）").pack(side="left")
+        search_entry = ttk.Entry(top, textvariable=self.name_search_var, width=22)
+        search_entry.pack(side="left", padx=8)
+        search_entry.bind("<Return>", lambda e: self.refresh())
+        ttk.Button(top, text="应用", command=self.refresh).pack(side="left")
+
+
+        # 表格
+        self.columns = (
+            "planned", "weekday", "date_de", "patient", "arrived",
+            "range", "services", "invoice", "edit", "delete"
+        )
+        table = ttk.Frame(self)
+        table.pack(fill="both", expand=True, padx=10, pady=8)
+
+        # Ctrl / Shift 点击多选，配合下面的批量按钮
+        self.tree = ttk.Treeview(table, columns=self.columns, show="headings", selectmode="extended")
+        self.vsb = ttk.Scrollbar(table, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_tree_scroll)
+        self.vsb.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+
+        headers = {
+            "planned": "预约时间",
+            "weekday": "星期",
+            "date_de": "日期",
+            "patient": "姓名",
+            "arrived": "到达",
+            "range": "到达-离开",
+            "services": "项目",
+            "invoice": "账单",
+            "edit": "",
+            "delete": ""
+        }
+        widths = {
+            "planned": 90, "weekday": 80, "date_de": 110, "patient": 140,
+            "arrived": 70, "range": 160, "services": 320,
+            "invoice": 70, "edit": 45, "delete": 45
+        }
+        for c in self.columns:
+            self.tree.heading(c, text=headers[c])
+            self.tree.column(c, width=widths[c], anchor="center")
+
+        self.tree.bind("<Button-1>", self.on_click)
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+
+        bottom = ttk.Frame(self, padding=10)
+        bottom.pack(fill="x")
+        ttk.Button(bottom, text="➕ 新建预约",
+                   command=lambda: NewTerminDialog(self)).pack(side="left")
+        ttk.Button(bottom, text="🗓 今日时间表",
+                   command=lambda: TodayTimelineDialog(self)).pack(side="left", padx=10)
+        ttk.Button(bottom, text="🗓 本周时间表",
+                   command=lambda: WeekTimelineDialog(self)).pack(side="left", padx=10)
+        ttk.Label(bottom, textvariable=self.count_var).pack(side="left", padx=10)
+        ttk.Button(
+            bottom,
+            text="📤 导出 CSV",
+            command=self.export_csv
+        ).pack(side="right")
+        self.bulk_delete_btn = ttk.Button(
+            bottom, text="🗑 删除所选", command=self.bulk_delete, state="disabled"
+        )
+        self.bulk_delete_btn.pack(side="right", padx=10)
+        self.bulk_invoice_btn = ttk.Button(
+            bottom, text="🧾 所选标记已发账单", command=self.bulk_mark_invoice, state="disabled"
+        )
+        self.bulk_invoice_btn.pack(side="right")
+
+    def refresh(self):
+        """
+        按当前过滤条件重新查询，并与表格里已有的行做 diff：
+        只插入 / 修改 / 删除有变化的行，滚动位置和选中状态保持不变
+        """
+        today = date.today().strftime("%Y-%m-%d")
+        df = dt = None
+        if self.range_var.get() == "today":
+            df = dt = today
+        elif self.range_var.get() == "month":
+            df = today[:7] + "-01"
+            dt = today[:7] + "-31"
+
+        status = None if self.status_var.get() == "all" else self.status_var.get()
+        invoice = None if self.invoice_var.get() == "all" else self.invoice_var.get()
+
+        name_kw = self.name_search_var.get().strip()
+
+        query = dict(
+            query=name_kw, date_from=df, date_to=dt, status=status, invoice_sent=invoice
+        )
+        same_query = query == self._query
+        # 条件没变时把当前窗口里的行一起刷新，否则从头取第一页
+        want = max(self._shown, PAGE_SIZE) if same_query else PAGE_SIZE
+        if not same_query:
+            self._head = None
+            self._skipped = 0
+
+        self._query = query
+        self._loading = True
+        self._refresh_start = time.perf_counter()
+        # 同一个 key：连续点击过滤条件时，只有最后一次查询的结果会被显示
+        self.db.then(
+            self.db.read(_fetch_table, query, want, self._head),
+            lambda res: self._on_refreshed(res, want, same_query),
+            on_error=self._db_error, widget=self, key="table"
+        )
+
+    def _on_refreshed(self, result, want, same_query):
+        self._feed_seq, self._total, rows = result
+        with instrument.span("ui.refresh.apply"):
+            self._apply_rows(rows)
+        if not same_query:
+            self.tree.yview_moveto(0)
+
+        self._shown = len(rows)
+        self._after = page_key(rows[-1]) if rows else None
+        self._exhausted = len(rows) < want
+        self._loading = False
+        self._update_count()
+        # 从点击到表格更新完的总时间（含后台查询和排队）
+        instrument.record_since("ui.refresh", self._refresh_start, rows=len(rows))
+
+        if self._on_first_paint is not None:
+            self.update_idletasks()   # 布局和重绘都是空闲任务，做完才算真正画出来
+            self._first_paint_done()
+
+    def _first_paint_done(self, error=None):
+        """调用一次 on_first_paint；回调把窗口关掉了（--profile-startup）时返回 False"""
+        if self._on_first_paint is None:
+            return True
+        callback, self._on_first_paint = self._on_first_paint, None
+        callback(error)
+        try:
+            return bool(self.winfo_exists())
+        except tk.TclError:
+            return False
+
+    def _db_error(self, e):
+        self._loading = False
+        # 第一次刷新失败也算启动结束：不然自动备份不会开始，--profile-startup 也会一直等
+        if not self._first_paint_done(e):
+            return
+        messagebox.showerror("数据库错误", str(e), parent=self)
+
+    def _apply_rows(self, rows):
+        new_ids = [r["id"] for r in rows]
+        keep = set(new_ids)
+
+        stale = [iid for iid in self.tree.get_children() if iid not in keep]
+        if stale:
+            self.tree.delete(*stale)
+            for iid in stale:
+                self._values.pop(iid, None)
+                self._keys.pop(iid, None)
+                self._versions.pop(iid, None)
+
+        # 已有的行相对顺序没变时，只需在对应位置插入新行
+        in_order = list(self.tree.get_children()) == [i for i in new_ids if i in self._values]
+
+        for idx, r in enumerate(rows):
+            iid = r["id"]
+            values = self._row_values(r)
+            if iid in self._values:
+                if self._values[iid] != values:
+                    self.tree.item(iid, values=values)
+                if not in_order:
+                    self.tree.move(iid, "", idx)
+            else:
+                self.tree.insert("", idx, iid=iid, values=values)
+            self._values[iid] = values
+            self._keys[iid] = page_key(r)
+            self._versions[iid] = r.get("version")
+
+    def _load_more(self):
+        if self._exhausted or self._loading:
+            return
+        self._loading = True
+        self.db.then(
+            self.db.read(_fetch_table, self._query, PAGE_SIZE, self._after, with_count=False),
+            self._on_more_loaded,
+            on_error=self._db_error, widget=self, key="table"
+        )
+
+    def _on_more_loaded(self, result):
+        _, _, rows = result
+        with instrument.span("ui.load_more.apply"):
+            for r in rows:
+                self._put_row(r, "end")
+            self._trim_head()
+
+        if rows:
+            self._after = page_key(rows[-1])
+        self._exhausted = len(rows) < PAGE_SIZE
+        self._loading = False
+        self._update_count()
+
+    def _load_previous(self):
+        """往回翻：取窗口第一行之前的 PAGE_SIZE 行（多取一行，用来知道再往前还有没有）"""
+        children = self.tree.get_children()
+        if self._head is None or self._loading or not children:
+            return
+        self._loading = True
+        self.db.then(
+            self.db.read(
+                _fetch_table, self._query, PAGE_SIZE + 1, with_count=False, before=self._keys[children[0]]
+            ),
+            self._on_previous_loaded,
+            on_error=self._db_error, widget=self, key="table"
+        )
+
+    def _on_previous_loaded(self, result):
+        _, _, rows = result
+        if len(rows) > PAGE_SIZE:
+            head, rows = page_key(rows[0]), rows[1:]
+        else:
+            head = None
+        with instrument.span("ui.load_previous.apply"):
+            top = self._top_item()
+            before = self._shown
+            for idx, r in enumerate(rows):
+                self._put_row(r, idx)
+            self._keep_top(top)   # 在上面插了行，让原来看着的行留在原处
+            added = self._shown - before
+            self._trim_tail()
+        self._head = head
+        self._skipped = 0 if head is None else max(0, self._skipped - added)
+        self._loading = False
+        self._update_count()
+
+    def _put_row(self, r, index):
+        iid = r["id"]
+        values = self._row_values(r)
+        if iid in self._values:
+            self.tree.item(iid, values=values)
+        else:
+            self.tree.insert("", index, iid=iid, values=values)
+            self._shown += 1
+        self._values[iid] = values
+        self._keys[iid] = page_key(r)
+        self._versions[iid] = r.get("version")
+
+    # ----- 窗口：表格里只留 MAX_ROWS 行，移走的行滚回来时重新取 -----
+    def _top_item(self):
+        children = self.tree.get_children()
+        if not children:
+            return None
+        return children[min(len(children) - 1, int(float(self.tree.yview()[0]) * len(children)))]
+
+    def _keep_top(self, top):
+        if top is not None and top in self._values:
+            self.tree.yview_moveto(self.tree.index(top) / len(self.tree.get_children()))
+
+    def _trim_head(self):
+        """往下加载之后：移走最上面超出的行（只移可见区域以上的）"""
+        children = self.tree.get_children()
+        top = self._top_item()
+        excess = min(len(children) - MAX_ROWS, self.tree.index(top) if top else 0)
+        if excess <= 0:
+            return
+        self._head = self._keys[children[excess - 1]]
+        self._skipped += excess
+        for iid in children[:excess]:
+            self._remove_item(iid)
+        self._keep_top(top)
+
+    def _trim_tail(self):
+        """往上加载之后：移走最下面超出的行（只移可见区域以下的）"""
+        children = self.tree.get_children()
+        below = len(children) - math.ceil(float(self.tree.yview()[1]) * len(children))
+        excess = min(len(children) - MAX_ROWS, below)
+        if excess <= 0:
+            return
+        for iid in children[-excess:]:
+            self._remove_item(iid)
+        self._after = self._keys[children[-excess - 1]]
+        self._exhausted = False
+
+    def _row_matches(self, r):
+        q = self._query
+        if q["date_from"] and r["date"] < q["date_from"]:
+            return False
+        if q["date_to"] and r["date"] > q["date_to"]:
+            return False
+        if q["status"] and r["status"] != q["status"]:
+            return False
+        if q["invoice_sent"] and r["invoice_sent"] != q["invoice_sent"]:
+            return False
+        return True
+
+    def patch_row(self, row):
+        if row is not None:
+            self.patch_rows([row])
+
+    def patch_rows(self, rows):
+        """
+        写操作之后直接用返回的整行更新表格，不重新查询
+        无法在本地判断时退回到 diff 刷新（批量操作也只刷新一次）
+        """
+        if not rows:
+            return
+        # 正在查询的结果可能不包含这次写入；全文搜索的匹配规则只有数据库知道
+        if self._loading or self._query.get("query"):
+            self.refresh()
+            return
+        for row in rows:
+            self._patch_one(row)
+        self._update_count()
+
+    def _patch_one(self, row):
+        iid = row["id"]
+        key = page_key(row)
+        loaded = iid in self._values
+        # 排在已加载窗口之前 / 之后的行，等滚动时再取
+        beyond = not self._exhausted and self._after is not None and key > self._after
+        before_head = self._head is not None and key <= self._head
+
+        if not self._row_matches(row) or beyond or before_head:
+            if loaded:
+                self._remove_item(iid)
+            if not self._row_matches(row) and loaded:
+                self._total -= 1
+            elif self._row_matches(row) and not loaded:
+                self._total += 1
+                if before_head:
+                    self._skipped += 1
+            return
+
+        values = self._row_values(row)
+        others = [c for c in self.tree.get_children() if c != iid]
+        idx = bisect.bisect_left([self._keys[c] for c in others], key)
+
+        if loaded:
+            if self._values[iid] != values:
+                self.tree.item(iid, values=values)
+            if self._keys[iid] != key:
+                self.tree.move(iid, "", idx)
+        else:
+            self.tree.insert("", idx, iid=iid, values=values)
+            self._shown += 1
+            self._total += 1
+        self._values[iid] = values
+        self._keys[iid] = key
+        self._versions[iid] = row.get("version")
+        if self._exhausted and (self._after is None or key > self._after):
+            self._after = key
+
+    def remove_row(self, tid):
+        self.remove_rows([tid])
+
+    def remove_rows(self, tids):
+        gone = [t for t in tids if t in self._values]
+        if not gone:
+            return
+        for tid in gone:
+            self._remove_item(tid)
+        self._total -= len(gone)
+        self._update_count()
+
+    def _remove_item(self, iid):
+        self.tree.delete(iid)
+        self._values.pop(iid, None)
+        self._keys.pop(iid, None)
+        self._versions.pop(iid, None)
+        self._shown -= 1
+
+    def _on_tree_scroll(self, first, last):
+        self.vsb.set(first, last)
+        if not self._exhausted and float(last) >= LOAD_MORE_AT:
+            self.after_idle(self._load_more)
+        elif self._head is not None and float(first) <= 1 - LOAD_MORE_AT:
+            self.after_idle(self._load_previous)
+
+    def _update_count(self):
+        if self._head is not None:
+            first = self._skipped + 1
+            self.count_var.set(f"共 {self._total} 条，显示第 {first}–{first + self._shown - 1} 条")
+        elif self._shown < self._total:
+            self.count_var.set(f"共 {self._total} 条，已显示 {self._shown} 条")
+        else:
+            self.count_var.set(f"共 {self._total} 条")
+
+    def _row_values(self, r):
+        return (
+            r["planned_time"],
+            weekday_cn_from_iso(r["date"]),
+            date_de_from_iso(r["date"]),
+            r["patient"],
+            "☑" if r["status"] == "arrived" else "☐",
+            f"{r['arrival_time']}–{r['leave_time']}" if r["arrival_time"] else "",
+            services_str_to_display(r.get("services", "")),
+            "☑" if r.get("invoice_sent") == "yes" else "☐",
+            "修改🖊",
+            "删除🗑"
+        )
+
+    def on_click(self, event):
+        if self.tree.identify("region", event.x, event.y) != "cell":
+            return
+        if event.state & 0x0005:   # Shift / Ctrl：只是在多选
+            return
+        row_id = self.tree.identify_row(event.y)
+        col = self.tree.identify_column(event.x)
+        if not row_id:
+            return
+
+        idx = int(col[1:]) - 1
+        if idx == self.columns.index("arrived"):
+            ArrivalDialog(self, row_id)
+        elif idx == self.columns.index("edit"):
+            EditDialog(self, row_id)
+        elif idx == self.columns.index("delete"):
+            if messagebox.askyesno("确认删除", "确定删除这条 Termin 吗？"):
+                self.db.then(
+                    self.db.write(delete_termin, row_id, expected_version=self._versions.get(row_id)),
+                    lambda _: self.remove_row(row_id),
+                    on_error=self._on_delete_error, widget=self
+                )
+
+    def _on_delete_error(self, e):
+        if isinstance(e, VersionConflict):
+            messagebox.showwarning("没有删除", f"{e}，表格已更新，请确认后再删除", parent=self)
+            if e.row is not None:
+                if e.row["id"] not in self._values:
+                    self.refresh()   # 疗程里的这一次被别人转成了真实行，id 变了
+                else:
+                    self.patch_row(e.row)
+            return
+        if isinstance(e, ArchiveError):
+            messagebox.showwarning("没有删除", str(e), parent=self)
+            return
+        self._db_error(e)
+
+    # ---------- 别的前台的修改 ----------
+    def _busy(self):
+        return self._loading
+
+    def _reload(self):
+        self.refresh()
+
+    def _apply_changes(self, rows, deleted):
+        self.patch_rows(rows)
+        self.remove_rows(deleted)
+
+    # ---------- 批量操作 ----------
+    def _on_select(self, _event=None):
+        state = "normal" if self.tree.selection() else "disabled"
+        self.bulk_invoice_btn.configure(state=state)
+        self.bulk_delete_btn.configure(state=state)
+
+    def _selected(self):
+        ids = list(self.tree.selection())
+        return ids, {i: self._versions.get(i) for i in ids}
+
+    def bulk_mark_invoice(self):
+        ids, versions = self._selected()
+        if not ids:
+            return
+        self.db.then(
+            self.db.write(bulk_update_termins, ids, invoice_sent="yes", expected_versions=versions),
+            lambda res: self._on_bulk_done(res, ids, self.patch_rows),
+            on_error=self._db_error, widget=self
+        )
+
+    def bulk_delete(self):
+        ids, versions = self._selected()
+        if not ids or not messagebox.askyesno("确认删除", f"确定删除所选的 {len(ids)} 条 Termin 吗？"):
+            return
+        self.db.then(
+            self.db.write(bulk_delete_termins, ids, expected_versions=versions),
+            lambda res: self._on_bulk_done(res, ids, lambda rows: self.remove_rows(ids)),
+            on_error=self._db_error, widget=self
+        )
+
+    def _on_bulk_done(self, result, ids, apply):
+        """全部成功时直接改表格；有被跳过的行（别人刚改过）就整体刷新一次，二者只做其一"""
+        ok, msg, rows = result
+        if not ok:
+            messagebox.showerror("错误", msg, parent=self)
+            return
+        if len(rows) == len(ids) and all(r["id"] in self._values for r in rows):
+            apply(rows)
+        else:
+            self.refresh()
+            messagebox.showwarning("部分未完成", msg, parent=self)
+
+# ----------------- 导出进度 -----------------
+class ExportDialog(tk.Toplevel):
+    """在后台线程导出 CSV，主线程只轮询进度，窗口不会卡住"""
+
+    POLL_MS = 100
+
+    def __init__(self, parent: TerminApp, path: str):
+        super().__init__(parent)
+        self.parent = parent
+        self.path = path
+        self.title("导出 CSV")
+        self.geometry("420x140")
+        self.resizable(False, False)
+        self.protocol("WM_DELETE_WINDOW", self.cancel)
+
+        frm = ttk.Frame(self, padding=14)
+        frm.pack(fill="both", expand=True)
+
+        self.msg_var = tk.StringVar(value="正在导出…")
+        ttk.Label(frm, textvariable=self.msg_var).pack(anchor="w")
+        self.bar = ttk.Progressbar(frm, mode="determinate", maximum=1)
+        self.bar.pack(fill="x", pady=10)
+        self.cancel_btn = ttk.Button(frm, text="取消", command=self.cancel)
+        self.cancel_btn.pack(side="right")
+
+        # 工作线程只写这几个字段，Tk 控件只在主线程里碰
+        self._cancel = threading.Event()
+        self._progress = (0, 0)
+        self._result = None
+
+        # 不是守护线程：关掉主窗口时 destroy() 会让它取消，删掉临时文件后进程才退出
+        threading.Thread(target=self._run, name="export").start()
+        self.after(self.POLL_MS, self._poll)
+
+    def _run(self):
+        try:
+            n = export_termins_to_csv(self.path, progress=self._on_progress, cancel=self._cancel)
+            self._result = ("ok", n)
+        except ExportCancelled:
+            self._result = ("cancelled", None)
+        except Exception as e:
+            self._result = ("error", str(e))
+        finally:
+            close_conn()
+
+    def _on_progress(self, done, total):
+        self._progress = (done, total)
+
+    def _poll(self):
+        done, total = self._progress
+        if total:
+            self.bar.configure(maximum=total, value=done)
+            self.msg_var.set(f"正在导出… {done} / {total}")
+
+        if self._result is None:
+            self.after(self.POLL_MS, self._poll)
+            return
+
+        kind, detail = self._result
+        self.destroy()
+        if kind == "ok":
+            messagebox.showinfo("导出成功", f"已成功导出 {detail} 条到：\n{self.path}")
+        elif kind == "error":
+            messagebox.showerror("导出失败", detail)
+
+    def cancel(self):
+        self._cancel.set()
+        self.cancel_btn.configure(state="disabled")
+        self.msg_var.set("正在取消…")
+
+    def destroy(self):
+        # 关掉主窗口时 Tk 会逐个 destroy 子窗口，导出还没完成就一起取消
+        self._cancel.set()
+        super().destroy()
+
+
+# ================= 时间表（保留模式绘制） =================
+# 画布分三层，各自打 tag：
+#   grid  时间轴 / 列背景等静态内容，只在打开或换周时创建一次
+#   appt  预约块，只在数据变化（换天 / 换周）时重建
+#   now   当前时间红线，一条线，由定时器移动
+# 窗口缩放只重新计算横坐标（coords），不删除、不重新查询
+HOUR_HEIGHT = 34
+RESIZE_DEBOUNCE_MS = 40
+NOW_TICK_MS = 30_000
+
+
+def _appt_span(r):
+    """返回 (开始分钟, 结束分钟, 显示用的 开始, 结束)；没有离开时间时按默认时长，时间解析不了时返回 None"""
+    span = appt_span(r)
+    if span is None:
+        return None
+    s, e = span
+    return s, e, min_to_hm(s), min_to_hm(e)
+
+
+class _TimelineDialog(_ChangePoller, tk.Toplevel):
+    top_pad = 20
+    min_width = 50
+
+    def __init__(self, parent, title, geometry):
+        super().__init__(parent)
+        self.title(title)
+        self.geometry(geometry)
+
+        self.canvas = tk.Canvas(self, bg="white", highlightthickness=0)
+        self.canvas.pack(fill="both", expand=True)
+
+        self.rows = []
+        self._period = None
+        self._layout = {}         # 图层 tag → [(item, 根据布局计算坐标的函数)]
+        self._geom = None
+        self._now_item = None
+        self._resize_job = None
+        self._tick_job = None
+
+        # 绑定 resize / 首次显示（去抖）
+        self.canvas.bind("<Configure>", self._on_configure)
+        self._poll_columns = TIMELINE_COLUMNS
+        self._tick()
+        self._start_polling()
+
+    # ---------- 子类实现 ----------
+    def period(self):
+        """当前时间表对应的日期范围 (date_from, date_to)"""
+        raise NotImplementedError
+
+    def geom(self, width):
+        raise NotImplementedError
+
+    def build_grid(self):
+        raise NotImplementedError
+
+    def build_appts(self, items):
+        raise NotImplementedError
+
+    def now_coords(self, g):
+        """当前时间红线坐标；不在显示范围内时返回 None"""
+        raise NotImplementedError
+
+    # ---------- 通用部分 ----------
+    def _add(self, item, layout=None):
+        if layout is not None:
+            layer = self.canvas.gettags(item)[0]
+            self._layout.setdefault(layer, []).append((item, layout))
+            self.canvas.coords(item, *layout(self._geom))
+        return item
+
+    def destroy(self):
+        for job in (self._resize_job, self._tick_job):
+            if job is not None:
+                self.after_cancel(job)
+        self._stop_polling()
+        super().destroy()
+
+    def load(self):
+        db = self.master.db
+        df, dt = self.period()
+        self._feed_seq = None   # 加载完成前不处理变更
+        db.then(
+            db.read(_fetch_timeline, df, dt),
+            self._on_loaded, widget=self, key=("timeline", str(self))
+        )
+
+    def _on_loaded(self, result):
+        self._feed_seq, self.rows = result
+        self._rebuild_appts()
+
+    def _busy(self):
+        return self._feed_seq is None
+
+    def _reload(self):
+        self.load()
+
+    def _apply_changes(self, rows, deleted):
+        """只把变化的行合并进 self.rows，再重画预约块这一层"""
+        df, dt = self._period
+        by_id = {r["id"]: r for r in self.rows}
+        for tid in deleted:
+            by_id.pop(tid, None)
+        for r in rows:
+            if df <= r["date"] <= dt:
+                by_id[r["id"]] = r
+            else:
+                by_id.pop(r["id"], None)   # 改到了别的日期
+        self.rows = list(by_id.values())
+        self._rebuild_appts()
+
+    def _on_configure(self, event=None):
+        if self._resize_job is not None:
+            self.after_cancel(self._resize_job)
+        self._resize_job = self.after(RESIZE_DEBOUNCE_MS, self._relayout)
+
+    def _relayout(self):
+        self._resize_job = None
+        width = self.canvas.winfo_width()
+        if width < self.min_width:  # 防止初始化时 width=1
+            return
+
+        self._geom = self.geom(width)
+        if not self._layout:
+            self._rebuild_all()
+            return
+        with instrument.span(f"{type(self).__name__}.relayout"):
+            for items in self._layout.values():
+                for item, layout in items:
+                    self.canvas.coords(item, *layout(self._geom))
+            self._move_now_line()
+
+    def _rebuild_all(self):
+        with instrument.span(f"{type(self).__name__}.redraw"):
+            self.canvas.delete("all")
+            self._layout = {}
+            self._now_item = None
+            self.build_grid()
+            self._rebuild_appts()
+
+    def _rebuild_appts(self):
+        if self._geom is None:
+            return
+        with instrument.span(f"{type(self).__name__}.redraw_appts"):
+            self.canvas.delete("appt")
+            self._layout.pop("appt", None)
+            # 时间只在数据变化时解析一次
+            self.build_appts([(r, span) for r in self.rows for span in [_appt_span(r)] if span])
+            self._move_now_line()
+
+    def _move_now_line(self):
+        coords = self.now_coords(self._geom) if self._geom else None
+        if coords is None:
+            self.canvas.delete("now")
+            self._now_item = None
+            return
+        if self._now_item is None:
+            self._now_item = self.canvas.create_line(*coords, fill="#d9534f", width=2, tags="now")
+        else:
+            self.canvas.coords(self._now_item, *coords)
+        self.canvas.tag_raise("now")
+
+    def _tick(self):
+        # 跨天 / 跨周时重新取数据并重画，否则只移动红线
+        period = self.period()
+        if period != self._period:
+            self._period = period
+            self.rows = []
+            if self._geom is not None:
+                self._rebuild_all()
+            self.load()
+        else:
+            self._move_now_line()
+        self._tick_job = self.after(NOW_TICK_MS, self._tick)
+
+    def _now_y(self):
+        now = datetime.now()
+        return self.top_pad + (now.hour * 60 + now.minute) / 60 * HOUR_HEIGHT
+
+    def _min_y(self, m):
+        return self.top_pad + m / 60 * HOUR_HEIGHT
+
+
+# ================= 本周时间表窗口 =================
+class WeekTimelineDialog(_TimelineDialog):
+    top_pad = 40
+    min_width = 100
+    axis_w = 80
+    col_gap = 6
+
+    def __init__(self, parent):
+        super().__init__(parent, "本周时间表", "1000x800")
+
+    def _monday(self):
+        today = date.today()
+        return today - timedelta(days=today.weekday())
+
+    def period(self):
+        monday = self._monday()
+        return monday.isoformat(), (monday + timedelta(days=6)).isoformat()
+
+    # ---------- 布局参数 ----------
+    def geom(self, width):
+        left = self.axis_w + 10
+        right = width - 20
+        col_w = (right - left - self.col_gap * 6) / 7
+        return {"left": left, "right": right, "col_w": col_w}
+
+    def _col_x(self, g, i):
+        return g["left"] + i * (g["col_w"] + self.col_gap)
+
+    def build_grid(self):
+        c = self.canvas
+        monday = date.fromisoformat(self._period[0])
+        bottom = self.top_pad + 24 * HOUR_HEIGHT
+
+        # ---------- 星期标题 ----------
+        for i in range(7):
+            d = monday + timedelta(days=i)
+            label = f"{WEEKDAY_CN[d.weekday()]}\n{d.strftime('%m-%d')}"
+            self._add(
+                c.create_text(
+                    0, 0, text=label, font=("Segoe UI", 10, "bold"),
+                    fill="#333", justify="center", tags="grid"
+                ),
+                lambda g, i=i: (self._col_x(g, i) + g["col_w"] / 2, 16)
+            )
+
+        # ---------- 每日列背景 + 竖线 ----------
+        for i in range(7):
+            # 淡背景（可选，增强列感）
+            self._add(
+                c.create_rectangle(0, 0, 0, 0, fill="#fafafa", outline="", tags="grid"),
+                lambda g, i=i: (self._col_x(g, i), self.top_pad,
+                                self._col_x(g, i) + g["col_w"], bottom)
+            )
+            # 竖分隔线
+            self._add(
+                c.create_line(0, 0, 0, 0, fill="#ddd", tags="grid"),
+                lambda g, i=i: (self._col_x(g, i), self.top_pad, self._col_x(g, i), bottom)
+            )
+
+        # 最右侧边界线
+        self._add(
+            c.create_line(0, 0, 0, 0, fill="#ddd", tags="grid"),
+            lambda g: (g["right"], self.top_pad, g["right"], bottom)
+        )
+
+        # ---------- 时间轴 ----------
+        for h in range(24):
+            y = self.top_pad + h * HOUR_HEIGHT
+            c.create_text(
+                self.axis_w - 6, y, text=f"{h:02d}:00", anchor="e",
+                font=("Segoe UI", 9), fill="#555", tags="grid"
+            )
+            self._add(
+                c.create_line(0, 0, 0, 0, fill="#eee", tags="grid"),
+                lambda g, y=y: (g["left"], y, g["right"], y)
+            )
+
+    # ---------- 预约块 ----------
+    def build_appts(self, items):
+        c = self.canvas
+        monday_num = date.fromisoformat(self._period[0]).toordinal() - EPOCH_ORDINAL
+        pad_x = 6
+        pad_y = 6
+        line_h = 16
+
+        for r, (s, e, start, end) in items:
+            day_idx = r["day_num"] - monday_num
+            if not (0 <= day_idx <= 6):
+                continue
+            y1, y2 = self._min_y(s), self._min_y(e)
+
+            self._add(
+                c.create_rectangle(0, 0, 0, 0, fill="#cce5ff", outline="#4a90e2", tags="appt"),
+                lambda g, i=day_idx, y1=y1, y2=y2: (
+                    self._col_x(g, i), y1, self._col_x(g, i) + g["col_w"], y2
+                )
+            )
+            # 姓名（主信息）
+            self._add(
+                c.create_text(
+                    0, 0, text=r["patient"], anchor="nw",
+                    font=("Segoe UI", 9, "bold"), fill="#000", tags="appt"
+                ),
+                lambda g, i=day_idx, y=y1 + pad_y: (self._col_x(g, i) + pad_x, y)
+            )
+            # 时间（次信息）
+            self._add(
+                c.create_text(
+                    0, 0, text=f"{start}–{end}", anchor="nw",
+                    font=("Segoe UI", 9), fill="#333", tags="appt"
+                ),
+                lambda g, i=day_idx, y=y1 + pad_y + line_h: (self._col_x(g, i) + pad_x, y)
+            )
+
+    # ---------- 今日红线（仅当在本周） ----------
+    def now_coords(self, g):
+        day_idx = (date.today() - date.fromisoformat(self._period[0])).days
+        if not (0 <= day_idx <= 6):
+            return None
+        x1 = self._col_x(g, day_idx)
+        y = self._now_y()
+        return x1, y, x1 + g["col_w"], y
+
+
+# ================= 今日时间表窗口 =================
+class TodayTimelineDialog(_TimelineDialog):
+    axis_w = 90
+
+    def __init__(self, parent):
+        super().__init__(parent, "今日时间表", "700x800")
+
+    def period(self):
+        today = date.today().isoformat()
+        return today, today
+
+    def geom(self, width):
+        return {"left": self.axis_w + 20, "right": width - 20}
+
+    def build_grid(self):
+        c = self.canvas
+        # ===== 时间轴 =====
+        for h in range(24):
+            y = self.top_pad + h * HOUR_HEIGHT
+            c.create_text(
+                self.axis_w, y, text=f"{h:02d}:00", anchor="e",
+                fill="#333", font=("Segoe UI", 10, "bold"), tags="grid"
+            )
+            self._add(
+                c.create_line(0, 0, 0, 0, fill="#eee", tags="grid"),
+                lambda g, y=y: (g["left"], y, g["right"], y)
+            )
+
+    # ===== 预约块 =====
+    def build_appts(self, items):
+        c = self.canvas
+        for r, (s, e, start, end) in items:
+            y1, y2 = self._min_y(s), self._min_y(e)
+            self._add(
+                c.create_rectangle(0, 0, 0, 0, fill="#cce5ff", outline="#4a90e2", tags="appt"),
+                lambda g, y1=y1, y2=y2: (g["left"], y1, g["right"] - 20, y2)
+            )
+            self._add(
+                c.create_text(
+                    0, 0, text=f"{r['patient']}  {start}-{end}", anchor="w",
+                    font=("Segoe UI", 10), tags="appt"
+                ),
+                lambda g, y=(y1 + y2) / 2: (g["left"] + 8, y)
+            )
+
+    # ===== 当前时间红线 =====
+    def now_coords(self, g):
+        y = self._now_y()
+        return g["left"], y, g["right"] - 20, y
+
+
+# ----------------- 新建预约 -----------------
+class NewTerminDialog(tk.Toplevel):
+    def __init__(self, parent: TerminApp):
+        super().__init__(parent)
+        self.parent = parent
+        self.title("新建预约")
+        self.geometry("420x330")
+        self.resizable(False, False)
+
+        frm = ttk.Frame(self, padding=14)
+        frm.pack(fill="both", expand=True)
+
+        ttk.Label(frm, text="姓名").grid(row=0, column=0, sticky="w", pady=8)
+        self.patient = ttk.Entry(frm, width=30)
+        self.patient.grid(row=0, column=1, sticky="ew", pady=8)
+
+        ttk.Label(frm, text="日期（DD-MM-YYYY）").grid(row=1, column=0, sticky="w", pady=8)
+        self.date = ttk.Entry(frm, width=30)
+        self.date.grid(row=1, column=1, sticky="ew", pady=8)
+
+        ttk.Label(frm, text="预约时间").grid(row=2, column=0, sticky="w", pady=8)
+        self.time_picker = TimePicker(frm, initial="00:00")
+        self.time_picker.grid(row=2, column=1, sticky="w", pady=8)
+
+        ttk.Label(frm, text="重复").grid(row=3, column=0, sticky="w", pady=8)
+        repeat = ttk.Frame(frm)
+        repeat.grid(row=3, column=1, sticky="w", pady=8)
+        self.repeat_var = tk.StringVar(value="不重复")
+        ttk.Combobox(
+            repeat, values=list(REPEAT_CHOICES), width=8, state="readonly",
+            textvariable=self.repeat_var
+        ).pack(side="left")
+        ttk.Label(repeat, text="共").pack(side="left", padx=(12, 4))
+        self.repeat_count = ttk.Spinbox(repeat, from_=1, to=52, width=4)
+        self.repeat_count.set("10")
+        self.repeat_count.pack(side="left")
+        ttk.Label(repeat, text="次").pack(side="left", padx=(4, 0))
+
+        frm.columnconfigure(1, weight=1)
+
+        btns = ttk.Frame(self, padding=10)
+        btns.pack(fill="x")
+        ttk.Button(btns, text="取消", command=self.destroy).pack(side="right")
+        self.save_btn = ttk.Button(btns, text="创建", command=self.save)
+        self.save_btn.pack(side="right", padx=10)
+
+    def save(self):
+        name = self.patient.get().strip()
+        d = self.date.get().strip()
+
+        if not name:
+            messagebox.showerror("错误", "姓名不能为空")
+            return
+
+        if not valid_date_ddmmyyyy(d):
+            messagebox.showerror("错误", "日期格式错误，应为 DD-MM-YYYY（例如 25-12-2025）")
+            return
+
+        self._args = (name, d, self.time_picker.get_time())
+
+        weeks = REPEAT_CHOICES[self.repeat_var.get()]
+        if weeks:
+            try:
+                count = int(self.repeat_count.get())
+            except ValueError:
+                messagebox.showerror("错误", "次数必须是数字", parent=self)
+                return
+            self.save_btn.configure(state="disabled")
+            db = self.parent.db
+            db.then(
+                db.write(add_series, *self._args, interval_weeks=weeks, count=count),
+                self._on_series_saved, on_error=self._on_error, widget=self
+            )
+            return
+
+        self._submit()
+
+    def _on_series_saved(self, result):
+        ok, msg, _ = result
+        if not ok:
+            self._on_error(msg)
+            return
+        self.parent.refresh()
+        self.destroy()
+
+    def _submit(self, allow_conflict=False):
+        self.save_btn.configure(state="disabled")
+        db = self.parent.db
+        db.then(
+            db.write(add_termin, *self._args, return_row=True, allow_conflict=allow_conflict),
+            self._on_saved, on_error=self._on_error, widget=self
+        )
+
+    def _on_saved(self, result):
+        ok, msg, row = result
+        if not ok:
+            if msg.startswith(CONFLICT_MSG) and messagebox.askyesno("时间冲突", f"{msg}\n\n仍然创建？", parent=self):
+                self._submit(allow_conflict=True)
+                return
+            self._on_error(msg)
+            return
+
+        self.parent.patch_row(row)
+        self.destroy()
+
+    def _on_error(self, e):
+        self.save_btn.configure(state="normal")
+        messagebox.showerror("错误", str(e), parent=self)
+
+
+def _show_version_conflict(dialog, msg, row):
+    """保存时发现别人在这期间改过 / 删掉了这条预约：提示、用最新内容更新表格、关掉对话框"""
+    messagebox.showwarning("未保存", f"{msg}\n\n你的修改没有保存。", parent=dialog)
+    parent = dialog.parent
+    if row is None or row["id"] != dialog.tid:
+        parent.remove_row(dialog.tid)
+    parent.patch_row(row)
+    dialog.destroy()
+
+
+# ----------------- 到达登记（复选框驱动） -----------------
+class ArrivalDialog(tk.Toplevel):
+    def __init__(self, parent: TerminApp, tid: str):
+        super().__init__(parent)
+        self.parent = parent
+        self.tid = tid
+        self.title("到达登记")
+        self.geometry("460x300")
+        self.resizable(False, False)
+
+        self.original = None
+        db = parent.db
+        db.then(
+            db.read(get_termin, tid),
+            self._on_loaded, on_error=self._on_error, widget=self
+        )
+
+    def _on_loaded(self, row):
+        if row is None:
+            messagebox.showerror("错误", "该 Termin 已不存在", parent=self.parent)
+            self.destroy()
+            self.parent.refresh()
+            return
+        self.original = row
+        self._build()
+
+    def _on_error(self, e):
+        messagebox.showerror("错误", str(e), parent=self)
+        if self.original is None:
+            self.destroy()
+        else:
+            self.save_btn.configure(state="normal")
+
+    def _build(self):
+        frm = ttk.Frame(self, padding=14)
+        frm.pack(fill="both", expand=True)
+
+        self.arrived_var = tk.BooleanVar(value=(self.original["status"] == "arrived"))
+
+        ttk.Checkbutton(
+            frm, text="是否到达",
+            variable=self.arrived_var,
+            command=self._toggle
+        ).grid(row=0, column=0, columnspan=2, sticky="w", pady=10)
+
+        ttk.Label(frm, text="到达时间").grid(row=1, column=0, sticky="w", pady=8)
+        self.arrival_picker = TimePicker(frm, initial=self.original.get("arrival_time") or "00:00")
+        self.arrival_picker.grid(row=1, column=1, sticky="w", pady=8)
+
+        ttk.Label(frm, text="离开时间").grid(row=2, column=0, sticky="w", pady=8)
+        self.leave_picker = TimePicker(frm, initial=self.original.get("leave_time") or "00:00")
+        self.leave_picker.grid(row=2, column=1, sticky="w", pady=8)
+
+        ttk.Label(frm, text="项目（; 分隔）").grid(row=3, column=0, sticky="w", pady=8)
+        self.services = ttk.Entry(frm, width=40)
+        self.services.insert(0, self.original.get("services", ""))
+        self.services.grid(row=3, column=1, sticky="ew", pady=8)
+
+        frm.columnconfigure(1, weight=1)
+
+        btns = ttk.Frame(self, padding=10)
+        btns.pack(fill="x")
+        ttk.Button(btns, text="取消", command=self.destroy).pack(side="right")
+        self.save_btn = ttk.Button(btns, text="保存", command=self.save)
+        self.save_btn.pack(side="right", padx=10)
+
+        self._toggle()
+
+    def _toggle(self):
+        on = self.arrived_var.get()
+        self.arrival_picker.set_enabled(on)
+        self.leave_picker.set_enabled(on)
+        self.services.configure(state="normal" if on else "disabled")
+
+    def save(self):
+        if self.arrived_var.get():
+            services_norm = normalize_services_text(self.services.get())
+            updates = dict(
+                arrival_time=self.arrival_picker.get_time(),
+                leave_time=self.leave_picker.get_time(),
+                services=[x for x in services_norm.split(";") if x]
+            )
+        else:
+            updates = dict(arrival_time="", leave_time="", services=[])
+
+        self.save_btn.configure(state="disabled")
+        db = self.parent.db
+        db.then(
+            db.write(update_termin, self.tid, **updates, return_row=True,
+                     expected_version=self.original.get("version")),
+            self._on_saved, on_error=self._on_error, widget=self
+        )
+
+    def _on_saved(self, result):
+        ok, msg, row = result
+        if not ok:
+            if msg.startswith(VERSION_CONFLICT_MSG):
+                _show_version_conflict(self, msg, row)
+            else:
+                self._on_error(msg)   # 例如已归档：行还在，不能从表格里拿掉
+            return
+        if row is not None and row["id"] != self.tid:
+            self.parent.remove_row(self.tid)   # 疗程里的这一次已转成真实行，换了 id
+        self.parent.patch_row(row)
+        self.destroy()
+
+
+# ----------------- 编辑 Termin（全字段 + 默认不改） -----------------
+class EditDialog(tk.Toplevel):
+    def __init__(self, parent: TerminApp, tid: str):
+        super().__init__(parent)
+        self.parent = parent
+        self.tid = tid
+        self.title("编辑 Termin")
+        self.geometry("520x440")
+        self.resizable(False, False)
+
+        self.original = None
+        db = parent.db
+        db.then(
+            db.read(get_termin, tid),
+            self._on_loaded, on_error=self._on_error, widget=self
+        )
+
+    def _on_loaded(self, row):
+        if row is None:
+            messagebox.showerror("错误", "该 Termin 已不存在", parent=self.parent)
+            self.destroy()
+            self.parent.refresh()
+            return
+        self.original = row
+        self._build()
+
+    def _on_error(self, e):
+        messagebox.showerror("错误", str(e), parent=self)
+        if self.original is None:
+            self.destroy()
+        else:
+            self.save_btn.configure(state="normal")
+
+    def _build(self):
+        frm = ttk.Frame(self, padding=14)
+        frm.pack(fill="both", expand=True)
+
+        ttk.Label(frm, text="姓名").grid(row=0, column=0, sticky="w", pady=8)
+        self.patient = ttk.Entry(frm, width=40)
+        self.patient.insert(0, self.original.get("patient", ""))
+        self.patient.grid(row=0, column=1, sticky="ew", pady=8)
+
+        ttk.Label(frm, text="日期（YYYY-MM-DD）").grid(row=1, column=0, sticky="w", pady=8)
+        self.date = ttk.Entry(frm, width=40)
+        self.date.insert(0, self.original.get("date", ""))
+        self.date.grid(row=1, column=1, sticky="ew", pady=8)
+
+        ttk.Label(frm, text="预约时间").grid(row=2, column=0, sticky="w", pady=8)
+        self.planned_picker = TimePicker(frm, initial=self.original.get("planned_time") or "00:00")
+        self.planned_picker.grid(row=2, column=1, sticky="w", pady=8)
+
+        ttk.Label(frm, text="到达时间").grid(row=3, column=0, sticky="w", pady=8)
+        self.arrival_picker = TimePicker(frm, initial=self.original.get("arrival_time") or "00:00")
+        self.arrival_picker.grid(row=3, column=1, sticky="w", pady=8)
+
+        ttk.Label(frm, text="离开时间").grid(row=4, column=0, sticky="w", pady=8)
+        self.leave_picker = TimePicker(frm, initial=self.original.get("leave_time") or "00:00")
+        self.leave_picker.grid(row=4, column=1, sticky="w", pady=8)
+
+        ttk.Label(frm, text="项目（; 分隔）").grid(row=5, column=0, sticky="w", pady=8)
+        self.services = ttk.Entry(frm, width=40)
+        self.services.insert(0, self.original.get("services", ""))
+        self.services.grid(row=5, column=1, sticky="ew", pady=8)
+
+        self.invoice_var = tk.BooleanVar(value=(self.original.get("invoice_sent", "no") == "yes"))
+        ttk.Checkbutton(frm, text="已发送账单", variable=self.invoice_var)\
+            .grid(row=6, column=1, sticky="w", pady=10)
+
+        frm.columnconfigure(1, weight=1)
+
+        btns = ttk.Frame(self, padding=10)
+        btns.pack(fill="x")
+        ttk.Button(btns, text="取消", command=self.destroy).pack(side="right")
+        self.save_btn = ttk.Button(btns, text="保存修改", command=self.save)
+        self.save_btn.pack(side="right", padx=10)
+
+    def save(self):
+        updates = {}
+
+        new_patient = self.patient.get().strip()
+        if new_patient and new_patient != self.original.get("patient", ""):
+            updates["patient"] = new_patient
+
+        new_date = self.date.get().strip()
+        if new_date != self.original.get("date", ""):
+            if not valid_date_yyyymmdd(new_date):
+                messagebox.showerror("错误", "日期必须是 YYYY-MM-DD（例如 2025-12-25）")
+                return
+            updates["date"] = new_date
+
+        new_planned = self.planned_picker.get_time()
+        if new_planned != self.original.get("planned_time", ""):
+            updates["planned_time"] = new_planned
+
+        # 到达/离开：允许单独修改；若原来为空，只有当你不是 00:00 才写入
+        new_arrival = self.arrival_picker.get_time()
+        old_arrival = self.original.get("arrival_time", "")
+        if old_arrival:
+            if new_arrival != old_arrival:
+                updates["arrival_time"] = new_arrival
+        else:
+            if new_arrival != "00:00":
+                updates["arrival_time"] = new_arrival
+
+        new_leave = self.leave_picker.get_time()
+        old_leave = self.original.get("leave_time", "")
+        if old_leave:
+            if new_leave != old_leave:
+                updates["leave_time"] = new_leave
+        else:
+            if new_leave != "00:00":
+                updates["leave_time"] = new_leave
+
+        new_services_norm = normalize_services_text(self.services.get())
+        if new_services_norm != self.original.get("services", ""):
+            updates["services"] = [x for x in new_services_norm.split(";") if x]
+
+        new_invoice = "yes" if self.invoice_var.get() else "no"
+        if new_invoice != self.original.get("invoice_sent", "no"):
+            updates["invoice_sent"] = new_invoice
+
+        if not updates:
+            self.destroy()
+            return
+
+        self._updates = updates
+        self._submit()
+
+    def _submit(self, allow_conflict=False):
+        self.save_btn.configure(state="disabled")
+        db = self.parent.db
+        db.then(
+            db.write(
+                update_termin, self.tid, **self._updates, return_row=True,
+                allow_conflict=allow_conflict, expected_version=self.original.get("version")
+            ),
+            self._on_saved, on_error=self._on_error, widget=self
+        )
+
+    def _on_saved(self, result):
+        ok, msg, row = result
+        if not ok:
+            if msg.startswith(VERSION_CONFLICT_MSG):
+                _show_version_conflict(self, msg, row)
+                return
+            if msg.startswith(CONFLICT_MSG) and messagebox.askyesno("时间冲突", f"{msg}\n\n仍然保存？", parent=self):
+                self._submit(allow_conflict=True)
+                return
+            self._on_error(msg)
+            return
+        if row is not None and row["id"] != self.tid:
+            self.parent.remove_row(self.tid)
+        self.parent.patch_row(row)
+        self.destroy()
+
+
+if __name__ == "__main__":
+    TerminApp().mainloop()
@@ -0,0 +1,101 @@
+"""
+后台数据访问：一个写线程 + 若干读线程
+
+Tk 只能在主线程里操作，所以工作线程不碰任何控件：
+结果放进队列，由主线程用 after() 轮询取出，再调用回调
+"""
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+READERS = 2
+POLL_MS = 15
+
+
+class DbWorker:
+    def __init__(self, readers=READERS):
+        # 所有写操作串行执行，读操作可以并发
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+        self._done = queue.SimpleQueue()
+        self._latest = {}
+        self._lock = threading.Lock()
+        self._root = None
+
+    def attach(self, root):
+        """绑定到 Tk 主窗口，开始在主线程里分发回调"""
+        self._root = root
+        root.after(POLL_MS, self._drain)
+
+    def read(self, fn, *args, **kwargs):
+        return self._readers.submit(fn, *args, **kwargs)
+
+    def write(self, fn, *args, **kwargs):
+        return self._writer.submit(fn, *args, **kwargs)
+
+    def then(self, future, on_done, on_error=None, widget=None, key=None):
+        """
+        future 完成后在主线程调用 on_done(result) / on_error(exc)
+        widget: 回调前该控件已被销毁则丢弃结果
+        key:    同一个 key 只保留最后一次请求的结果，之前的视为过期直接丢弃
+        """
+        seq = None
+        if key is not None:
+            with self._lock:
+                seq = self._latest.get(key, 0) + 1
+                self._latest[key] = seq
+
+        def _queue(f):
+            self._done.put((f, on_done, on_error, widget, key, seq))
+
+        future.add_done_callback(_queue)
+        return future
+
+    def is_current(self, key, future_seq):
+        with self._lock:
+            return self._latest.get(key) == future_seq
+
+    def _drain(self):
+        from tkinter import TclError   # 只有绑定了 Tk 窗口才会走到这里；服务器用 DbWorker 时不加载 tkinter
+
+        try:
+            while True:
+                try:
+                    f, on_done, on_error, widget, key, seq = self._done.get_nowait()
+                except queue.Empty:
+                    break
+                if key is not None and not self.is_current(key, seq):
+                    continue
+                if widget is not None and not widget.winfo_exists():
+                    continue
+                try:
+                    try:
+                        result = f.result()
+                    except Exception as e:
+                        if on_error is None:
+                            raise
+                        on_error(e)
+                    else:
+                        on_done(result)
+                except Exception:
+                    self._root.report_callback_exception(*sys.exc_info())
+        finally:
+            try:
+                self._root.after(POLL_MS, self._drain)
+            except TclError:
+                pass   # 主窗口已经关闭
+
+    def shutdown(self, wait=True):
+        self._writer.shutdown(wait=wait)
+        self._readers.shutdown(wait=wait)
+
+
+_worker = None
+
+
+def get_worker():
+    global _worker
+    if _worker is None:
+        _worker = DbWorker()
+    return _worker
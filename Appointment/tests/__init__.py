@@ -0,0 +1,18 @@
+"""
+单元测试（在 Appointment 目录下运行）：
+
+    python -m unittest discover -s tests -t .
+
+和 benchmarks 一样，导入本包时把 APPDATA 指向一个新的临时目录，并把 src 加进 sys.path，
+所以测试只会在临时库上跑，不会碰真实的 termins.db
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+os.environ["APPDATA"] = tempfile.mkdtemp(prefix="termin_test_")
+os.environ.pop("TERMIN_SERVER", None)
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
@@ -0,0 +1,65 @@
+"""
+归档年份对读接口透明：get_termins / search_termins / count_termins 都要把归档文件里的行算进去
+"""
+import sqlite3
+import unittest
+
+import archive
+import db
+from termin import (
+    add_termin, count_by_service, count_service, count_termins, get_termins, get_termins_by_service, search_termins,
+    update_termin
+)
+
+YEAR = 2019
+RANGE = dict(date_from=f"{YEAR}-01-01", date_to=f"{YEAR + 1}-12-31")
+
+
+class ArchiveReadTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        for patient, day in [("Müller Hans", f"02-03-{YEAR}"), ("张三丰", f"03-03-{YEAR}"), ("Müller Eva", f"04-03-{YEAR + 1}")]:
+            ok, msg, row = add_termin(patient, day, "09:00", return_row=True, allow_conflict=True)
+            update_termin(row["id"], arrival_time="09:05", invoice_sent="yes", services="Massage")
+        archive.archive_year(YEAR)
+
+    @classmethod
+    def tearDownClass(cls):
+        with db.get_conn() as conn:
+            conn.execute(f"DELETE FROM termins WHERE date LIKE '{YEAR + 1}-%'")
+        archive.close_conns()
+        archive.archive_file(YEAR).unlink()
+
+    def test_rows_come_from_both_files(self):
+        self.assertEqual([r["patient"] for r in get_termins(**RANGE)], ["Müller Hans", "张三丰", "Müller Eva"])
+        self.assertEqual(count_termins(**RANGE), 3)
+
+    def test_search_includes_archive(self):
+        for query, expected in [("muller", ["Müller Hans", "Müller Eva"]), ("三", ["张三丰"]), ("hans", ["Müller Hans"])]:
+            with self.subTest(query):
+                self.assertEqual([r["patient"] for r in search_termins(query, **RANGE)], expected)
+                self.assertEqual(count_termins(query, **RANGE), len(expected))
+
+    def test_search_pages_across_files(self):
+        first = search_termins("massage", limit=1, **RANGE)
+        rest = search_termins("massage", after=(first[0]["date"], first[0]["planned_time"], first[0]["id"]), **RANGE)
+        self.assertEqual([r["patient"] for r in first + rest], ["Müller Hans", "张三丰", "Müller Eva"])
+
+    def test_service_stats_include_archive(self):
+        self.assertEqual(count_by_service(RANGE["date_from"], RANGE["date_to"]), [("Massage", 3)])
+        self.assertEqual(count_service("massage", RANGE["date_from"], RANGE["date_to"]), 3)
+        rows = get_termins_by_service("Massage", RANGE["date_from"], RANGE["date_to"], limit=2, offset=1)
+        self.assertEqual([r["patient"] for r in rows], ["张三丰", "Müller Eva"])
+
+    def test_old_archive_files_are_upgraded(self):
+        # 以前建的归档文件没有全文索引和项目关联表：第一次打开时补上
+        archive.close_conns()
+        conn = sqlite3.connect(archive.archive_file(YEAR))
+        conn.executescript("DROP TABLE termins_fts; DROP TABLE termin_services; DROP TABLE services;")
+        conn.close()
+        self.assertEqual(count_termins("hans", **RANGE), 1)
+        self.assertEqual(count_service("Massage", RANGE["date_from"], RANGE["date_to"]), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+"""
+backup.py：备份期间的写入不会让备份从头再来；恢复备份不关别的线程的连接
+"""
+import sqlite3
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+import backup
+import db
+from db import get_conn, write_conn
+
+DAY = "2038-03-01"
+
+
+def _add(termin_id):
+    with write_conn() as conn:
+        conn.execute("INSERT INTO termins (id, date, patient) VALUES (?, ?, 'Backup')", (termin_id, DAY))
+
+
+def _ids(conn):
+    return {r[0] for r in conn.execute("SELECT id FROM termins WHERE date = ?", (DAY,))}
+
+
+class BackupTest(unittest.TestCase):
+    def tearDown(self):
+        with write_conn() as conn:
+            conn.execute("DELETE FROM termins WHERE date = ?", (DAY,))
+
+    def test_writes_during_backup_do_not_restart_it(self):
+        _add("bk-before")
+        remaining = []
+
+        def progress(status, left, total):
+            remaining.append(left)
+            _add(f"bk-during-{len(remaining)}")   # 每一步之间都有别的连接写入
+
+        old = backup.PAGES_PER_STEP
+        backup.PAGES_PER_STEP = 1
+        self.addCleanup(setattr, backup, "PAGES_PER_STEP", old)
+        with tempfile.TemporaryDirectory() as tmp:
+            dest = sqlite3.connect(Path(tmp) / "copy.db")
+            try:
+                backup._copy_snapshot(dest, progress)
+                copied = _ids(dest)
+            finally:
+                dest.close()
+        self.assertGreater(len(remaining), 1)
+        self.assertEqual(remaining, sorted(remaining, reverse=True), "备份没有从头再来")
+        self.assertEqual(copied, {"bk-before"}, "备份的是开始那一刻的快照")
+
+    def test_restore_keeps_other_threads_connections(self):
+        _add("bk-kept")
+        path = backup.create_backup(keep=100)
+        _add("bk-dropped")
+
+        reader = {}
+        loaded, restored, checked = threading.Event(), threading.Event(), threading.Event()
+
+        def read():
+            reader["conn"] = get_conn()
+            reader["before"] = _ids(reader["conn"])
+            reader["version"] = db.data_version()
+            loaded.set()
+            restored.wait()
+            reader["after"] = _ids(get_conn())
+            reader["same_conn"] = get_conn() is reader["conn"]
+            reader["changed"] = db.data_version() != reader["version"]
+            checked.set()
+            db.close_conn()
+
+        threading.Thread(target=read).start()
+        loaded.wait()
+        try:
+            backup.restore_backup(path)
+        finally:
+            restored.set()
+            path.unlink()
+        checked.wait()
+
+        self.assertEqual(reader["before"], {"bk-kept", "bk-dropped"})
+        self.assertEqual(reader["after"], {"bk-kept"})
+        self.assertTrue(reader["same_conn"])
+        self.assertTrue(reader["changed"])
+        self.assertEqual(_ids(get_conn()), {"bk-kept"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+"""
+db.data_version()：别的连接提交过写入后，不管是哪个线程先发现，返回值都要变
+"""
+import sqlite3
+import threading
+import unittest
+
+import db
+
+
+def _in_new_thread(fn):
+    out = []
+    t = threading.Thread(target=lambda: out.append(fn()))
+    t.start()
+    t.join()
+    return out[0]
+
+
+class DataVersionTest(unittest.TestCase):
+    def test_same_thread_sees_foreign_write(self):
+        before = db.data_version()
+        self.assertEqual(db.data_version(), before)
+        with sqlite3.connect(db.DB_FILE) as other:
+            other.execute("INSERT INTO termin_changes (termin_id) VALUES ('dv-same')")
+        self.assertNotEqual(db.data_version(), before)
+
+    def test_first_call_on_new_thread_counts_as_changed(self):
+        before = db.data_version()
+        with sqlite3.connect(db.DB_FILE) as other:
+            other.execute("INSERT INTO termin_changes (termin_id) VALUES ('dv-new')")
+        # 新线程是第一个发现这次写入的：它没有旧值可比，也不能报告“没变”
+        self.assertNotEqual(_in_new_thread(db.data_version), before)
+
+    def test_own_writes_do_not_change_it(self):
+        with db.write_conn() as conn:
+            conn.execute("INSERT INTO termin_changes (termin_id) VALUES ('dv-own')")
+        before = db.data_version()
+        with db.write_conn() as conn:
+            conn.execute("INSERT INTO termin_changes (termin_id) VALUES ('dv-own')")
+        self.assertEqual(db.data_version(), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
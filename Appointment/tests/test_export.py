@@ -0,0 +1,62 @@
+"""
+termin.export_termins_to_csv：写完才出现在目标路径上，取消时不留半截文件、也不动原来的文件
+"""
+import csv
+import gzip
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from db import write_conn
+from termin import ExportCancelled, export_termins_to_csv
+
+DAY = "2039-05-01"
+ROWS = 50
+
+
+class ExportTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with write_conn() as conn:
+            conn.executemany(
+                "INSERT INTO termins (id, date, planned_time, patient) VALUES (?, ?, '09:00', ?)",
+                [(f"exp-{i:03d}", DAY, f"P{i}") for i in range(ROWS)]
+            )
+
+    @classmethod
+    def tearDownClass(cls):
+        with write_conn() as conn:
+            conn.execute("DELETE FROM termins WHERE date = ?", (DAY,))
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+
+    def _export(self, name, **kwargs):
+        return export_termins_to_csv(self.dir / name, date_from=DAY, date_to=DAY, batch_size=10, **kwargs)
+
+    def test_file_appears_only_when_complete(self):
+        for name, opener in (("out.csv", open), ("out.csv.gz", gzip.open)):
+            with self.subTest(name):
+                seen = []
+                n = self._export(name, progress=lambda done, total: seen.append((self.dir / name).exists()))
+                self.assertEqual(n, ROWS)
+                self.assertEqual(set(seen), {False})
+                with opener(self.dir / name, "rt", encoding="utf-8-sig", newline="") as f:
+                    self.assertEqual(len(list(csv.reader(f))), ROWS + 1)
+        self.assertEqual(sorted(p.name for p in self.dir.iterdir()), ["out.csv", "out.csv.gz"])
+
+    def test_cancel_keeps_old_file(self):
+        target = self.dir / "out.csv"
+        target.write_text("old", encoding="utf-8")
+        cancel = threading.Event()
+        with self.assertRaises(ExportCancelled):
+            self._export("out.csv", progress=lambda done, total: cancel.set(), cancel=cancel)
+        self.assertEqual(target.read_text(encoding="utf-8"), "old")
+        self.assertEqual([p.name for p in self.dir.iterdir()], ["out.csv"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+importer.import_csv：延后建索引和保留索引（--keep-indexes）两种方式导入的结果要一样，
+包括按项目统计、全文搜索和变更日志
+"""
+import csv
+import tempfile
+import unittest
+from pathlib import Path
+
+from db import get_conn
+from importer import import_csv
+from termin import change_seq, changes_since, count_by_service, count_service, search_termins
+
+ROWS = [
+    ("imp-1", "Müller Hans", "Massage;KG"),
+    ("imp-2", "张三丰", "Massage"),
+    ("imp-3", "李四", ""),
+]
+
+
+class ImportTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def tearDown(self):
+        with get_conn() as conn:
+            conn.execute("DELETE FROM termins WHERE id LIKE 'imp-%'")
+
+    def _import(self, day, rows=ROWS, **kwargs):
+        path = Path(self.tmp.name) / "import.csv"
+        with path.open("w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(["id", "date", "planned_time", "patient", "services", "invoice_sent"])
+            for i, (tid, patient, services) in enumerate(rows):
+                w.writerow([tid, day, f"{9 + i}:00", patient, services, "no"])
+        return import_csv(path, **kwargs)
+
+    def _check(self, day):
+        self.assertEqual(count_by_service(day, day), [("Massage", 2), ("KG", 1)])
+        self.assertEqual(count_service("KG", day, day), 1)
+        self.assertEqual([r["patient"] for r in search_termins("ller", date_from=day, date_to=day)], ["Müller Hans"])
+
+    def test_deferred_indexes(self):
+        before = change_seq()
+        self.assertEqual(self._import("01.04.2032"), (3, 0))
+        self._check("2032-04-01")
+        self.assertIsNone(changes_since(before)[1])   # 整体刷新
+
+    def test_keep_indexes(self):
+        before = change_seq()
+        self.assertEqual(self._import("02.04.2032", defer_indexes=False), (3, 0))
+        self._check("2032-04-02")
+        self.assertIsNone(changes_since(before)[1])
+
+    def test_reimport_replaces_services(self):
+        self._import("03.04.2032")
+        self._import("03.04.2032", [ROWS[0], ("imp-2", "张三丰", "KG"), ROWS[2]], defer_indexes=False)
+        self.assertEqual(count_by_service("2032-04-03", "2032-04-03"), [("KG", 2), ("Massage", 1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+get_termins / count_termins 能生成的每种查询都要走预期的索引（db.MIGRATIONS 第 2、4 步），
+不能全表扫描，也不能为 ORDER BY 另外排序
+"""
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+import db
+import termin
+
+DAY = dict(date_from="2026-01-01", date_to="2026-01-01")
+MONTH = dict(date_from="2026-01-01", date_to="2026-01-31")
+AFTER = ("2026-01-01", "09:00", "x")
+
+# 过滤条件 → 预期的索引
+SHAPES = {
+    "all": ({}, "idx_termins_date_time_id"),
+    "day": (DAY, "idx_termins_date_time_id"),
+    "from": (dict(date_from="2026-01-01"), "idx_termins_date_time_id"),
+    "to": (dict(date_to="2026-01-31"), "idx_termins_date_time_id"),
+    "after": (dict(after=AFTER), "idx_termins_date_time_id"),
+    "range_after": (dict(MONTH, after=AFTER), "idx_termins_date_time_id"),
+    "status": (dict(status="scheduled"), "idx_termins_status_date_id"),
+    "status_range": (dict(MONTH, status="arrived"), "idx_termins_status_date_id"),
+    "status_after": (dict(status="scheduled", after=AFTER), "idx_termins_status_date_id"),
+    "invoice": (dict(invoice_sent="no"), "idx_termins_invoice_date_id"),
+    "invoice_range": (dict(MONTH, invoice_sent="no"), "idx_termins_invoice_date_id"),
+    "status_invoice": (dict(MONTH, status="arrived", invoice_sent="no"), None),   # 两个都行
+    "day_patient": (dict(DAY, patient="Mü"), "idx_termins_date_time_id"),
+}
+
+
+class QueryPlanTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.conn = sqlite3.connect(Path(cls.tmp.name) / "plans.db")
+        cls.conn.row_factory = sqlite3.Row
+        db.migrate(cls.conn)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.conn.close()
+        cls.tmp.cleanup()
+
+    def plan(self, sql, params):
+        return [r["detail"] for r in self.conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+    def assertUsesIndex(self, plan, index, covering=False):
+        self.assertNotIn("SCAN termins", plan, "全表扫描")
+        text = "\n".join(plan)
+        self.assertNotIn("TEMP B-TREE", text, "另外排序")
+        using = "USING COVERING INDEX" if covering else "USING (COVERING )?INDEX"
+        self.assertRegex(text, rf"termins {using} {index or 'idx_termins_'}")
+
+    def test_rows(self):
+        limit_sql, limit_params = termin._limit_sql(200)
+        for name, (kw, index) in SHAPES.items():
+            with self.subTest(name):
+                where, params = termin._filter_sql(**kw)
+                sql = (
+                    f"SELECT {termin._select_list(None)} FROM termins WHERE 1=1{where}"
+                    f" ORDER BY date, planned_time, id{limit_sql}"
+                )
+                self.assertUsesIndex(self.plan(sql, params + limit_params), index)
+
+    def test_counts(self):
+        for name, (kw, index) in SHAPES.items():
+            if not kw or kw.get("patient") or name == "status_invoice":
+                continue   # 没有条件时数主键；姓名是子串匹配，只能在日期索引挑出来的行上比较
+            with self.subTest(name):
+                where, params = termin._filter_sql(**kw)
+                plan = self.plan(f"SELECT COUNT(*) FROM termins WHERE 1=1{where}", params)
+                self.assertUsesIndex(plan, index, covering=True)
+
+    def test_conflict_lookup(self):
+        # schedule.find_conflicts / 按天缓存：按 date 取一天的预约
+        plan = self.plan("SELECT id FROM termins WHERE date BETWEEN ? AND ?", ["2026-01-01", "2026-01-07"])
+        self.assertUsesIndex(plan, "idx_termins_date_time_id", covering=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+
+from db import get_conn
+from termin import add_series, add_termin, count_termins, delete_series, search_termins, update_termin
+
+
+class SearchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        for patient, services in [("张三丰", "推拿;针灸"), ("Müller Hans", "Massage;KG"), ("李四", "")]:
+            ok, msg, row = add_termin(patient, "01-03-2031", "09:00", return_row=True, allow_conflict=True)
+            update_termin(row["id"], services=services)
+
+    @classmethod
+    def tearDownClass(cls):
+        with get_conn() as conn:
+            conn.execute("DELETE FROM termins WHERE date = '2031-03-01'")
+
+    def assertFinds(self, query, *patients):
+        rows = search_termins(query, date_from="2031-03-01", date_to="2031-03-01")
+        self.assertEqual(sorted(r["patient"] for r in rows), sorted(patients), query)
+        self.assertEqual(count_termins(query, date_from="2031-03-01", date_to="2031-03-01"), len(patients))
+
+    def test_cjk_substrings(self):
+        # 单个汉字、两个汉字走逐行比较，三个字以上走 trigram 索引
+        self.assertFinds("三", "张三丰")
+        self.assertFinds("三丰", "张三丰")
+        self.assertFinds("张三丰", "张三丰")
+        self.assertFinds("针灸", "张三丰")
+        self.assertFinds("李", "李四")
+
+    def test_latin_infix_and_case(self):
+        self.assertFinds("ller", "Müller Hans")
+        self.assertFinds("MÜLLER", "Müller Hans")
+        self.assertFinds("massage", "Müller Hans")
+        self.assertFinds("kg", "Müller Hans")
+
+    def test_diacritics_are_ignored(self):
+        # 索引和查询词都先去掉变音符号，和 SQLite 版本无关
+        self.assertFinds("muller", "Müller Hans")
+        self.assertFinds("mull", "Müller Hans")
+        self.assertFinds("MULLER hans", "Müller Hans")
+        self.assertFinds("mü", "Müller Hans")
+        self.assertFinds("mu", "Müller Hans")
+
+    def test_series_occurrences_are_found(self):
+        # 疗程里现算的预约和 get_termins 一样出现在搜索结果和计数里
+        ok, msg, sid = add_series("Schröder Eva", "03-03-2031", "11:00", count=2, services=["KG"])
+        self.addCleanup(delete_series, sid)
+        rows = search_termins("schroder", date_from="2031-03-01", date_to="2031-03-31")
+        self.assertEqual([r["date"] for r in rows], ["2031-03-03", "2031-03-10"])
+        self.assertEqual(count_termins("eva kg", date_from="2031-03-01", date_to="2031-03-31"), 2)
+
+    def test_terms_are_anded(self):
+        self.assertFinds("三 推拿", "张三丰")
+        self.assertFinds("三 Massage")
+
+    def test_special_characters_are_literal(self):
+        self.assertFinds("%")
+        self.assertFinds('"ller')
+        self.assertFinds("_")
+
+    def test_index_follows_updates(self):
+        tid = search_termins("李四", date_from="2031-03-01")[0]["id"]
+        update_termin(tid, patient="王五")
+        self.assertFinds("李四")
+        self.assertFinds("王五", "王五")
+        update_termin(tid, patient="李四")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+"""
+server.py / client.py 的连接处理：坏的请求头回 400，连接断开时写请求不重发
+"""
+import asyncio
+import socket
+import threading
+import unittest
+
+import client
+from server import TerminServer
+
+
+def _serve(handle):
+    """在后台线程的事件循环里监听随机端口，返回 (端口, 停止函数)"""
+    ready = threading.Event()
+    state = {}
+
+    async def run():
+        srv = await asyncio.start_server(handle, "127.0.0.1", 0)
+        state["port"] = srv.sockets[0].getsockname()[1]
+        state["loop"] = asyncio.get_running_loop()
+        state["stop"] = asyncio.Event()
+        ready.set()
+        async with srv:
+            await state["stop"].wait()
+
+    t = threading.Thread(target=asyncio.run, args=(run(),), daemon=True)
+    t.start()
+    ready.wait()
+
+    def stop():
+        state["loop"].call_soon_threadsafe(state["stop"].set)
+        t.join()
+    return state["port"], stop
+
+
+class BadRequestTest(unittest.TestCase):
+    def setUp(self):
+        self.server = TerminServer(readers=1)
+        self.port, stop = _serve(self.server.handle)
+        self.addCleanup(self.server.db.shutdown)
+        self.addCleanup(stop)
+
+    def _raw(self, head):
+        with socket.create_connection(("127.0.0.1", self.port), timeout=5) as s:
+            s.sendall(head)
+            return s.makefile("rb").readline()
+
+    def test_bad_content_length(self):
+        for value in (b"abc", b"-5", b"1.5"):
+            with self.subTest(value):
+                status = self._raw(b"POST /termins HTTP/1.1\r\nContent-Length: " + value + b"\r\n\r\n")
+                self.assertTrue(status.startswith(b"HTTP/1.1 400"), status)
+
+
+class RetryTest(unittest.TestCase):
+    """服务器读完请求就断开、不回应：读请求重发一次，写请求只发一次"""
+
+    def setUp(self):
+        self.requests = []
+
+        async def drop(reader, writer):
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.requests.append(line.split()[0].decode())
+                while await reader.readline() not in (b"\r\n", b""):
+                    pass
+                writer.close()
+                break
+
+        port, stop = _serve(drop)
+        self.addCleanup(stop)
+        self.remote = client.RemoteTermin(f"127.0.0.1:{port}", timeout=5)
+
+    def test_get_is_retried(self):
+        with self.assertRaises(ConnectionError):
+            self.remote.get_termin("x")
+        self.assertEqual(self.requests, ["GET", "GET"])
+
+    def test_write_is_not_resent(self):
+        for method in ("POST", "PATCH", "DELETE"):
+            with self.subTest(method):
+                self.requests.clear()
+                with self.assertRaises(ConnectionError):
+                    self.remote._send(method, "/termins/x")
+                self.assertEqual(self.requests, [method])
+
+
+if __name__ == "__main__":
+    unittest.main()
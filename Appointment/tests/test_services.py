@@ -0,0 +1,87 @@
+"""
+按项目统计（termin_services 关联表）要随每一种写入同步：
+界面上的增删改、批量修改，以及批量导入（中途失败时已经提交的批次也要算进去）
+"""
+import csv
+import tempfile
+import unittest
+from pathlib import Path
+
+from db import get_conn, rebuild_services_index
+from importer import import_csv
+from termin import (
+    add_termin, bulk_update_termins, count_by_service, count_service, delete_termin, get_termins_by_service,
+    update_termin
+)
+
+DAY = "2033-05-02"
+
+
+class ServiceCountTest(unittest.TestCase):
+    def tearDown(self):
+        with get_conn() as conn:
+            conn.execute("DELETE FROM termins WHERE date BETWEEN '2033-05-01' AND '2033-05-31'")
+
+    def _add(self, patient, services, day="02-05-2033"):
+        ok, msg, row = add_termin(patient, day, "10:00", return_row=True, allow_conflict=True)
+        self.assertTrue(ok, msg)
+        if services is not None:
+            ok, msg = update_termin(row["id"], services=services)[:2]
+            self.assertTrue(ok, msg)
+        return row["id"]
+
+    def counts(self, day=DAY):
+        return count_by_service(day, day)
+
+    def test_update_and_delete(self):
+        a = self._add("甲", ["Massage", "KG"])   # 界面传的是 list[str]
+        b = self._add("乙", "Massage")
+        self.assertEqual(self.counts(), [("Massage", 2), ("KG", 1)])
+        self.assertEqual(count_service("kg", DAY, DAY), 1)   # 项目名不区分大小写
+        self.assertEqual([r["id"] for r in get_termins_by_service("KG", DAY, DAY)], [a])
+
+        update_termin(a, services=["KG"])
+        self.assertEqual(self.counts(), [("KG", 1), ("Massage", 1)])
+        delete_termin(b)
+        self.assertEqual(self.counts(), [("KG", 1)])
+
+    def test_date_change_moves_the_count(self):
+        a = self._add("甲", "KG")
+        update_termin(a, date="2033-05-03")
+        self.assertEqual(self.counts(), [])
+        self.assertEqual(self.counts("2033-05-03"), [("KG", 1)])
+
+    def test_bulk_update(self):
+        ids = [self._add(p, None) for p in ("甲", "乙", "丙")]
+        bulk_update_termins(ids[:2], services="Massage;Fango")
+        self.assertEqual(self.counts(), [("Fango", 2), ("Massage", 2)])
+
+    def test_failed_import_keeps_committed_batches(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "import.csv"
+            with path.open("w", newline="", encoding="utf-8") as f:
+                w = csv.writer(f)
+                w.writerow(["id", "date", "planned_time", "patient", "services"])
+                w.writerows([f"svc-{i}", DAY, "11:00", f"P{i}", "KG"] for i in range(4))
+
+            def stop(done, bad):
+                if done == 2:
+                    raise KeyboardInterrupt
+
+            for defer in (True, False):
+                with self.subTest(defer_indexes=defer):
+                    with self.assertRaises(KeyboardInterrupt):
+                        import_csv(path, batch_size=2, defer_indexes=defer, progress=stop)
+                    self.assertEqual(self.counts(), [("KG", 2)])
+                    self.tearDown()
+
+    def test_rebuild_matches_incremental(self):
+        self._add("甲", ["Massage", "KG"])
+        self._add("乙", "KG")
+        before = self.counts()
+        rebuild_services_index()
+        self.assertEqual(self.counts(), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+"""
+启动路径的无界面检查（bench_startup.py 要真的开窗口，这里不用显示器也能跑）：
+第一页画出来之前不加载备份、CSV 等用不到的模块；第一次查询失败时也要通知 on_first_paint
+"""
+import json
+import os
+import subprocess
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from tests import SRC_DIR
+
+# 第一页画出来之前不该加载的模块（备份在画出来之后才开始，其它只有导出 / 导入 / 命令行才用）
+LATE_MODULES = ("backup", "csv", "gzip", "uuid", "argparse", "tkinter.filedialog", "logging.handlers", "client")
+
+
+def _loaded_after(import_stmt):
+    code = f"import json, sys\n{import_stmt}\nprint(json.dumps(sorted(sys.modules)))"
+    env = dict(os.environ)
+    env.pop("TERMIN_SERVER", None)
+    env.pop("TERMIN_PERF", None)
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=SRC_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return set(json.loads(out))
+
+
+class StartupImportsTest(unittest.TestCase):
+    def test_main_gui_defers_everything(self):
+        loaded = _loaded_after("import main_gui")
+        for name in ("ui", "worker", "tkinter", "db", "termin") + LATE_MODULES:
+            self.assertNotIn(name, loaded)
+
+    def test_ui_import_skips_rare_modules(self):
+        loaded = _loaded_after("import ui")
+        for name in LATE_MODULES:
+            self.assertNotIn(name, loaded)
+
+
+class FirstPaintOnErrorTest(unittest.TestCase):
+    def setUp(self):
+        import ui
+        self.ui = ui
+        self.calls = []
+        self.alive = True
+        app = SimpleNamespace(_loading=True, _on_first_paint=self.calls.append)
+        app._first_paint_done = lambda error=None: ui.TerminApp._first_paint_done(app, error)
+        app.winfo_exists = lambda: self.alive
+        self.app = app
+
+    def test_error_fires_callback_once(self):
+        err = RuntimeError("database is locked")
+        with mock.patch.object(self.ui.messagebox, "showerror") as showerror:
+            self.ui.TerminApp._db_error(self.app, err)
+            self.ui.TerminApp._db_error(self.app, err)
+        self.assertEqual(self.calls, [err])
+        self.assertEqual(showerror.call_count, 2)
+        self.assertFalse(self.app._loading)
+
+    def test_no_dialog_when_callback_closed_window(self):
+        self.alive = False   # --profile-startup 在回调里关掉了窗口
+        with mock.patch.object(self.ui.messagebox, "showerror") as showerror:
+            self.ui.TerminApp._db_error(self.app, RuntimeError("x"))
+        self.assertEqual(len(self.calls), 1)
+        showerror.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+"""
+主表格的滚动窗口（ui.TerminApp）：表格里最多只留 MAX_ROWS 行，往下 / 往上滚动时按 keyset 取相邻的页，
+移走离可见区域最远的那一头；用一个假的 Treeview 在没有显示器的环境里跑
+"""
+import csv
+import tempfile
+import unittest
+from pathlib import Path
+
+import ui
+from db import get_conn
+from importer import import_csv
+from termin import get_termins
+
+DAY_FROM, DAY_TO = "2036-01-01", "2036-12-31"
+ROWS = 2600
+VISIBLE = 20
+
+
+class FakeTree:
+    """只实现 TerminApp 用到的 Treeview 方法；yview 按 VISIBLE 行高的视口计算"""
+
+    def __init__(self):
+        self.order = []
+        self.first = 0
+
+    def get_children(self):
+        return tuple(self.order)
+
+    def insert(self, parent, index, iid, values):
+        self.order.insert(len(self.order) if index == "end" else index, iid)
+
+    def item(self, iid, values=None):
+        pass
+
+    def delete(self, *iids):
+        gone = set(iids)
+        self.order = [i for i in self.order if i not in gone]
+
+    def move(self, iid, parent, index):
+        self.order.remove(iid)
+        self.order.insert(index, iid)
+
+    def index(self, iid):
+        return self.order.index(iid)
+
+    def yview(self):
+        n = max(len(self.order), 1)
+        return self.first / n, min(self.first + VISIBLE, n) / n
+
+    def yview_moveto(self, fraction):
+        self.first = int(fraction * len(self.order) + 0.5)
+
+    def visible(self):
+        return self.order[self.first:self.first + VISIBLE]
+
+
+class SyncWorker:
+    def read(self, fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    def then(self, result, on_done, on_error=None, widget=None, key=None):
+        on_done(result)
+
+
+class TableWindowTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "rows.csv"
+            with path.open("w", newline="", encoding="utf-8") as f:
+                w = csv.writer(f)
+                w.writerow(["id", "date", "planned_time", "patient"])
+                w.writerows(
+                    [f"win-{i:05d}", f"2036-{1 + i // 250:02d}-{1 + i % 250 // 10:02d}", f"{8 + i % 10}:00", f"P{i}"]
+                    for i in range(ROWS)
+                )
+            import_csv(path)
+        cls.all_ids = [r["id"] for r in get_termins(DAY_FROM, DAY_TO, columns=("id",))]
+
+    @classmethod
+    def tearDownClass(cls):
+        with get_conn() as conn:
+            conn.execute("DELETE FROM termins WHERE id LIKE 'win-%'")
+
+    def setUp(self):
+        app = object.__new__(ui.TerminApp)   # 不建窗口，只用分页逻辑
+        app.tree = FakeTree()
+        app.db = SyncWorker()
+        app.count_var = type("Var", (), {"set": lambda self, v: setattr(self, "value", v)})()
+        app._values, app._keys, app._versions = {}, {}, {}
+        app._query = dict(query="", date_from=DAY_FROM, date_to=DAY_TO, status=None, invoice_sent=None)
+        app._head, app._skipped, app._shown = None, 0, 0
+        app._on_first_paint = None
+        app._refresh_start = 0
+        app._on_refreshed(ui._fetch_table(app._query, ui.PAGE_SIZE), ui.PAGE_SIZE, True)
+        self.app = app
+
+    def assertWindow(self):
+        app, order = self.app, self.app.tree.order
+        self.assertLessEqual(len(order), ui.MAX_ROWS)
+        start = self.all_ids.index(order[0])
+        self.assertEqual(order, self.all_ids[start:start + len(order)], "窗口里的行要连续")
+        self.assertEqual(app._skipped, start)
+        self.assertEqual(app._head is None, start == 0)
+        self.assertEqual(set(app._values), set(order))
+
+    def test_scroll_down_and_back_up(self):
+        app, tree = self.app, self.app.tree
+        while not app._exhausted:
+            tree.first = len(tree.order) - VISIBLE   # 滚到底
+            seen = tree.visible()
+            app._load_more()
+            self.assertEqual(tree.visible(), seen, "加载之后看着的行不动")
+            self.assertWindow()
+        self.assertEqual(tree.order[-1], self.all_ids[-1])
+        self.assertEqual(app._total, ROWS)
+        self.assertIn(f"显示第 {ROWS - ui.MAX_ROWS + 1}–{ROWS} 条", app.count_var.value)
+
+        while app._head is not None:
+            tree.first = 0   # 滚到顶
+            seen = tree.visible()
+            app._load_previous()
+            self.assertEqual(tree.visible(), seen)
+            self.assertWindow()
+        self.assertEqual(tree.order[0], self.all_ids[0])
+        self.assertFalse(app._exhausted)
+
+    def test_refresh_keeps_the_window(self):
+        app, tree = self.app, self.app.tree
+        for _ in range(8):
+            tree.first = len(tree.order) - VISIBLE
+            app._load_more()
+        window = list(tree.order)
+        self.assertIsNotNone(app._head)
+        app._loading = True
+        app._on_refreshed(ui._fetch_table(app._query, len(window), app._head), len(window), True)
+        self.assertEqual(tree.order, window)
+        self.assertWindow()
+
+
+if __name__ == "__main__":
+    unittest.main()